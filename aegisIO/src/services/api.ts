@@ -21,6 +21,21 @@ export interface WalletHealthRequest {
   wallet_address: string;
 }
 
+export interface CollectionStatsBatchRequest {
+  collection_ids: string[];
+  blockchain?: string;
+}
+
+export interface WalletHealthBatchRequest {
+  wallet_addresses: string[];
+  blockchain?: string;
+}
+
+export interface BatchResponse {
+  results?: Record<string, unknown>;
+  error?: string;
+}
+
 export interface NFTValuationRequest {
   token_id: string;
   collection_id: string;
@@ -55,6 +70,14 @@ class APIService {
     return this.makeRequest('/get-wallet-health', request);
   }
 
+  async getCollectionStatsBatch(request: CollectionStatsBatchRequest): Promise<BatchResponse> {
+    return this.makeRequest<BatchResponse>('/get-collection-stats/batch', request);
+  }
+
+  async getWalletHealthBatch(request: WalletHealthBatchRequest): Promise<BatchResponse> {
+    return this.makeRequest<BatchResponse>('/get-wallet-health/batch', request);
+  }
+
   async getNFTValuation(request: NFTValuationRequest) {
     return this.makeRequest('/get-nft-valuation', request);
   }
@@ -0,0 +1,94 @@
+"""Offline accuracy/latency benchmark for the local smart_query intent router.
+
+Usage (from backend/):
+    python benchmarks/bench_intent_router.py [--queries FILE ...] [--json OUT]
+
+Reports how many labelled queries the router answers locally (coverage),
+how often those local answers match the label (precision), overall
+accuracy with LLM deferrals counted as misses, and routing latency.
+
+By default it reports two sets separately: intent_queries.jsonl, the
+queries the rules were written against, and intent_queries_holdout.jsonl,
+which was labelled without tuning the rules on it. Only the held-out
+numbers estimate how the router does on real traffic; don't edit RULES to
+fix held-out mistakes without moving those queries to the dev set.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_router import IntentRouter  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_QUERIES = [
+    os.path.join(BENCH_DIR, "intent_queries.jsonl"),
+    os.path.join(BENCH_DIR, "intent_queries_holdout.jsonl")
+]
+SAMPLE_WALLETS = ["0x1111111111111111111111111111111111111111", "0x2222222222222222222222222222222222222222"]
+SAMPLE_COLLECTIONS = ["0xbc4ca0eda7647a8ab7c2061c2e118a18a936f13d"]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(queries_path, repeat=200):
+    with open(queries_path) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+
+    router = IntentRouter()
+
+    routed = correct = 0
+    mistakes = []
+    latencies_us = []
+    for row in rows:
+        decision = router.route(row["query"], SAMPLE_WALLETS, SAMPLE_COLLECTIONS)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            router.classify(row["query"], SAMPLE_WALLETS)
+        latencies_us.append((time.perf_counter() - started) / repeat * 1e6)
+
+        if decision is None:
+            continue
+        routed += 1
+        if decision["action"] == row["action"]:
+            correct += 1
+        else:
+            mistakes.append({"query": row["query"], "expected": row["action"], "got": decision["action"]})
+
+    return {
+        "queries": len(rows),
+        "threshold": router.threshold,
+        "coverage": round(routed / len(rows), 4),
+        "precision": round(correct / routed, 4) if routed else 0.0,
+        "accuracy": round(correct / len(rows), 4),
+        "latency_us": {
+            "p50": round(percentile(latencies_us, 50), 2),
+            "p95": round(percentile(latencies_us, 95), 2),
+            "max": round(max(latencies_us), 2)
+        },
+        "mistakes": mistakes
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", nargs="+", default=DEFAULT_QUERIES, help="labelled JSONL files, reported separately")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    report = {os.path.basename(path): run(path) for path in args.queries}
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Throughput/latency benchmark for the FastAPI backend against local upstream stand-ins.
+
+Usage (from backend/):
+    python benchmarks/load_test.py [--concurrency 1,10,50] [--requests 200]
+                                   [--latency-ms 80] [--llm-latency-ms 400] [--error-rate 0.0]
+                                   [--routes smart-query,market-insights] [--compare OLD.json]
+
+Starts the mock BitsCrunch and Gradient servers from ``mock_upstreams.py``
+and the app itself with uvicorn, pointed at the mocks. Each route is driven
+at each concurrency level against a freshly started app, so no scenario
+inherits another's response or answer caches, and RPS, p50/p95/p99
+latency, error count and upstream calls per request are recorded. The
+app's SQLite files go to a temporary directory. The report is written to
+``benchmarks/results/<timestamp>-<commit>.json``; ``--compare`` prints the
+p95 and RPS change against an earlier report.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+WALLETS = [f"0x{index:040x}" for index in range(1, 6)]
+COLLECTIONS = [f"0x{index:040x}" for index in range(100, 105)]
+
+# name -> (method, path, json body)
+ROUTES = {
+    "query": ("POST", "/query", {"query": "How is this collection doing?", "collection_id": COLLECTIONS[0]}),
+    "smart-query": ("POST", "/smart-query", {"query": "how are my wallets doing?", "user_wallets": WALLETS, "user_collections": COLLECTIONS}),
+    "smart-query-llm": ("POST", "/smart-query", {"query": "anything I should know today?", "user_wallets": WALLETS, "user_collections": COLLECTIONS}),
+    "advanced-collection-analysis": ("POST", "/advanced-collection-analysis", {"contract_address": COLLECTIONS[0]}),
+    "advanced-wallet-analysis": ("POST", "/advanced-wallet-analysis", {"wallet_address": WALLETS[0]}),
+    "market-insights": ("GET", "/market-insights", None),
+    "trending-collections": ("GET", "/trending-collections", None),
+    "whale-activity": ("GET", f"/whale-activity/{COLLECTIONS[0]}", None),
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index] * 1000, 2)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def start_server(target, port, env):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env={**os.environ, **env}
+    )
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=0.5)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{target} did not start on port {port}")
+
+
+def start_app(port, env):
+    """Start the app with empty caches and its SQLite files in a fresh temporary directory."""
+    scratch = tempfile.mkdtemp(prefix="aegis-bench-")
+    env = {
+        **env,
+        "HISTORY_DB_PATH": os.path.join(scratch, "history.sqlite3"),
+        "PROFILE_DB_PATH": os.path.join(scratch, "profiles.sqlite3")
+    }
+    try:
+        return start_server("main:app", port, env), scratch
+    except Exception:
+        shutil.rmtree(scratch, ignore_errors=True)
+        raise
+
+
+def stop_server(process):
+    process.terminate()
+    process.wait()
+
+
+async def drive(client, method, path, body, concurrency, total):
+    latencies, errors = [], 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                if response.status_code >= 400 or "error" in response.text[:200]:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99)
+    }
+
+
+async def run_scenarios(app_port, app_env, mock_urls, routes, levels, total):
+    results = []
+    timeout = httpx.Timeout(120)
+    limits = httpx.Limits(max_connections=max(levels) + 10)
+    async with httpx.AsyncClient(timeout=timeout) as mocks:
+        for name in routes:
+            method, path, body = ROUTES[name]
+            for concurrency in levels:
+                # A fresh app per scenario, so later levels are not measuring earlier levels' cache hits
+                process, scratch = await asyncio.to_thread(start_app, app_port, app_env)
+                try:
+                    for url in mock_urls.values():
+                        await mocks.post(f"{url}/__reset")
+                    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{app_port}", timeout=timeout, limits=limits) as client:
+                        stats = await drive(client, method, path, body, concurrency, total)
+                    upstream = {}
+                    for mock, url in mock_urls.items():
+                        upstream[mock] = (await mocks.get(f"{url}/__stats")).json()["total"]
+                finally:
+                    await asyncio.to_thread(stop_server, process)
+                    shutil.rmtree(scratch, ignore_errors=True)
+                stats["upstream_calls_per_request"] = {
+                    mock: round(count / max(stats["requests"], 1), 3) for mock, count in upstream.items()
+                }
+                stats.update({"route": name, "concurrency": concurrency})
+                results.append(stats)
+                print(f"{name:30s} c={concurrency:<4d} rps={stats['rps']:<8} p50={stats['p50_ms']}ms "
+                      f"p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms errors={stats['errors']} "
+                      f"upstream/req={stats['upstream_calls_per_request']}")
+    return results
+
+
+def compare(report, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(row["route"], row["concurrency"]): row for row in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    for row in report["results"]:
+        old = baseline.get((row["route"], row["concurrency"]))
+        if not old or not old["p95_ms"] or not old["rps"]:
+            continue
+        p95_delta = (row["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+        rps_delta = (row["rps"] - old["rps"]) / old["rps"] * 100
+        print(f"{row['route']:30s} c={row['concurrency']:<4d} p95 {p95_delta:+.1f}%  rps {rps_delta:+.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,10,50", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route and level")
+    parser.add_argument("--routes", default=",".join(ROUTES), help="comma-separated subset of: " + ", ".join(ROUTES))
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--llm-latency-ms", type=float, default=400)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--base-port", type=int, default=9100)
+    parser.add_argument("--compare", help="earlier report to compare against")
+    parser.add_argument("--output", help="report path (default: benchmarks/results/<timestamp>-<commit>.json)")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    routes = [route for route in args.routes.split(",") if route]
+    mock_env = {
+        "MOCK_LATENCY_MS": str(args.latency_ms),
+        "MOCK_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "MOCK_ERROR_RATE": str(args.error_rate)
+    }
+    bitscrunch_port, gradient_port, app_port = args.base_port, args.base_port + 1, args.base_port + 2
+    mock_urls = {
+        "bitscrunch": f"http://127.0.0.1:{bitscrunch_port}",
+        "gradient": f"http://127.0.0.1:{gradient_port}"
+    }
+    app_env = {
+        "BITSCRUNCH_BASE_URL": f"{mock_urls['bitscrunch']}/api/v2",
+        "GRADIENTAI_URL": f"{mock_urls['gradient']}/api/v1/chat/completions",
+        "BITSCRUNCH_API_KEY": "benchmark",
+        "MODEL_ACCESS_KEY": "benchmark",
+        "PREFETCH_ENABLED": os.getenv("PREFETCH_ENABLED", "true"),
+        "LOG_LEVEL": "WARNING"
+    }
+
+    processes = []
+    try:
+        processes.append(start_server("benchmarks.mock_upstreams:bitscrunch_app", bitscrunch_port, mock_env))
+        processes.append(start_server("benchmarks.mock_upstreams:gradient_app", gradient_port, mock_env))
+        results = asyncio.run(run_scenarios(app_port, app_env, mock_urls, routes, levels, args.requests))
+    finally:
+        for process in processes:
+            stop_server(process)
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {**vars(args), "levels": levels, "routes": routes},
+        "results": results
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{commit}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
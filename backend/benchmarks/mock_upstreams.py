@@ -0,0 +1,134 @@
+"""Local stand-ins for the BitsCrunch API and the Gradient chat-completions endpoint.
+
+Both apps sleep for an injected latency and fail a configurable fraction of
+requests, so the backend can be load-tested without touching real upstreams
+or burning API quota. Configure with environment variables:
+
+    MOCK_LATENCY_MS      mean injected latency (default 80)
+    MOCK_JITTER_MS       uniform jitter added on top (default 20)
+    MOCK_ERROR_RATE      fraction of requests answered with an error (default 0)
+    MOCK_LLM_LATENCY_MS  latency of the chat endpoint (default 400)
+
+Run one with, e.g.:
+    uvicorn benchmarks.mock_upstreams:bitscrunch_app --port 9001
+    uvicorn benchmarks.mock_upstreams:gradient_app --port 9002
+
+``GET /__stats`` returns per-endpoint call counts; ``POST /__reset`` clears them.
+"""
+import asyncio
+import json
+import os
+import random
+from collections import Counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY_MS = float(os.getenv("MOCK_LATENCY_MS", 80))
+JITTER_MS = float(os.getenv("MOCK_JITTER_MS", 20))
+ERROR_RATE = float(os.getenv("MOCK_ERROR_RATE", 0))
+LLM_LATENCY_MS = float(os.getenv("MOCK_LLM_LATENCY_MS", 400))
+TOTAL_ROWS = 250
+
+
+async def _delay(latency_ms):
+    await asyncio.sleep((latency_ms + random.uniform(0, JITTER_MS)) / 1000)
+
+
+def _should_fail():
+    return random.random() < ERROR_RATE
+
+
+def _row(endpoint, index, params):
+    return {
+        "blockchain": params.get("blockchain", "ethereum"),
+        "contract_address": params.get("contract_address", f"0x{index:040x}"),
+        "wallet_address": params.get("wallet", f"0x{index + 1:040x}"),
+        "name": f"{endpoint.rsplit('/', 1)[-1]}-{index}",
+        "volume": round(random.uniform(1e3, 1e7), 4),
+        "volume_change": round(random.uniform(-1, 1), 6),
+        "sales": random.randint(1, 5000),
+        "sales_change": round(random.uniform(-1, 1), 6),
+        "floor_price": round(random.uniform(0.01, 50), 6),
+        "portfolio_value": round(random.uniform(0, 1e6), 4),
+        "washtrade_volume": round(random.uniform(0, 1e4), 4),
+        "volume_trend": [round(random.uniform(0, 1e5), 2) for _ in range(24)],
+        "block_dates": [f"2024-01-01T{hour:02d}:00:00Z" for hour in range(24)],
+        "image_url": "https://example.invalid/image.png"
+    }
+
+
+bitscrunch_app = FastAPI()
+bitscrunch_calls = Counter()
+
+
+@bitscrunch_app.get("/api/v2/{endpoint:path}")
+async def bitscrunch_endpoint(endpoint: str, request: Request):
+    bitscrunch_calls[endpoint] += 1
+    await _delay(LATENCY_MS)
+    if _should_fail():
+        status = random.choice([429, 503])
+        return JSONResponse({"message": "injected failure"}, status_code=status, headers={"Retry-After": "1"} if status == 429 else None)
+
+    params = dict(request.query_params)
+    offset = int(params.get("offset", 0))
+    limit = int(params.get("limit", 30))
+    rows = [_row(endpoint, index, params) for index in range(offset, min(offset + limit, TOTAL_ROWS))]
+    return {
+        "data": rows,
+        "pagination": {"offset": offset, "limit": limit, "total_items": TOTAL_ROWS, "has_next": offset + limit < TOTAL_ROWS}
+    }
+
+
+gradient_app = FastAPI()
+gradient_calls = Counter()
+
+_DECISION = {
+    "action": "portfolio_analysis",
+    "target_wallet": None,
+    "target_collection": None,
+    "reasoning": "mock decision",
+    "needs_user_input": False,
+    "response_focus": "portfolio performance"
+}
+_ANSWER = "Your portfolio looks steady: volume is up, wash trading is low and no collection dominates. Stay safe in the NFT market!"
+
+
+@gradient_app.post("/api/v1/chat/completions")
+async def chat_completions(request: Request):
+    payload = await request.json()
+    prompt = payload["messages"][-1]["content"]
+    is_decision = "Respond with JSON" in prompt or "respond with JSON" in prompt
+    gradient_calls["decision" if is_decision else "answer"] += 1
+    await _delay(LLM_LATENCY_MS / 4 if is_decision else LLM_LATENCY_MS)
+    if _should_fail():
+        return JSONResponse({"error": "injected failure"}, status_code=503)
+
+    content = json.dumps(_DECISION) if is_decision else _ANSWER
+    usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+    if not payload.get("stream"):
+        return {"choices": [{"message": {"role": "assistant", "content": content}}], "usage": usage}
+
+    async def events():
+        for word in content.split(" "):
+            await asyncio.sleep(0.01)
+            yield f"data: {json.dumps({'choices': [{'delta': {'content': word + ' '}}]})}\n\n"
+        yield f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def _add_admin_routes(app, calls):
+    @app.get("/__stats")
+    async def stats():
+        return {"calls": dict(calls), "total": sum(calls.values())}
+
+    @app.post("/__reset")
+    async def reset():
+        calls.clear()
+        return {"reset": True}
+
+
+_add_admin_routes(bitscrunch_app, bitscrunch_calls)
+_add_admin_routes(gradient_app, gradient_calls)
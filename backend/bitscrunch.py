@@ -1,20 +1,132 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+import httpx
 import requests
 from fastapi import HTTPException
 
+from cache import TTLCache, fingerprint, make_cache_key
+from circuit_breaker import CircuitBreaker
+from concurrency import SingleFlight, bounded_gather
+from metrics import upstream_request_duration, upstream_response_bytes
+from rate_limit import TokenBucket, backoff_delay, parse_retry_after
+from request_context import PRIORITY_BACKGROUND, cache_bypass, mark_stale, priority_scope, request_priority
+from upstream import CONNECT_TIMEOUT, POOL_SIZE, READ_TIMEOUT, make_async_client, make_session
+
+# Seconds a response stays fresh, by endpoint family (longest prefix wins).
+# Reference data changes rarely; 24h market analytics move within minutes.
+CACHE_TTLS = {
+    "blockchains": 24 * 3600,
+    "nft/marketplace/metadata": 6 * 3600,
+    "nft/collection/metadata": 6 * 3600,
+    "nft/collection/categories": 3600,
+    "nft/collection/traits": 1800,
+    "nft/market-insights": 300,
+    "nft/marketplace": 300,
+    "nft/collection": 300,
+    "nft/wallet": 120,
+    "nft/liquify": 120,
+    "wallet/balance": 300,
+}
+DEFAULT_CACHE_TTL = int(os.getenv("BITSCRUNCH_CACHE_TTL", 60))
+# How long past its TTL a response may still be served (stale-while-revalidate)
+MAX_STALENESS = {
+    "blockchains": 7 * 24 * 3600,
+    "nft/marketplace/metadata": 24 * 3600,
+    "nft/collection/metadata": 24 * 3600,
+    "nft/collection/categories": 6 * 3600,
+    "nft/collection/traits": 6 * 3600,
+    "nft/market-insights": 1800,
+    "nft/marketplace": 1800,
+    "nft/collection": 1800,
+    "nft/wallet": 900,
+    "nft/liquify": 300,
+    "wallet/balance": 1800,
+}
+DEFAULT_MAX_STALENESS = int(os.getenv("BITSCRUNCH_MAX_STALENESS", 600))
+CACHE_MAXSIZE = int(os.getenv("BITSCRUNCH_CACHE_MAXSIZE", 2048))
+
+_MISS = object()
+
+logger = logging.getLogger(__name__)
+
+# Client-side rate limit sized to the API plan, and retry policy for throttling/5xx
+RATE_LIMIT_PER_SECOND = float(os.getenv("BITSCRUNCH_RATE_LIMIT", 10))
+RATE_LIMIT_BURST = int(os.getenv("BITSCRUNCH_RATE_BURST", 20))
+MAX_RETRIES = int(os.getenv("BITSCRUNCH_MAX_RETRIES", 3))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# How long one worker may hold the shared fetch lock for a cache key
+SHARED_LOCK_TTL = float(os.getenv("BITSCRUNCH_SHARED_LOCK_TTL", 30))
+
+# Rows requested per page by the pagination helpers
+PAGE_SIZE = int(os.getenv("BITSCRUNCH_PAGE_SIZE", 100))
+# Entities sent per upstream call by the batch helpers, and chunks fetched at once
+BATCH_SIZE = int(os.getenv("BITSCRUNCH_BATCH_SIZE", 25))
+BATCH_CONCURRENCY = int(os.getenv("BITSCRUNCH_BATCH_CONCURRENCY", 4))
+
+
+def _family(table, endpoint):
+    return max((prefix for prefix in table if endpoint.startswith(prefix)), key=len, default=None)
+
+
+def _family_setting(table, endpoint, default):
+    family = _family(table, endpoint)
+    return table[family] if family else default
+
+
+def endpoint_family(endpoint):
+    """The endpoint family ``endpoint`` belongs to, e.g. ``nft/collection/traits``."""
+    return _family(CACHE_TTLS, endpoint) or endpoint
+
+
+def cache_ttl_for(endpoint):
+    """Return the cache TTL in seconds for an endpoint."""
+    return _family_setting(CACHE_TTLS, endpoint, DEFAULT_CACHE_TTL)
+
+
+def max_staleness_for(endpoint):
+    """Return how many seconds past its TTL an endpoint's response may be served."""
+    return _family_setting(MAX_STALENESS, endpoint, DEFAULT_MAX_STALENESS)
+
+
 class BitsCrunchAPI:
-    def __init__(self, api_key):
-        self.base_url = "https://api.unleashnfts.com/api/v2"
+    def __init__(self, api_key, cache=None, pool_size=POOL_SIZE, history=None):
+        self.base_url = os.getenv("BITSCRUNCH_BASE_URL", "https://api.unleashnfts.com/api/v2")
         self.headers = {
             "x-api-key": f"{api_key}",
             "Content-Type": "application/json"
         }
+        self.cache = cache if cache is not None else TTLCache(maxsize=CACHE_MAXSIZE)
+        self.pool_size = pool_size
+        # Optional HistoryStore that every fresh upstream response is written to
+        self.history = history
+        self._session = None
+
+    @property
+    def session(self):
+        """Keep-alive ``requests.Session``, created on first synchronous call."""
+        if self._session is None:
+            self._session = make_session(headers=self.headers, pool_size=self.pool_size)
+        return self._session
 
     def _make_request(self, endpoint, params=None):
+        key = make_cache_key(endpoint, params)
+        cached = self.cache.get(key, _MISS)
+        if cached is not _MISS:
+            return cached
         try:
-            response = requests.get(f"{self.base_url}/{endpoint}", headers=self.headers, params=params)
+            response = self.session.get(f"{self.base_url}/{endpoint}", params=params, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
             response.raise_for_status()
             data = response.json()
-            return data.get("data", [])
+            result = data.get("data", [])
+            self.cache.set(key, result, cache_ttl_for(endpoint))
+            if self.history is not None:
+                self.history.record(endpoint, params, result)
+            return result
         except requests.exceptions.HTTPError as e:
             raise HTTPException(status_code=response.status_code, detail=f"bitsCrunch API error: {str(e)}")
         except requests.exceptions.RequestException as e:
@@ -322,6 +434,16 @@ class BitsCrunchAPI:
             params["wallet"] = wallet
         return self._make_request("nft/wallet/profile", params)
 
+    def get_wallet_nft_balance(self, wallet, blockchain="ethereum", offset=0, limit=30):
+        """Get the NFTs a wallet currently holds, with their collections."""
+        params = {
+            "wallet": wallet,
+            "blockchain": blockchain,
+            "offset": offset,
+            "limit": limit
+        }
+        return self._make_request("wallet/balance/nft", params)
+
     # Marketplace Methods
     def get_marketplace_metadata(self, offset=0, limit=30):
         """Get metadata for all available marketplaces."""
@@ -340,9 +462,9 @@ class BitsCrunchAPI:
             "offset": offset,
             "limit": limit
         }
-        print(f"🔍 DEBUG: Calling marketplace analytics with params: {params}")
+        logger.debug("Calling marketplace analytics", extra={"params": params, "sampled": True})
         result = self._make_request("nft/marketplace/analytics", params)
-        print(f"📊 DEBUG: Marketplace API returned {len(result) if result else 0} items")
+        logger.debug("Marketplace analytics returned %d items", len(result) if result else 0, extra={"sampled": True})
         return result
 
     def get_marketplace_holders(self, blockchain="ethereum", time_range="24h", sort_by="holders", offset=0, limit=30):
@@ -459,41 +581,362 @@ class BitsCrunchAPI:
             holder_insights = self.get_holder_insights(blockchain=blockchain, time_range=time_range)
             trader_insights = self.get_trader_insights(blockchain=blockchain, time_range=time_range)
             
-            # Process marketplace data for better insights
-            marketplace_summary = None
-            if marketplace_data and len(marketplace_data) > 0:
-                # Sort by volume and get top marketplace
-                sorted_marketplaces = sorted(marketplace_data, key=lambda x: x.get('volume', 0), reverse=True)
-                top_marketplace = sorted_marketplaces[0] if sorted_marketplaces else None
-                
-                total_volume = sum(mp.get('volume', 0) for mp in marketplace_data)
-                total_sales = sum(mp.get('sales', 0) for mp in marketplace_data)
-                
-                marketplace_summary = {
-                    "top_marketplace": {
-                        "name": top_marketplace.get('name', 'Unknown') if top_marketplace else 'Unknown',
-                        "volume": top_marketplace.get('volume', 0) if top_marketplace else 0,
-                        "volume_change": top_marketplace.get('volume_change', 0) if top_marketplace else 0,
-                        "sales": top_marketplace.get('sales', 0) if top_marketplace else 0
-                    },
-                    "total_market_volume": total_volume,
-                    "total_market_sales": total_sales,
-                    "marketplace_count": len(marketplace_data),
-                    "all_marketplaces": marketplace_data[:5]  # Top 5 marketplaces
-                }
+            return self._build_market_insights(marketplace_data, market_analytics, holder_insights, trader_insights)
             
+        except Exception as e:
+            logger.error("Error in get_market_insights: %s", e)
             return {
-                "marketplace_data": marketplace_summary,
-                "market_analytics": market_analytics,
-                "holder_insights": holder_insights,
-                "trader_insights": trader_insights,
-                "has_marketplace_data": marketplace_summary is not None
+                "error": str(e),
+                "marketplace_data": None,
+                "has_marketplace_data": False
             }
+
+    @staticmethod
+    def _build_market_insights(marketplace_data, market_analytics, holder_insights, trader_insights):
+        """Combine marketplace and market-wide data into one insights payload."""
+        # Process marketplace data for better insights
+        marketplace_summary = None
+        if marketplace_data and len(marketplace_data) > 0:
+            # Sort by volume and get top marketplace
+            sorted_marketplaces = sorted(marketplace_data, key=lambda x: x.get('volume', 0), reverse=True)
+            top_marketplace = sorted_marketplaces[0] if sorted_marketplaces else None
+            
+            total_volume = sum(mp.get('volume', 0) for mp in marketplace_data)
+            total_sales = sum(mp.get('sales', 0) for mp in marketplace_data)
             
+            marketplace_summary = {
+                "top_marketplace": {
+                    "name": top_marketplace.get('name', 'Unknown') if top_marketplace else 'Unknown',
+                    "volume": top_marketplace.get('volume', 0) if top_marketplace else 0,
+                    "volume_change": top_marketplace.get('volume_change', 0) if top_marketplace else 0,
+                    "sales": top_marketplace.get('sales', 0) if top_marketplace else 0
+                },
+                "total_market_volume": total_volume,
+                "total_market_sales": total_sales,
+                "marketplace_count": len(marketplace_data),
+                "all_marketplaces": marketplace_data[:5]  # Top 5 marketplaces
+            }
+        
+        return {
+            "marketplace_data": marketplace_summary,
+            "market_analytics": market_analytics,
+            "holder_insights": holder_insights,
+            "trader_insights": trader_insights,
+            "has_marketplace_data": marketplace_summary is not None
+        }
+
+
+class AsyncBitsCrunchAPI(BitsCrunchAPI):
+    """Non-blocking BitsCrunch client for use inside FastAPI routes.
+
+    Every ``get_*`` method inherited from :class:`BitsCrunchAPI` returns an
+    awaitable here, because they all delegate to the async ``_make_request``.
+    Requests share one pooled keep-alive ``httpx.AsyncClient`` so connections are reused
+    across routes instead of being opened per call, and identical requests
+    already in flight are coalesced into a single upstream call. Upstream
+    calls share one token bucket; throttled and 5xx responses are retried
+    with jittered exponential backoff that honours ``Retry-After``. Expired
+    responses within their family's max staleness are returned immediately
+    (stale-while-revalidate) while a background refresh runs.
+
+    Inside a :func:`~request_context.deadline_scope`, a caller stops waiting
+    at its deadline with a 504 ``HTTPException``. The upstream fetch itself
+    carries on and fills the cache for the next caller.
+
+    With a ``shared`` :class:`~cache_backend.CacheBackend`, worker processes
+    also share responses, coalesce fetches through a lock per cache key, and
+    draw from one per-second request budget. If the backend fails, the
+    client falls back to process-local behaviour.
+
+    Each endpoint family has a :class:`~circuit_breaker.CircuitBreaker`.
+    While a family's circuit is open its cache misses fail fast with a 503
+    instead of waiting on the failing upstream; cached and stale responses
+    are still served.
+    """
+
+    def __init__(self, api_key, cache=None, pool_size=POOL_SIZE, rate_limiter=None, history=None, shared=None):
+        super().__init__(api_key, cache=cache, pool_size=pool_size, history=history)
+        self.shared = shared
+        self.client = make_async_client(base_url=self.base_url, headers=self.headers, pool_size=pool_size)
+        self.inflight = SingleFlight()
+        self.rate_limiter = rate_limiter or TokenBucket(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+        self._revalidations = set()
+        self.breakers = {}
+
+    async def _make_request(self, endpoint, params=None):
+        key = make_cache_key(endpoint, params)
+        if not cache_bypass.get():
+            cached = self.cache.get(key, _MISS)
+            if cached is not _MISS:
+                return cached
+            stale = self.cache.get_stale(key, _MISS)
+            if stale is not _MISS:
+                # Answer now with the last good response and refresh it behind the scenes
+                mark_stale(endpoint)
+                self._revalidate(endpoint, params, key)
+                return stale
+        try:
+            return await self.inflight.do(key, lambda: self._load(endpoint, params, key))
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail=f"Request deadline exceeded waiting for {endpoint}")
+
+    async def _load(self, endpoint, params, key):
+        """Fetch ``key`` once across all workers when a shared backend is configured."""
+        if self.shared is None:
+            return await self._fetch(endpoint, params, key)
+
+        hit = None if cache_bypass.get() else await self._shared("get", key)
+        locked = None
+        if hit is None:
+            locked = await self._shared("acquire_lock", key, SHARED_LOCK_TTL)
+            if locked is False:
+                # Another worker is fetching this key; wait for its result
+                hit = await self._shared("wait_for", key)
+        if hit is not None:
+            value, seconds_left = hit
+            self.cache.set(key, value, seconds_left, max_stale=max_staleness_for(endpoint))
+            return value
+
+        try:
+            result = await self._fetch(endpoint, params, key)
+            await self._shared("set", key, result, cache_ttl_for(endpoint))
+            return result
+        finally:
+            if locked:
+                await self._shared("release_lock", key)
+
+    async def _shared(self, method, *args):
+        """Call the shared backend; ``None`` if it is unavailable."""
+        try:
+            return await getattr(self.shared, method)(*args)
+        except Exception as e:
+            logger.warning("Shared cache backend %s failed: %s", method, e)
+            return None
+
+    def _revalidate(self, endpoint, params, key):
+        async def refresh():
+            with priority_scope(PRIORITY_BACKGROUND):
+                await self.inflight.do(key, lambda: self._load(endpoint, params, key))
+
+        task = asyncio.ensure_future(refresh())
+        self._revalidations.add(task)
+        task.add_done_callback(self._revalidation_done)
+
+    def _revalidation_done(self, task):
+        self._revalidations.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Background refresh failed: %s", task.exception())
+
+    def breaker_for(self, endpoint):
+        family = endpoint_family(endpoint)
+        breaker = self.breakers.get(family)
+        if breaker is None:
+            breaker = self.breakers[family] = CircuitBreaker(f"bitscrunch:{family}")
+        return breaker
+
+    def breaker_stats(self):
+        return {breaker.name: breaker.stats() for breaker in self.breakers.values()}
+
+    async def _fetch(self, endpoint, params, key):
+        priority = request_priority.get()
+        breaker = self.breaker_for(endpoint)
+        for attempt in range(MAX_RETRIES + 1):
+            if not breaker.allow():
+                retry_after = breaker.retry_after()
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"bitsCrunch {endpoint_family(endpoint)} is failing; retry in {retry_after:.0f}s",
+                    headers={"Retry-After": str(int(retry_after) + 1)}
+                )
+            await self.rate_limiter.acquire(priority)
+            if self.shared is not None:
+                await self._shared("throttle", "bitscrunch", RATE_LIMIT_PER_SECOND)
+            started = time.perf_counter()
+            status, size = "error", 0
+            try:
+                response = await self.client.get(f"/{endpoint}", params=params)
+                status, size = response.status_code, len(response.content)
+                response.raise_for_status()
+                data = response.json()
+                breaker.record_success()
+                result = data.get("data", [])
+                self.cache.set(key, result, cache_ttl_for(endpoint), max_stale=max_staleness_for(endpoint))
+                if self.history is not None:
+                    self.history.record(endpoint, params, result)
+                return result
+            except httpx.HTTPStatusError as e:
+                status = e.response.status_code
+                if status >= 500:
+                    breaker.record_failure()
+                elif status == 429:
+                    # Throttling is the rate limiter's business, not a sign the upstream is down
+                    breaker.release()
+                else:
+                    breaker.record_success()
+                if status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    raise HTTPException(status_code=status, detail=f"bitsCrunch API error: {str(e)}")
+                retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
+                if status == 429:
+                    # Slow every caller down, not just this one
+                    pause = retry_after if retry_after is not None else backoff_delay(attempt)
+                    self.rate_limiter.pause(pause)
+                    if self.shared is not None:
+                        await self._shared("pause", "bitscrunch", pause)
+            except httpx.RequestError as e:
+                breaker.record_failure()
+                if attempt == MAX_RETRIES:
+                    raise HTTPException(status_code=500, detail=f"Request failed: {str(e)}")
+                retry_after = None
+            finally:
+                self._record_span(endpoint, params, status, size, time.perf_counter() - started, attempt)
+            await asyncio.sleep(backoff_delay(attempt, retry_after=retry_after))
+
+    @staticmethod
+    def _record_span(endpoint, params, status, size, duration, attempt):
+        upstream_request_duration.observe(duration, endpoint=endpoint, status=status)
+        upstream_response_bytes.inc(size, endpoint=endpoint)
+        span = {
+            "endpoint": endpoint,
+            "params_hash": fingerprint(params)[:8],
+            "status": status,
+            "bytes": size,
+            "duration_ms": round(duration * 1000, 1),
+            "attempt": attempt
+        }
+        logger.info(
+            "upstream span endpoint=%s params=%s status=%s bytes=%d duration_ms=%.1f attempt=%d",
+            endpoint, span["params_hash"], status, size, span["duration_ms"], attempt,
+            extra={"span": span, "sampled": status == 200}
+        )
+
+    async def aclose(self):
+        """Close the pooled HTTP client and the shared backend connection."""
+        await self.client.aclose()
+        if self.shared is not None:
+            await self.shared.close()
+
+    # Pagination helpers
+    async def iter_pages(self, method, *args, page_size=PAGE_SIZE, max_items=None, total=None, concurrency=4, **kwargs):
+        """Lazily walk every page of a list ``get_*`` method.
+
+        ``method`` is any bound method taking ``offset``/``limit`` (e.g.
+        ``api.get_collection_owners``). The next page is always prefetched
+        while the current one is consumed. When ``total`` is known, up to
+        ``concurrency`` pages are fetched ahead in parallel; otherwise the walk
+        stops at the first short page. Pages are yielded in order.
+        """
+        bounds = [n for n in (total, max_items) if n is not None]
+        limit = min(bounds) if bounds else None
+        window = max(concurrency, 1) if total is not None else 2
+        pending = deque()
+        next_offset = 0
+
+        def schedule():
+            nonlocal next_offset
+            while len(pending) < window and (limit is None or next_offset < limit):
+                size = page_size if limit is None else min(page_size, limit - next_offset)
+                pending.append(asyncio.ensure_future(method(*args, offset=next_offset, limit=size, **kwargs)))
+                next_offset += size
+
+        try:
+            schedule()
+            while pending:
+                page = await pending.popleft()
+                if page:
+                    yield page
+                if not page or len(page) < page_size and (limit is None or next_offset < limit):
+                    break
+                schedule()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def iter_items(self, method, *args, **kwargs):
+        """Yield individual rows from :meth:`iter_pages`."""
+        async for page in self.iter_pages(method, *args, **kwargs):
+            for item in page:
+                yield item
+
+    # Batch helpers
+    async def fetch_batch(self, method, entity_param, entity_field, entities, batch_size=BATCH_SIZE, **kwargs):
+        """Fetch rows for many entities with as few upstream calls as possible.
+
+        ``entities`` are de-duplicated case-insensitively, sorted (so the
+        same set always hits the same cache entries) and sent as given,
+        ``batch_size`` at a time, as the multi-value ``entity_param``
+        (``wallet`` or ``contract_address``). Returns ``{entity: [rows]}``
+        keyed by the input entity, matched case-insensitively on each row's
+        ``entity_field``. A failed chunk maps its entities to
+        ``{"error": ...}``; entities with no rows map to an empty list.
+        """
+        originals = {}
+        for entity in entities:
+            if entity:
+                originals.setdefault(entity.lower(), entity)
+        keys = sorted(originals)
+        chunks = [keys[i:i + batch_size] for i in range(0, len(keys), batch_size)]
+        responses = await bounded_gather(
+            [method(**{entity_param: [originals[key] for key in chunk]}, limit=len(chunk), **kwargs)
+             for chunk in chunks],
+            concurrency=BATCH_CONCURRENCY
+        )
+
+        by_key = {}
+        for chunk, rows in zip(chunks, responses):
+            if isinstance(rows, Exception):
+                error = {"error": str(getattr(rows, "detail", rows))}
+                by_key.update((key, error) for key in chunk)
+                continue
+            by_key.update((key, []) for key in chunk)
+            for row in rows or []:
+                key = str(row.get(entity_field, "")).lower()
+                if isinstance(by_key.get(key), list):
+                    by_key[key].append(row)
+        return {entity: by_key[entity.lower()] for entity in entities if entity}
+
+    async def get_wallet_health_batch(self, wallets, blockchain="ethereum", time_range="all"):
+        """Wallet scores for many wallets, keyed by wallet address."""
+        return await self.fetch_batch(
+            self.get_wallet_scores, "wallet", "wallet_address", wallets,
+            blockchain=blockchain, time_range=time_range
+        )
+
+    async def get_collection_stats_batch(self, contract_addresses, blockchain="ethereum", time_range="all"):
+        """Collection stats for many collections, keyed by contract address."""
+        return await self.fetch_batch(
+            self.get_collection_stats, "contract_address", "contract_address", contract_addresses,
+            blockchain=blockchain, time_range=time_range
+        )
+
+    async def get_marketplace_analytics(self, blockchain="ethereum", time_range="24h", sort_by="volume", offset=0, limit=30):
+        """Get marketplace analytics and performance."""
+        params = {
+            "blockchain": blockchain,
+            "time_range": time_range,
+            "sort_by": sort_by,
+            "offset": offset,
+            "limit": limit
+        }
+        logger.debug("Calling marketplace analytics", extra={"params": params, "sampled": True})
+        result = await self._make_request("nft/marketplace/analytics", params)
+        logger.debug("Marketplace analytics returned %d items", len(result) if result else 0, extra={"sampled": True})
+        return result
+
+    async def get_market_insights(self, blockchain="ethereum", time_range="24h"):
+        """Get comprehensive market insights including marketplace data."""
+        try:
+            marketplace_data, market_analytics, holder_insights, trader_insights = await asyncio.gather(
+                self.get_marketplace_analytics(blockchain=blockchain, time_range=time_range, sort_by="volume"),
+                self.get_market_analytics(blockchain=blockchain, time_range=time_range),
+                self.get_holder_insights(blockchain=blockchain, time_range=time_range),
+                self.get_trader_insights(blockchain=blockchain, time_range=time_range)
+            )
+            return self._build_market_insights(marketplace_data, market_analytics, holder_insights, trader_insights)
+
         except Exception as e:
-            print(f"❌ Error in get_market_insights: {str(e)}")
+            logger.error("Error in get_market_insights: %s", e)
             return {
                 "error": str(e),
                 "marketplace_data": None,
                 "has_marketplace_data": False
-            }
\ No newline at end of file
+            }
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_cache_key(endpoint, params=None):
+    """Build a stable key from an endpoint and its query params.
+
+    Params are sorted and list values are normalised so that
+    ``{"a": 1, "b": ["x"]}`` and ``{"b": "x", "a": 1}`` hit the same entry.
+    ``None`` values are dropped, matching what the HTTP client sends.
+    """
+    normalized = {}
+    for key, value in (params or {}).items():
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple)):
+            value = [str(v) for v in value]
+            value = value[0] if len(value) == 1 else sorted(value)
+        else:
+            value = str(value)
+        normalized[key] = value
+    return f"{endpoint}?{json.dumps(normalized, sort_keys=True, separators=(',', ':'))}"
+
+
+def normalize_query(query):
+    """Lower-case a free-text query and strip punctuation and extra spaces."""
+    return " ".join(re.sub(r"[^\w\s']", " ", query.lower()).split())
+
+
+def fingerprint(data):
+    """Short stable hash of any JSON-serialisable value."""
+    payload = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries expire after a per-entry TTL.
+
+    An entry set with ``max_stale`` is kept for that many seconds past its
+    TTL; :meth:`get` no longer returns it then, but :meth:`get_stale` does,
+    which is what stale-while-revalidate serving builds on.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is None or entry[0] <= now:
+                if entry is not None and entry[1] <= now:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def get_stale(self, key, default=None):
+        """Return an expired value that is still within its ``max_stale`` window."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                return default
+            self._entries.move_to_end(key)
+            self.stale_hits += 1
+            return entry[2]
+
+    def set(self, key, value, ttl, max_stale=0):
+        if ttl <= 0:
+            return
+        with self._lock:
+            fresh_until = time.monotonic() + ttl
+            self._entries[key] = (fresh_until, fresh_until + max_stale, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # Redis support is optional; the in-memory backend needs nothing
+    redis_asyncio = None
+
+# "" (process-local caching only), "memory", or a redis:// / rediss:// URL
+CACHE_BACKEND_URL = os.getenv("CACHE_BACKEND_URL", "")
+CACHE_BACKEND_PREFIX = os.getenv("CACHE_BACKEND_PREFIX", "aegis:")
+# How long a worker waits for another worker's in-flight fetch before fetching itself
+LOCK_WAIT_SECONDS = float(os.getenv("CACHE_LOCK_WAIT_SECONDS", 10))
+LOCK_POLL_SECONDS = 0.05
+
+
+class CacheBackend(ABC):
+    """Cache, lock and rate-budget storage shared by every worker process.
+
+    Values must be JSON-serialisable. ``throttle`` enforces a request budget
+    per second across all workers, on top of each worker's own token bucket.
+    """
+
+    @abstractmethod
+    async def get(self, key):
+        """Return ``(value, seconds_left)`` or ``None``."""
+
+    @abstractmethod
+    async def set(self, key, value, ttl):
+        """Store ``value`` under ``key`` for ``ttl`` seconds."""
+
+    @abstractmethod
+    async def acquire_lock(self, key, ttl):
+        """Try to take ``key`` for ``ttl`` seconds; ``True`` if this caller got it."""
+
+    @abstractmethod
+    async def release_lock(self, key):
+        """Release a lock taken with :meth:`acquire_lock`."""
+
+    @abstractmethod
+    async def throttle(self, name, rate):
+        """Wait until the shared budget ``name`` has room for one more call this second."""
+
+    @abstractmethod
+    async def pause(self, name, seconds):
+        """Stop every worker drawing from ``name`` for ``seconds``."""
+
+    async def wait_for(self, key, timeout=LOCK_WAIT_SECONDS):
+        """Poll for ``key`` while another worker fetches it; ``None`` if it never shows up."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_SECONDS)
+            hit = await self.get(key)
+            if hit is not None:
+                return hit
+        return None
+
+    async def close(self):
+        pass
+
+    def stats(self):
+        return {"backend": type(self).__name__}
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """Single-process backend, for tests and single-worker deployments."""
+
+    def __init__(self):
+        self._values = {}
+        self._locks = {}
+        self._windows = {}
+        self._paused_until = {}
+
+    async def get(self, key):
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        seconds_left = entry[0] - time.time()
+        if seconds_left <= 0:
+            del self._values[key]
+            return None
+        return entry[1], seconds_left
+
+    async def set(self, key, value, ttl):
+        if ttl > 0:
+            self._values[key] = (time.time() + ttl, value)
+
+    async def acquire_lock(self, key, ttl):
+        now = time.time()
+        if self._locks.get(key, 0) > now:
+            return False
+        self._locks[key] = now + ttl
+        return True
+
+    async def release_lock(self, key):
+        self._locks.pop(key, None)
+
+    async def throttle(self, name, rate):
+        rate = max(rate, 1)
+        while True:
+            now = time.time()
+            if now < self._paused_until.get(name, 0):
+                await asyncio.sleep(self._paused_until[name] - now)
+                continue
+            window = int(now)
+            start, count = self._windows.get(name, (window, 0))
+            if start != window:
+                count = 0
+            if count < rate:
+                self._windows[name] = (window, count + 1)
+                return
+            await asyncio.sleep(window + 1 - now)
+
+    async def pause(self, name, seconds):
+        self._paused_until[name] = max(self._paused_until.get(name, 0), time.time() + seconds)
+
+    def stats(self):
+        return {"backend": "memory", "keys": len(self._values), "locks": len(self._locks)}
+
+
+class RedisCacheBackend(CacheBackend):
+    """Backend on Redis or anything speaking its protocol.
+
+    Pass ``url`` or a ready ``client`` (e.g. ``fakeredis.aioredis.FakeRedis()``
+    in tests). Only plain GET/SET/INCR/EXPIRE/DEL are used, no Lua, so
+    stand-ins work without scripting support. The rate budget is a
+    fixed one-second window counter per name.
+    """
+
+    def __init__(self, url=None, client=None, prefix=CACHE_BACKEND_PREFIX):
+        if client is None:
+            if redis_asyncio is None:
+                raise RuntimeError("CACHE_BACKEND_URL points at Redis but the redis package is not installed")
+            client = redis_asyncio.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, *parts):
+        return self.prefix + ":".join(parts)
+
+    async def get(self, key):
+        full_key = self._key("cache", key)
+        raw, ttl_ms = await asyncio.gather(self.client.get(full_key), self.client.pttl(full_key))
+        if raw is None or ttl_ms is None or ttl_ms <= 0:
+            return None
+        return json.loads(raw), ttl_ms / 1000
+
+    async def set(self, key, value, ttl):
+        if ttl > 0:
+            await self.client.set(self._key("cache", key), json.dumps(value, default=str), px=int(ttl * 1000))
+
+    async def acquire_lock(self, key, ttl):
+        return bool(await self.client.set(self._key("lock", key), "1", nx=True, px=int(ttl * 1000)))
+
+    async def release_lock(self, key):
+        await self.client.delete(self._key("lock", key))
+
+    async def throttle(self, name, rate):
+        rate = max(rate, 1)
+        while True:
+            paused_ms = await self.client.pttl(self._key("pause", name))
+            if paused_ms and paused_ms > 0:
+                await asyncio.sleep(paused_ms / 1000)
+                continue
+            now = time.time()
+            window_key = self._key("rate", name, str(int(now)))
+            count = await self.client.incr(window_key)
+            if count == 1:
+                await self.client.expire(window_key, 2)
+            if count <= rate:
+                return
+            await asyncio.sleep(int(now) + 1 - now)
+
+    async def pause(self, name, seconds):
+        await self.client.set(self._key("pause", name), "1", px=max(int(seconds * 1000), 1))
+
+    async def close(self):
+        close = getattr(self.client, "aclose", None) or self.client.close
+        await close()
+
+    def stats(self):
+        return {"backend": "redis", "prefix": self.prefix}
+
+
+def build_cache_backend(url=CACHE_BACKEND_URL):
+    """Backend for ``url``, or ``None`` to keep caching process-local."""
+    if not url:
+        return None
+    if url == "memory":
+        return InMemoryCacheBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCacheBackend(url=url)
+    raise ValueError(f"Unsupported CACHE_BACKEND_URL: {url}")
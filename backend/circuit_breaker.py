@@ -0,0 +1,152 @@
+import logging
+import os
+import time
+from collections import deque
+
+# A circuit opens once at least CIRCUIT_MIN_CALLS calls in the last CIRCUIT_WINDOW_SECONDS
+# ended and CIRCUIT_FAILURE_RATE of them failed; it stays open for CIRCUIT_OPEN_SECONDS
+CIRCUIT_WINDOW_SECONDS = float(os.getenv("CIRCUIT_WINDOW_SECONDS", 60))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", 10))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", 0.5))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", 30))
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+# Numeric form of the states for the metrics gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is failing; not calling it for another {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Fail fast on an upstream that keeps failing.
+
+    Closed: calls go through and their outcomes are kept for ``window``
+    seconds. When at least ``min_calls`` outcomes are in the window and the
+    share of failures reaches ``failure_rate``, the circuit opens.
+
+    Open: :meth:`allow` refuses every call for ``open_seconds``.
+
+    Half-open: one probe call is let through. Its success closes the
+    circuit and its failure opens it again. A probe that never reports back
+    (e.g. it was cancelled) is replaced after ``open_seconds``.
+
+    Callers report each upstream attempt with :meth:`record_success` or
+    :meth:`record_failure`. Client errors are successes: the upstream
+    answered. Calls that say nothing about the upstream's health, such as a
+    429 or a timeout the caller shortened itself, call :meth:`release`.
+    """
+
+    def __init__(self, name, window=CIRCUIT_WINDOW_SECONDS, min_calls=CIRCUIT_MIN_CALLS,
+                 failure_rate=CIRCUIT_FAILURE_RATE, open_seconds=CIRCUIT_OPEN_SECONDS):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._outcomes = deque()  # (time, failed)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started = None
+        self.opened = 0
+        self.rejected = 0
+
+    def _prune(self, now):
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            _, failed = self._outcomes.popleft()
+            self._failures -= failed
+
+    def allow(self):
+        """Whether a call may go ahead now; counts it as rejected if not."""
+        now = time.monotonic()
+        if self.state == OPEN:
+            if now - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self._probe_started = None
+        if self.state == HALF_OPEN:
+            if self._probe_started is not None and now - self._probe_started < self.open_seconds:
+                self.rejected += 1
+                return False
+            self._probe_started = now
+        return True
+
+    def check(self):
+        """Raise :class:`CircuitOpenError` unless a call may go ahead."""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def retry_after(self):
+        """Seconds until the circuit lets another call through."""
+        now = time.monotonic()
+        if self.state == OPEN:
+            return max(0.0, self._opened_at + self.open_seconds - now)
+        if self.state == HALF_OPEN and self._probe_started is not None:
+            return max(0.0, self._probe_started + self.open_seconds - now)
+        return 0.0
+
+    def record_success(self):
+        if self.state == HALF_OPEN:
+            self._close()
+        elif self.state == CLOSED:
+            self._record(False)
+
+    def release(self):
+        """Report a call without a verdict, freeing the half-open probe slot if it held it."""
+        if self.state == HALF_OPEN:
+            self._probe_started = None
+
+    def record_failure(self):
+        if self.state == HALF_OPEN:
+            self._open()
+        elif self.state == CLOSED:
+            self._record(True)
+            calls = len(self._outcomes)
+            if calls >= self.min_calls and self._failures / calls >= self.failure_rate:
+                self._open()
+
+    def _record(self, failed):
+        now = time.monotonic()
+        self._prune(now)
+        self._outcomes.append((now, failed))
+        self._failures += failed
+
+    def _open(self):
+        logger.warning("Circuit %s opened for %.0fs", self.name, self.open_seconds)
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._probe_started = None
+        self._outcomes.clear()
+        self._failures = 0
+        self.opened += 1
+
+    def _close(self):
+        logger.info("Circuit %s closed", self.name)
+        self.state = CLOSED
+        self._probe_started = None
+        self._outcomes.clear()
+        self._failures = 0
+
+    def stats(self):
+        self._prune(time.monotonic())
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "calls_in_window": calls,
+            "failure_rate": round(self._failures / calls, 4) if calls else 0.0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_after_seconds": round(self.retry_after(), 1)
+        }
@@ -0,0 +1,121 @@
+import asyncio
+
+from request_context import deadline_scope, remaining
+
+
+async def gather_partial(calls, concurrency=4, timeout=None):
+    """Run named awaitables concurrently and collect whatever finishes.
+
+    ``calls`` maps a result key to an awaitable. At most ``concurrency`` of
+    them run at once, and anything still pending after ``timeout`` seconds is
+    cancelled. A call that raises or times out is reported as
+    ``{"error": "..."}`` under its key instead of failing the whole batch.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(awaitable):
+        async with semaphore:
+            return await awaitable
+
+    tasks = {name: asyncio.ensure_future(run(awaitable)) for name, awaitable in calls.items()}
+    if not tasks:
+        return {}
+
+    try:
+        done, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+    finally:
+        # Also reached when the caller is cancelled, e.g. the client went away
+        for task in tasks.values():
+            task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    results = {}
+    for name, task in tasks.items():
+        if task in pending:
+            results[name] = {"error": f"Timed out after {timeout}s"}
+        elif task.cancelled():
+            results[name] = {"error": "Cancelled"}
+        elif task.exception() is not None:
+            results[name] = {"error": str(getattr(task.exception(), "detail", None) or task.exception())}
+        else:
+            results[name] = task.result()
+    return results
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one in-flight task.
+
+    The first caller for a key starts ``func()``; callers arriving while it
+    is still running await the same task and receive the same result or
+    exception. Each caller awaits through ``asyncio.shield`` so one client
+    going away does not cancel the request for everyone else.
+
+    The shared task runs without a request deadline, since it is not tied to
+    the caller that happened to start it. Each caller only stops waiting at
+    its own deadline, with :class:`asyncio.TimeoutError`.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key, func):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._detached(func))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.wait_for(asyncio.shield(task), remaining())
+
+    @staticmethod
+    async def _detached(func):
+        with deadline_scope(None):
+            return await func()
+
+    def stats(self):
+        return {
+            "in_flight": len(self._inflight),
+            "started": self.started,
+            "coalesced": self.coalesced
+        }
+
+
+async def bounded_gather(awaitables, concurrency=8, timeout=None):
+    """``asyncio.gather(..., return_exceptions=True)`` with at most ``concurrency`` running at once.
+
+    Results come back in input order; a failed awaitable yields its exception.
+    Anything still running after ``timeout`` seconds is cancelled and yields
+    :class:`asyncio.TimeoutError`, so callers keep whatever did finish.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(awaitable):
+        async with semaphore:
+            return await awaitable
+
+    tasks = [asyncio.ensure_future(run(awaitable)) for awaitable in awaitables]
+    if not tasks:
+        return []
+
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+    finally:
+        for task in tasks:
+            task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    results = []
+    for task in tasks:
+        if task in pending:
+            results.append(asyncio.TimeoutError(f"Timed out after {timeout:.1f}s"))
+        elif task.cancelled():
+            results.append(asyncio.CancelledError())
+        else:
+            results.append(task.exception() or task.result())
+    return results
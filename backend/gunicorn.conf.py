@@ -0,0 +1,28 @@
+"""Multi-worker deployment: ``gunicorn -c gunicorn.conf.py main:app``.
+
+Each worker is a uvicorn event loop in its own process. Background refresh
+jobs run in one worker only. Set ``CACHE_BACKEND_URL=redis://...`` so workers
+share BitsCrunch responses, fetch locks, the upstream rate budget, snapshots,
+portfolio summaries and profile invalidation. Without Redis those would be
+per worker (``CACHE_BACKEND_URL=memory`` is per process too), so a single
+worker runs unless ``WEB_CONCURRENCY`` says otherwise.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+# Only a Redis backend is shared between processes (see cache_backend.build_cache_backend)
+_shared_backend = os.getenv("CACHE_BACKEND_URL", "").startswith(("redis://", "rediss://", "unix://"))
+# The app is I/O bound, so one event loop per core is enough
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() if _shared_backend else 1))
+# Streaming LLM answers can legitimately take a while
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+# Recycle workers now and then to bound memory held by in-process caches
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 1000))
+accesslog = None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
@@ -0,0 +1,266 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from timeseries import parse_timestamp
+
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "history.sqlite3")
+HISTORY_RETENTION_DAYS = float(os.getenv("HISTORY_RETENTION_DAYS", 90))
+# Points older than this are compacted to one (averaged) point per hour
+HISTORY_COMPACT_AFTER_DAYS = float(os.getenv("HISTORY_COMPACT_AFTER_DAYS", 7))
+HISTORY_MAINTENANCE_INTERVAL = int(os.getenv("HISTORY_MAINTENANCE_INTERVAL", 3600))
+WRITE_BATCH_SIZE = 500
+
+# Endpoints that return one row per entity -> (entity kind, row field holding the entity id).
+# Per-trait, per-owner and per-whale endpoints are left out: several of their rows
+# belong to one collection and would overwrite each other's points.
+ENTITY_FIELDS = {
+    "nft/wallet/analytics": ("wallet", "wallet_address"),
+    "nft/wallet/scores": ("wallet", "wallet_address"),
+    "nft/wallet/washtrade": ("wallet", "wallet_address"),
+    "nft/wallet/profile": ("wallet", "wallet_address"),
+    "nft/collection/analytics": ("collection", "contract_address"),
+    "nft/collection/scores": ("collection", "contract_address"),
+    "nft/collection/washtrade": ("collection", "contract_address"),
+    "nft/collection/profile": ("collection", "contract_address"),
+    "nft/market-insights/analytics": ("market", None),
+    "nft/market-insights/holders": ("market", None),
+    "nft/market-insights/scores": ("market", None),
+    "nft/market-insights/traders": ("market", None),
+    "nft/market-insights/washtrade": ("market", None),
+}
+# Bumped when stored metric names change; older points are dropped on open
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    entity TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (entity, metric, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS snapshots_ts ON snapshots (ts);
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def entity_key(kind, entity_id, blockchain="ethereum"):
+    """Stable entity name, e.g. ``collection:ethereum:0xabc...``."""
+    return f"{kind}:{blockchain}:{str(entity_id).lower()}"
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def extract_points(endpoint, params, rows, fetched_at):
+    """Turn one BitsCrunch response into ``(entity, metric, ts, value)`` tuples.
+
+    Scalar numeric fields become one point at ``fetched_at``; ``*_trend``
+    lists become one point per ``block_dates`` entry. Metric names carry the
+    endpoint and the request's time range (``analytics.volume_24h``,
+    ``analytics.volume_trend_7d``), because the same field means different
+    things on different endpoints and over different windows.
+    """
+    if endpoint not in ENTITY_FIELDS or not isinstance(rows, list):
+        return []
+    kind, id_field = ENTITY_FIELDS[endpoint]
+    params = params or {}
+    blockchain = params.get("blockchain", "ethereum")
+    prefix = endpoint.rsplit("/", 1)[-1] + "."
+    suffix = f"_{params['time_range']}" if params.get("time_range") else ""
+    ts = int(fetched_at)
+
+    points = []
+    for row in rows:
+        if not isinstance(row, dict):
+            continue
+        entity_id = row.get(id_field) if id_field else "all"
+        if not entity_id:
+            continue
+        entity = entity_key(kind, entity_id, row.get("blockchain") or blockchain)
+        dates = row.get("block_dates") or []
+        stamps = [parse_timestamp(date) for date in dates]
+        for field, value in row.items():
+            if _is_number(value):
+                points.append((entity, prefix + field + suffix, ts, float(value)))
+            elif field.endswith("_trend") and isinstance(value, list) and len(value) == len(dates):
+                points.extend(
+                    (entity, prefix + field + suffix, int(stamp), float(item))
+                    for stamp, item in zip(stamps, value) if stamp is not None and _is_number(item)
+                )
+    return points
+
+
+class HistoryStore:
+    """Embedded SQLite store of historical metric points per entity.
+
+    Upstream responses are handed to :meth:`record`, which only enqueues;
+    a single writer thread extracts points, writes them in batches and runs
+    retention and compaction. Reads (:meth:`query`, :meth:`summary`) open
+    their own connection and are safe to run via ``asyncio.to_thread``.
+    The database runs in WAL mode so readers never wait for the writer.
+    """
+
+    def __init__(self, path=HISTORY_DB_PATH, retention_days=HISTORY_RETENTION_DAYS,
+                 compact_after_days=HISTORY_COMPACT_AFTER_DAYS, maintenance_interval=HISTORY_MAINTENANCE_INTERVAL):
+        self.path = path
+        self.retention = retention_days * 86400
+        self.compact_after = compact_after_days * 86400
+        self.maintenance_interval = maintenance_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._local = threading.local()
+        self.written = 0
+        self.dropped = 0
+        self.last_maintenance = None
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                # Points recorded before metric names were namespaced by endpoint may be corrupt
+                conn.execute("DELETE FROM snapshots")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # Writing
+    def record(self, endpoint, params, rows):
+        """Queue a response for the writer thread; never blocks."""
+        self._queue.put((endpoint, dict(params or {}), rows, time.time()))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        """Flush queued responses and stop the writer thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        conn = self._connect()
+        next_maintenance = time.time()
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=max(next_maintenance - time.time(), 0.1))
+                except queue.Empty:
+                    item = False
+                batch = [item] if item else []
+                while item is not None and len(batch) < WRITE_BATCH_SIZE:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        batch.append(item)
+                if batch:
+                    self._write(conn, batch)
+                if item is None:
+                    return
+                if time.time() >= next_maintenance:
+                    self._maintain(conn)
+                    next_maintenance = time.time() + self.maintenance_interval
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        cutoff = time.time() - self.retention
+        points = []
+        for endpoint, params, rows, fetched_at in batch:
+            points.extend(point for point in extract_points(endpoint, params, rows, fetched_at) if point[2] >= cutoff)
+        try:
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)", points)
+            self.written += len(points)
+        except sqlite3.Error as e:
+            self.dropped += len(points)
+            logger.warning("History write failed: %s", e)
+
+    def _maintain(self, conn):
+        """Drop points past retention and average old points into hourly buckets."""
+        now = time.time()
+        compact_before = int(now - self.compact_after)
+        try:
+            with conn:
+                conn.execute("DELETE FROM snapshots WHERE ts < ?", (int(now - self.retention),))
+                conn.execute(
+                    "INSERT OR REPLACE INTO snapshots "
+                    "SELECT entity, metric, (ts / 3600) * 3600, AVG(value) FROM snapshots "
+                    "WHERE ts < ? AND ts % 3600 != 0 GROUP BY entity, metric, ts / 3600",
+                    (compact_before,)
+                )
+                conn.execute("DELETE FROM snapshots WHERE ts < ? AND ts % 3600 != 0", (compact_before,))
+            self.last_maintenance = now
+        except sqlite3.Error as e:
+            logger.warning("History maintenance failed: %s", e)
+
+    # Reading
+    def metrics(self, entity):
+        """Metric names recorded for ``entity``."""
+        rows = self._reader().execute(
+            "SELECT DISTINCT metric FROM snapshots WHERE entity = ? ORDER BY metric", (entity,)
+        ).fetchall()
+        return [metric for (metric,) in rows]
+
+    def query(self, entity, metric, start=None, end=None, limit=None):
+        """``(timestamps, values)`` for one series between ``start`` and ``end`` (epoch seconds)."""
+        sql = "SELECT ts, value FROM snapshots WHERE entity = ? AND metric = ? AND ts >= ? AND ts <= ? ORDER BY ts"
+        args = [entity, metric, int(start or 0), int(end if end is not None else 2 ** 62)]
+        if limit:
+            sql += " LIMIT ?"
+            args.append(int(limit))
+        rows = self._reader().execute(sql, args).fetchall()
+        return [ts for ts, _ in rows], [value for _, value in rows]
+
+    def summary(self, entity, since, include_trends=False):
+        """Per-metric first/last/min/max/change since ``since``, for LLM context."""
+        rows = self._reader().execute(
+            "SELECT metric, MIN(ts), MAX(ts), MIN(value), MAX(value), COUNT(*) FROM snapshots "
+            "WHERE entity = ? AND ts >= ? GROUP BY metric", (entity, int(since))
+        ).fetchall()
+        summary = {}
+        for metric, first_ts, last_ts, low, high, count in rows:
+            if count < 2 or (not include_trends and "_trend" in metric):
+                continue
+            (first,), (last,) = (
+                self._reader().execute(
+                    "SELECT value FROM snapshots WHERE entity = ? AND metric = ? AND ts = ?", (entity, metric, ts)
+                ).fetchone()
+                for ts in (first_ts, last_ts)
+            )
+            summary[metric] = {
+                "first": first,
+                "last": last,
+                "min": low,
+                "max": high,
+                "change": round((last - first) / first, 4) if first else None,
+                "points": count,
+                "span_hours": round((last_ts - first_ts) / 3600, 1)
+            }
+        return summary
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "last_maintenance": self.last_maintenance
+        }
@@ -0,0 +1,108 @@
+import os
+import re
+
+# Minimum confidence for a local decision; anything lower goes to the LLM
+ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_ROUTER_THRESHOLD", 0.8))
+
+_GREETING = r"(hi|hello|hey|yo|gm|good (morning|afternoon|evening)|how are you( doing)?|what'?s up|thanks?( you)?|who are you|what can you do)"
+
+# (action, pattern, confidence), checked in order. Greetings are anchored and
+# only take filler words or further greetings after them, so "hey there" is
+# small talk but "hi, what's trending?" is not.
+RULES = [
+    ("general_conversation", rf"^\W*{_GREETING}(\W+(there|all|everyone|again|aegis|{_GREETING}))*\W*$", 0.95),
+    ("wallet_comparison", r"\b(compare|comparison|versus|vs\.?)\b.*\bwallets?\b|\bwallets?\b.*\b(compare|comparison|versus|vs\.?)\b|\bwhich wallet\b|\bbest wallet\b", 0.9),
+    ("whale_analysis", r"\b(whales?|whale activity|big holders?|large holders?)\b", 0.9),
+    ("collection_traits", r"\b(traits?|rarity|rarest)\b", 0.85),
+    ("market_trending", r"\b(trending|what'?s hot|hot collections?|top (performing )?collections?|best performing collections?)\b", 0.9),
+    ("risk_analysis", r"\b(risks?|risky|safe|safety|secure|security|red flags?|wash ?trad\w*|exposure)\b", 0.85),
+    ("market_insights", r"\b(how'?s|how is) the (nft )?market\b|\bmarket (insights?|overview|analytics|health|sentiment|conditions?)\b|\bnft market\b|\bmarketplaces?\b", 0.85),
+    ("portfolio_analysis", r"\b(portfolio|my holdings|overall performance|net worth)\b", 0.85),
+    ("wallet_overview", r"\b(my wallets?|wallet health|wallets? doing|my address(es)?)\b", 0.85),
+]
+_COMPILED_RULES = [(action, re.compile(pattern, re.IGNORECASE), confidence) for action, pattern, confidence in RULES]
+
+# A specific intent and the broader ones whose keywords it usually contains
+# ("compare my wallets" also matches "my wallets"); those matches are not ambiguity
+_COVERS = {
+    "wallet_comparison": {"wallet_overview", "portfolio_analysis"},
+    "whale_analysis": {"market_insights"},
+    "market_trending": {"market_insights"},
+    "risk_analysis": {"wallet_overview", "portfolio_analysis", "market_insights"},
+}
+
+# Actions that need user-supplied data to be useful
+_NEEDS_WALLETS = {"wallet_overview", "wallet_comparison", "portfolio_analysis"}
+# Actions that look at all of the user's wallets rather than a single target
+_ALL_WALLETS = {"wallet_comparison", "portfolio_analysis"}
+
+_RESPONSE_FOCUS = {
+    "general_conversation": "friendly introduction",
+    "wallet_overview": "wallet performance",
+    "wallet_comparison": "differences between wallets",
+    "market_trending": "trending collections",
+    "risk_analysis": "risk exposure",
+    "market_insights": "overall market health",
+    "portfolio_analysis": "portfolio performance",
+    "collection_traits": "traits and rarity",
+    "whale_analysis": "whale activity"
+}
+
+class IntentRouter:
+    """Pick a smart_query action locally when the answer is obvious.
+
+    Returns a decision shaped like the LLM's JSON, or ``None`` when the
+    confidence is below ``threshold`` and the LLM should decide instead.
+    """
+
+    def __init__(self, threshold=ROUTER_CONFIDENCE_THRESHOLD):
+        self.threshold = threshold
+        self.routed = 0
+        self.deferred = 0
+
+    def classify(self, query, user_wallets=()):
+        """Return ``(action, confidence)`` without applying the threshold."""
+        matches = [(action, confidence) for action, pattern, confidence in _COMPILED_RULES if pattern.search(query)]
+        covered = set().union(*(_COVERS.get(action, ()) for action, _ in matches))
+        matches = [match for match in matches if match[0] not in covered]
+        if not matches:
+            return None, 0.0
+        action, confidence = matches[0]
+        # Several unrelated intents in one query are ambiguous
+        if len({match[0] for match in matches}) > 1:
+            confidence *= 0.7
+
+        if action in _NEEDS_WALLETS and not user_wallets:
+            confidence *= 0.5
+        if action == "wallet_comparison" and len(user_wallets) < 2:
+            confidence *= 0.8
+        return action, confidence
+
+    def route(self, query, user_wallets=(), user_collections=()):
+        action, confidence = self.classify(query, user_wallets)
+        if action is None or confidence < self.threshold:
+            self.deferred += 1
+            return None
+
+        self.routed += 1
+        return {
+            "action": action,
+            "target_wallet": user_wallets[0] if user_wallets and action not in _ALL_WALLETS else None,
+            "target_collection": user_collections[0] if user_collections else None,
+            "reasoning": f"Matched local rules for {action.replace('_', ' ')}",
+            "needs_user_input": False,
+            "response_focus": _RESPONSE_FOCUS.get(action, "general overview"),
+            "router_confidence": round(confidence, 3)
+        }
+
+    def stats(self):
+        decisions = self.routed + self.deferred
+        return {
+            "routed_locally": self.routed,
+            "deferred_to_llm": self.deferred,
+            "local_rate": round(self.routed / decisions, 4) if decisions else 0.0
+        }
+
+
+def build_default_router():
+    return IntentRouter()
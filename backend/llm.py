@@ -0,0 +1,142 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+import httpx
+
+from circuit_breaker import CircuitBreaker
+from metrics import llm_request_duration, llm_tokens
+from request_context import remaining
+from upstream import make_async_client, request_timeout
+
+logger = logging.getLogger(__name__)
+
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", 60))
+
+
+class GradientClient:
+    """Async client for the Gradient AI chat-completions endpoint.
+
+    Calls made inside a :func:`~request_context.deadline_scope` time out at
+    the deadline instead of after the full ``LLM_READ_TIMEOUT``. While the
+    endpoint keeps failing, its circuit breaker makes calls raise
+    :class:`~circuit_breaker.CircuitOpenError` straight away.
+    """
+
+    def __init__(self, api_key, url, pool_size=None):
+        self.url = url
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+        options = {"pool_size": pool_size} if pool_size else {}
+        self.client = make_async_client(headers=self.headers, read_timeout=LLM_READ_TIMEOUT, **options)
+        self.breaker = CircuitBreaker("gradient")
+
+    @staticmethod
+    def build_payload(prompt, stream=False):
+        return {
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": stream,
+            "include_functions_info": False,
+            "include_retrieval_info": False,
+            "include_guardrails_info": False
+        }
+
+    def _record_outcome(self, status):
+        if status >= 500:
+            self.breaker.record_failure()
+        elif status == 429:
+            self.breaker.release()
+        else:
+            self.breaker.record_success()
+
+    def _record_error(self, error, timeout):
+        """Count a failed call against the circuit, unless the request deadline cut it short."""
+        shortened = timeout is not httpx.USE_CLIENT_DEFAULT and timeout.read < LLM_READ_TIMEOUT
+        if isinstance(error, httpx.TimeoutException) and shortened:
+            self.breaker.release()
+        else:
+            self.breaker.record_failure()
+
+    @staticmethod
+    def _record(mode, status, duration, usage=None):
+        llm_request_duration.observe(duration, mode=mode, status=status)
+        usage = usage or {}
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if usage.get(kind):
+                llm_tokens.inc(usage[kind], type=kind.replace("_tokens", ""))
+        logger.info(
+            "llm span mode=%s status=%s duration_ms=%.1f prompt_tokens=%s completion_tokens=%s",
+            mode, status, duration * 1000, usage.get("prompt_tokens"), usage.get("completion_tokens"),
+            extra={"span": {"mode": mode, "status": status, "duration_ms": round(duration * 1000, 1), "usage": usage}, "sampled": status == 200}
+        )
+
+    async def chat(self, prompt):
+        """Send a single-turn prompt and return the decoded JSON response."""
+        self.breaker.check()
+        started = time.perf_counter()
+        status, body = "error", None
+        timeout = request_timeout(LLM_READ_TIMEOUT)
+        try:
+            response = await self.client.post(self.url, json=self.build_payload(prompt), timeout=timeout)
+            status = response.status_code
+            self._record_outcome(status)
+            body = response.json()
+            return body
+        except httpx.RequestError as e:
+            self._record_error(e, timeout)
+            raise
+        finally:
+            usage = body.get("usage") if isinstance(body, dict) else None
+            self._record("chat", status, time.perf_counter() - started, usage)
+
+    async def stream_chat(self, prompt):
+        """Send a prompt with ``stream: True`` and yield content chunks as they arrive.
+
+        Understands OpenAI-style ``data: {...}`` event lines. If the endpoint
+        ignores the stream flag and answers with plain JSON, the whole message
+        is yielded as a single chunk. Raises :class:`asyncio.TimeoutError`
+        if the request deadline passes mid-stream.
+        """
+        self.breaker.check()
+        started = time.perf_counter()
+        status, usage = "error", None
+        timeout = request_timeout(LLM_READ_TIMEOUT)
+        try:
+            async with self.client.stream("POST", self.url, json=self.build_payload(prompt, stream=True), timeout=timeout) as response:
+                status = response.status_code
+                self._record_outcome(status)
+                if "text/event-stream" not in response.headers.get("content-type", ""):
+                    body = json.loads(await response.aread())
+                    usage = body.get("usage")
+                    yield body["choices"][0]["message"]["content"]
+                    return
+                async for line in response.aiter_lines():
+                    if remaining() == 0:
+                        raise asyncio.TimeoutError("Request deadline exceeded while streaming the answer")
+                    if not line.startswith("data:"):
+                        continue
+                    chunk = line[len("data:"):].strip()
+                    if chunk == "[DONE]":
+                        break
+                    event = json.loads(chunk)
+                    usage = event.get("usage") or usage
+                    choices = event.get("choices") or [{}]
+                    content = (choices[0].get("delta") or {}).get("content")
+                    if content:
+                        yield content
+        except httpx.RequestError as e:
+            self._record_error(e, timeout)
+            raise
+        except asyncio.TimeoutError:
+            # Our own deadline, not the endpoint's fault
+            self.breaker.release()
+            raise
+        finally:
+            self._record("stream", status, time.perf_counter() - started, usage)
+
+    async def aclose(self):
+        await self.client.aclose()
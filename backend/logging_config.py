@@ -0,0 +1,90 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from request_context import RequestIdFilter
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Per-module overrides, e.g. "bitscrunch=DEBUG,llm=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# Fraction of hot-path events (logged with extra={"sampled": True}) that are kept
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.1))
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+
+# LogRecord attributes that are not user-supplied extras
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "sampled"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with request id and any ``extra`` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only ``rate`` of the records marked ``sampled``; pass everything else."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, "sampled", False):
+            return random.random() < self.rate
+        return True
+
+
+def _parse_levels(spec):
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level=LOG_LEVEL, module_levels=LOG_LEVELS, sample_rate=LOG_SAMPLE_RATE, fmt=LOG_FORMAT):
+    """Route all logging through a queue so request handlers never block on I/O.
+
+    Records are filtered (sampling) and stamped with the request id on the
+    calling thread, then formatted and written to stdout by a
+    ``QueueListener`` thread. Returns the listener, which is stopped at exit.
+    """
+    output = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    handler = QueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(sample_rate))
+    handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+    for name, module_level in _parse_levels(module_levels).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,14 +1,43 @@
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-import requests
+import asyncio
+import json
+import logging
 import os
-from bitscrunch import BitsCrunchAPI
+import re
+import time
+import uuid
+from functools import partial
+from bitscrunch import AsyncBitsCrunchAPI, cache_ttl_for
+from cache import TTLCache, fingerprint, normalize_query
+from cache_backend import build_cache_backend
+from circuit_breaker import STATE_VALUES, CircuitOpenError
+from concurrency import bounded_gather, gather_partial
+from history import HistoryStore, entity_key
+from intent_router import build_default_router
+from portfolio import PortfolioPrecomputer
+from prefetch import SnapshotScheduler
+from profiles import CachedProfileStore, SQLiteProfileStore, empty_profile
+from prompt_data import compact_prompt_data, prompt_stats
+from logging_config import configure_logging
+from metrics import http_request_duration, registry
+from request_context import (
+    PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, deadline_scope, priority_scope, remaining, request_deadline, request_id,
+    request_priority, stale_sources
+)
+from llm import GradientClient
+from timeseries import DEFAULT_POINTS, DOWNSAMPLERS, TIME_RANGES, SeriesFrame, SeriesStore, downsample
+from worker_role import runs_background_jobs
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Optional
 
 load_dotenv()
 
+configure_logging()
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 # Add CORS middleware
@@ -23,12 +52,110 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+@app.middleware("http")
+async def flag_stale_responses(request: Request, call_next):
+    """Tell clients which upstream sources were served from stale cache."""
+    sources = set()
+    stale_sources.set(sources)
+    response = await call_next(request)
+    if sources:
+        response.headers["X-Data-Stale"] = ",".join(sorted(sources))
+    return response
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Assign a request id, echo it back and time the request."""
+    rid = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    request_id.set(rid)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        http_request_duration.observe(time.perf_counter() - started, method=request.method, route=route, status=status)
+    response.headers["X-Request-ID"] = rid
+    return response
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open(request: Request, exc: CircuitOpenError):
+    """An upstream with an open circuit was needed; tell the client when to retry."""
+    return JSONResponse(
+        {"error": str(exc)}, status_code=503, headers={"Retry-After": str(int(exc.retry_after) + 1)}
+    )
+
 
 BITSCRUNCH_API_KEY = os.getenv("BITSCRUNCH_API_KEY")
 GRADIENTAI_KEY = os.getenv("MODEL_ACCESS_KEY")
-GRADIENTAI_URL = "https://tofi3x35k5q62sti3ofx4lcu.agents.do-ai.run/api/v1/chat/completions"
+GRADIENTAI_URL = os.getenv("GRADIENTAI_URL", "https://tofi3x35k5q62sti3ofx4lcu.agents.do-ai.run/api/v1/chat/completions")
+
+# Fan-out limits for the aggregate /advanced-* endpoints
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", 7))
+FANOUT_TIMEOUT = float(os.getenv("FANOUT_TIMEOUT", 15))
+
+# How many wallets/collections smart_query analyses, and how many it fetches at once
+SMART_QUERY_MAX_WALLETS = int(os.getenv("SMART_QUERY_MAX_WALLETS", 20))
+SMART_QUERY_MAX_COLLECTIONS = int(os.getenv("SMART_QUERY_MAX_COLLECTIONS", 20))
+SMART_QUERY_CONCURRENCY = int(os.getenv("SMART_QUERY_CONCURRENCY", 8))
+# Time budget for one smart_query answer; the data fetch stops early enough to leave
+# SMART_QUERY_ANSWER_RESERVE seconds for the final LLM call
+SMART_QUERY_DEADLINE = float(os.getenv("SMART_QUERY_DEADLINE", 45))
+SMART_QUERY_ANSWER_RESERVE = float(os.getenv("SMART_QUERY_ANSWER_RESERVE", 15))
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# Market-wide datasets kept warm in the background
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() in ("1", "true", "yes")
+PREFETCH_INTERVAL = int(os.getenv("PREFETCH_INTERVAL", 60))
+PREFETCH_BLOCKCHAINS = os.getenv("PREFETCH_BLOCKCHAINS", "ethereum").split(",")
+PREFETCH_TIME_RANGES = os.getenv("PREFETCH_TIME_RANGES", "24h,7d").split(",")
+
+# Local history of upstream metrics, used for trends without calling upstream
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "true").lower() in ("1", "true", "yes")
+HISTORY_CONTEXT_DAYS = float(os.getenv("HISTORY_CONTEXT_DAYS", 7))
 
-bits_api = BitsCrunchAPI(BITSCRUNCH_API_KEY)
+history_store = HistoryStore() if HISTORY_ENABLED else None
+# Shared across gunicorn workers when CACHE_BACKEND_URL is set
+shared_cache = build_cache_backend()
+bits_api = AsyncBitsCrunchAPI(BITSCRUNCH_API_KEY, history=history_store, shared=shared_cache)
+gradient = GradientClient(GRADIENTAI_KEY, GRADIENTAI_URL)
+intent_router = build_default_router()
+
+# Final smart_query answers keyed on normalised query + action + fetched data
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 300))
+answer_cache = TTLCache(maxsize=int(os.getenv("ANSWER_CACHE_MAXSIZE", 1024)))
+
+# Downsampled chart series, rebuilt once the underlying analytics response expires
+CHART_TTL = cache_ttl_for("nft/collection/analytics")
+chart_store = SeriesStore()
+_chart_warmups = {}
+
+# User profiles behind an in-memory read-through cache
+profile_store = CachedProfileStore(SQLiteProfileStore(), shared=shared_cache)
+_background_tasks = set()
+
+# Portfolio summaries for saved users, refreshed in the background
+PORTFOLIO_PRECOMPUTE_ENABLED = os.getenv("PORTFOLIO_PRECOMPUTE_ENABLED", "true").lower() in ("1", "true", "yes")
+portfolios = PortfolioPrecomputer(bits_api, profile_store, shared=shared_cache)
+
+@app.on_event("startup")
+async def start_history_writer():
+    if history_store is not None:
+        history_store.start()
+
+@app.on_event("startup")
+async def start_portfolio_precomputation():
+    if PORTFOLIO_PRECOMPUTE_ENABLED and runs_background_jobs():
+        portfolios.start()
+
+@app.on_event("shutdown")
+async def close_upstream_clients():
+    await prefetcher.stop()
+    await portfolios.stop()
+    await bits_api.aclose()
+    await gradient.aclose()
+    if history_store is not None:
+        await asyncio.to_thread(history_store.stop)
 
 class QueryRequest(BaseModel):
     query: str
@@ -48,6 +175,58 @@ async def root():
 async def test_cors():
     return {"message": "CORS test"}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the BitsCrunch response cache"""
+    return {
+        "bitscrunch": bits_api.cache.stats(),
+        "coalescing": bits_api.inflight.stats(),
+        "intent_router": intent_router.stats(),
+        "answers": answer_cache.stats(),
+        "prompt_data": prompt_stats.stats(),
+        "rate_limiter": bits_api.rate_limiter.stats(),
+        "snapshots": prefetcher.stats(),
+        "charts": chart_store.stats(),
+        "history": history_store.stats() if history_store is not None else None,
+        "profiles": profile_store.stats(),
+        "portfolios": portfolios.stats(),
+        "shared_cache": shared_cache.stats() if shared_cache is not None else None,
+        "circuits": _circuit_stats()
+    }
+
+def _circuit_stats():
+    return {**bits_api.breaker_stats(), gradient.breaker.name: gradient.breaker.stats()}
+
+def _cache_gauges():
+    gauges = []
+    caches = {"bitscrunch": bits_api.cache.stats(), "answers": answer_cache.stats()}
+    for cache_name, stats in caches.items():
+        for field in ("hits", "misses", "stale_hits", "evictions"):
+            gauges.append((f"aegis_cache_{field}_total", f"Cache {field.replace('_', ' ')}", {"cache": cache_name}, stats[field]))
+        gauges.append(("aegis_cache_size", "Cache entries", {"cache": cache_name}, stats["size"]))
+        gauges.append(("aegis_cache_hit_rate", "Cache hit rate", {"cache": cache_name}, stats["hit_rate"]))
+    coalescing = bits_api.inflight.stats()
+    gauges.append(("aegis_coalesced_requests_total", "Upstream calls answered by an in-flight request", {}, coalescing["coalesced"]))
+    gauges.append(("aegis_inflight_requests", "Upstream requests currently in flight", {}, coalescing["in_flight"]))
+    for lane, stats in bits_api.rate_limiter.stats()["lanes"].items():
+        gauges.append(("aegis_rate_limit_avg_wait_seconds", "Average rate-limiter queueing delay", {"lane": lane}, stats["avg_wait_seconds"]))
+        gauges.append(("aegis_rate_limit_max_wait_seconds", "Maximum rate-limiter queueing delay", {"lane": lane}, stats["max_wait_seconds"]))
+    for name, stats in _circuit_stats().items():
+        gauges.append(("aegis_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", {"circuit": name}, STATE_VALUES[stats["state"]]))
+        gauges.append(("aegis_circuit_failure_rate", "Failure rate in the circuit breaker window", {"circuit": name}, stats["failure_rate"]))
+        gauges.append(("aegis_circuit_rejected_total", "Calls failed fast by an open circuit", {"circuit": name}, stats["rejected"]))
+    router = intent_router.stats()
+    gauges.append(("aegis_intent_router_local_total", "Smart queries routed without the decision LLM", {}, router["routed_locally"]))
+    gauges.append(("aegis_intent_router_deferred_total", "Smart queries deferred to the decision LLM", {}, router["deferred_to_llm"]))
+    return gauges
+
+registry.register_gauges(_cache_gauges)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/query")
 async def process_query(request: QueryRequest):
     # First, let AI determine what data is needed
@@ -70,33 +249,11 @@ async def process_query(request: QueryRequest):
     """
 
     # Get AI decision on what data to fetch
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {GRADIENTAI_KEY}"
-    }
-
-    decision_payload = {
-        "messages": [
-            {
-                "role": "user",
-                "content": analysis_prompt
-            }
-        ],
-        "stream": False,
-        "include_functions_info": False,
-        "include_retrieval_info": False,
-        "include_guardrails_info": False
-    }
-
-    decision_response = requests.post(GRADIENTAI_URL, headers=headers, json=decision_payload)
-    
     try:
-        decision_data = decision_response.json()
+        decision_data = await gradient.chat(analysis_prompt)
         decision_content = decision_data["choices"][0]["message"]["content"]
         
         # Parse the JSON response (you might want to add better JSON parsing)
-        import json
-        import re
         json_match = re.search(r'\{.*\}', decision_content, re.DOTALL)
         if json_match:
             decision = json.loads(json_match.group())
@@ -121,46 +278,27 @@ async def process_query(request: QueryRequest):
     
     try:
         if action == "wallet_health" and request.wallet_address:
-            data = bits_api.get_wallet_health(request.wallet_address)
+            data = await bits_api.get_wallet_health(request.wallet_address)
         elif action == "nft_valuation" and request.collection_id and request.token_id:
-            data = bits_api.get_nft_valuation(request.token_id, request.collection_id)
+            data = await bits_api.get_nft_valuation(request.token_id, request.collection_id)
         elif action == "collection_stats" and request.collection_id:
-            data = bits_api.get_collection_stats(request.collection_id)
+            data = await bits_api.get_collection_stats(request.collection_id)
         else:
-            data = bits_api.get_risk_scores(request.collection_id or "default")
+            data = await bits_api.get_risk_scores(request.collection_id or "default")
     except Exception as e:
         return {"error": f"Failed to fetch NFT data: {str(e)}"}
 
     # Construct prompt for the final response
     user_prompt = (
         f"User asked: '{request.query}'. "
-        f"Based on analysis, I fetched {action} data: {data}. "
+        f"Based on analysis, I fetched {action} data: {compact_prompt_data(action, data)}. "
         f"AI reasoning: {decision.get('reasoning', '')}. "
         f"Provide a helpful response in a friendly, concise tone under 200 words, "
         f"focusing on the key insights. End with 'Stay safe in the NFT market!'"
     )
 
     # Agent API call
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {GRADIENTAI_KEY}"
-    }
-
-    payload = {
-        "messages": [
-            {
-                "role": "user",
-                "content": user_prompt
-            }
-        ],
-        "stream": False,
-        "include_functions_info": False,
-        "include_retrieval_info": False,
-        "include_guardrails_info": False
-    }
-
-    response = requests.post(GRADIENTAI_URL, headers=headers, json=payload)
-    response_data = response.json()
+    response_data = await gradient.chat(user_prompt)
 
     try:
         llm_response = response_data["choices"][0]["message"]["content"]
@@ -175,14 +313,32 @@ async def get_collection_stats(request: dict):
     collection_id = request.get("collection_id")
     if not collection_id:
         return {"error": "Missing collection_id"}
-    return bits_api.get_collection_stats(collection_id)
+    return await bits_api.get_collection_stats(collection_id)
 
 @app.post("/get-wallet-health")
 async def get_wallet_health(request: dict):
     wallet_address = request.get("wallet_address")
     if not wallet_address:
         return {"error": "Missing wallet_address"}
-    return bits_api.get_wallet_health(wallet_address)
+    return await bits_api.get_wallet_health(wallet_address)
+
+@app.post("/get-collection-stats/batch")
+async def get_collection_stats_batch(request: dict):
+    """Stats for many collections in as few upstream calls as possible, keyed by contract address"""
+    collection_ids = request.get("collection_ids") or []
+    if not collection_ids:
+        return {"error": "Missing collection_ids"}
+    blockchain = request.get("blockchain", "ethereum")
+    return {"results": await bits_api.get_collection_stats_batch(collection_ids, blockchain=blockchain)}
+
+@app.post("/get-wallet-health/batch")
+async def get_wallet_health_batch(request: dict):
+    """Health scores for many wallets in as few upstream calls as possible, keyed by wallet address"""
+    wallet_addresses = request.get("wallet_addresses") or []
+    if not wallet_addresses:
+        return {"error": "Missing wallet_addresses"}
+    blockchain = request.get("blockchain", "ethereum")
+    return {"results": await bits_api.get_wallet_health_batch(wallet_addresses, blockchain=blockchain)}
 
 @app.post("/get-nft-valuation")
 async def get_nft_valuation(request: dict):
@@ -190,19 +346,80 @@ async def get_nft_valuation(request: dict):
     collection_id = request.get("collection_id")
     if not (token_id and collection_id):
         return {"error": "Missing token_id or collection_id"}
-    return bits_api.get_nft_valuation(collection_id, token_id)
+    return await bits_api.get_nft_valuation(collection_id, token_id)
+
+CHART_METRIC_LABELS = {"volume": "Volume (USD)", "sales": "Sales", "transactions": "Transactions", "assets": "Assets"}
+
+async def _load_chart_frame(collection_id, blockchain, time_range):
+    """Columnar analytics trends for one collection and time range, from the store or upstream.
+
+    Raises ``ValueError`` instead of storing a frame when upstream returns no trend points.
+    """
+    key = (collection_id.lower(), blockchain, time_range)
+    frame = chart_store.get(key, CHART_TTL)
+    if frame is None:
+        rows = await bits_api.get_collection_analytics(
+            contract_address=[collection_id], blockchain=blockchain, time_range=time_range, limit=1
+        )
+        frame = SeriesFrame.from_analytics(rows)
+        if not len(frame):
+            raise ValueError(f"No analytics trends for {collection_id} over {time_range}")
+        chart_store.put(key, frame)
+    return frame
+
+def _warm_chart_ranges(collection_id, blockchain, requested):
+    """Load the other time ranges in the background so switching ranges is instant."""
+    key = (collection_id.lower(), blockchain)
+    stale = [time_range for time_range in TIME_RANGES
+             if time_range != requested and not chart_store.fresh((*key, time_range), CHART_TTL)]
+    if key in _chart_warmups or not stale:
+        return
+
+    async def warm():
+        with priority_scope(PRIORITY_BACKGROUND):
+            await gather_partial({
+                time_range: _load_chart_frame(collection_id, blockchain, time_range)
+                for time_range in stale
+            }, concurrency=2)
+
+    _chart_warmups[key] = asyncio.ensure_future(warm())
+    _chart_warmups[key].add_done_callback(lambda _: _chart_warmups.pop(key, None))
 
 @app.get("/chart-data/{collection_id}")
-async def get_chart_data(collection_id: str):
-    stats = bits_api.get_collection_stats(collection_id)
-    # Parse real data (replace with actual fields)
+async def get_chart_data(collection_id: str, metric: str = "volume", time_range: str = "30d",
+                         points: int = DEFAULT_POINTS, method: str = "lttb", blockchain: str = "ethereum"):
+    """Chart.js line chart of a collection metric, downsampled to ``points`` points"""
+    if time_range not in TIME_RANGES:
+        return {"error": f"Unsupported time_range: {time_range}"}
+    if method not in DOWNSAMPLERS:
+        return {"error": f"Unsupported method: {method}"}
+    try:
+        frame = await _load_chart_frame(collection_id, blockchain, time_range)
+        metrics = sorted(frame.columns)
+        if metric not in frame.columns:
+            return {"error": f"Unsupported metric: {metric}", "metrics": metrics}
+        timestamps, values = frame.series(metric)
+    except Exception as e:
+        if history_store is None:
+            return {"error": f"Failed to fetch chart data: {str(e)}"}
+        # Upstream is down: draw the trend we recorded last time instead
+        entity = entity_key("collection", collection_id, blockchain)
+        timestamps, values = await asyncio.to_thread(history_store.query, entity, f"analytics.{metric}_trend_{time_range}")
+        if not timestamps:
+            return {"error": f"Failed to fetch chart data: {str(e)}"}
+        metrics = [metric]
+    else:
+        _warm_chart_ranges(collection_id, blockchain, time_range)
+
+    xs, ys = downsample(timestamps, values, points, method)
+    label = CHART_METRIC_LABELS.get(metric, metric.replace("_", " ").title())
     chart = {
         "type": "line",
         "data": {
-            "labels": ["Day 1", "Day 7", "Day 14", "Day 21", "Day 30"],
+            "labels": [time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts)) for ts in xs],
             "datasets": [{
-                "label": f"{collection_id} Floor Price",
-                "data": [10, 12, 15, 14, 15.5],  # Replace with stats.get("floor_price", [])
+                "label": f"{collection_id} {label}",
+                "data": ys,
                 "borderColor": "#2196F3",
                 "backgroundColor": "rgba(33, 150, 243, 0.2)",
                 "fill": True
@@ -211,36 +428,130 @@ async def get_chart_data(collection_id: str):
         "options": {
             "responsive": True,
             "scales": {
-                "y": {"title": {"display": True, "text": "Price (ETH)"}},
+                "y": {"title": {"display": True, "text": label}},
                 "x": {"title": {"display": True, "text": "Time"}}
             }
+        },
+        "meta": {
+            "metric": metric,
+            "metrics": metrics,
+            "time_range": time_range,
+            "method": method,
+            "points": len(xs),
+            "source_points": len(timestamps)
         }
     }
     return chart
 
+@app.get("/history/{kind}/{entity_id}")
+async def get_history(kind: str, entity_id: str, metric: Optional[str] = None, start: Optional[int] = None,
+                      end: Optional[int] = None, points: int = DEFAULT_POINTS, blockchain: str = "ethereum"):
+    """Recorded history of a wallet, collection or market metric, served locally without calling upstream"""
+    if history_store is None:
+        return {"error": "History store is disabled"}
+    if kind not in ("wallet", "collection", "market"):
+        return {"error": f"Unsupported entity kind: {kind}"}
+    entity = entity_key(kind, entity_id, blockchain)
+    if metric is None:
+        return {"entity": entity, "metrics": await asyncio.to_thread(history_store.metrics, entity)}
+
+    timestamps, values = await asyncio.to_thread(history_store.query, entity, metric, start, end)
+    xs, ys = downsample(timestamps, values, points)
+    return {
+        "entity": entity,
+        "metric": metric,
+        "points": [[int(ts), value] for ts, value in zip(xs, ys)],
+        "source_points": len(timestamps)
+    }
+
+async def _history_context(action, decision, user_wallets, user_collections):
+    """Recorded metric changes over the last few days for the entities an action is about."""
+    if history_store is None:
+        return None
+    if action in ("wallet_overview", "wallet_comparison", "portfolio_analysis"):
+        target = decision.get("target_wallet")
+        entities = [("wallet", wallet) for wallet in ([target] if target else user_wallets[:SMART_QUERY_MAX_WALLETS])]
+    elif action in ("collection_stats", "collection_performance", "risk_analysis", "whale_analysis"):
+        target = decision.get("target_collection")
+        entities = [("collection", c) for c in ([target] if target else user_collections[:SMART_QUERY_MAX_COLLECTIONS])]
+    else:
+        return None
+
+    since = time.time() - HISTORY_CONTEXT_DAYS * 86400
+    summaries = await asyncio.to_thread(
+        lambda: {entity_id: history_store.summary(entity_key(kind, entity_id), since) for kind, entity_id in entities}
+    )
+    return {entity_id: summary for entity_id, summary in summaries.items() if summary} or None
+
+# Loaders for market-wide datasets, shared by the routes and the prefetch scheduler
+async def _load_market_insights():
+    analytics, holders, traders, scores = await asyncio.gather(
+        bits_api.get_market_analytics(),
+        bits_api.get_holder_insights(),
+        bits_api.get_trader_insights(),
+        bits_api.get_market_scores()
+    )
+    return {"analytics": analytics, "holders": holders, "traders": traders, "scores": scores}
+
+async def _load_trending_collections(blockchain, time_range):
+    return await bits_api.get_collection_analytics(
+        blockchain=blockchain,
+        time_range=time_range,
+        sort_by="volume",
+        limit=20
+    )
+
+async def _load_marketplace_analytics(blockchain):
+    marketplace_stats, marketplace_metadata = await asyncio.gather(
+        bits_api.get_marketplace_analytics(blockchain=blockchain),
+        bits_api.get_marketplace_metadata()
+    )
+    return {"marketplace_stats": marketplace_stats, "marketplace_metadata": marketplace_metadata}
+
+async def _load_collection_categories(blockchain):
+    return await bits_api.get_collection_categories(
+        blockchain=blockchain,
+        sort_by="volume",
+        limit=50
+    )
+
+prefetcher = SnapshotScheduler(interval=PREFETCH_INTERVAL, shared=shared_cache)
+prefetcher.register("market-insights", _load_market_insights)
+for _blockchain in PREFETCH_BLOCKCHAINS:
+    prefetcher.register(f"marketplace-analytics:{_blockchain}", partial(_load_marketplace_analytics, _blockchain))
+    prefetcher.register(f"collection-categories:{_blockchain}", partial(_load_collection_categories, _blockchain))
+    for _time_range in PREFETCH_TIME_RANGES:
+        prefetcher.register(f"trending:{_blockchain}:{_time_range}", partial(_load_trending_collections, _blockchain, _time_range))
+
+@app.on_event("startup")
+async def start_prefetcher():
+    if PREFETCH_ENABLED and runs_background_jobs():
+        prefetcher.start()
+
+async def _serve_snapshot(response: Response, name, loader):
+    """Serve the warm snapshot for ``name`` if there is one, else call upstream."""
+    snapshot = await prefetcher.get(name)
+    if snapshot is None:
+        return await loader()
+    response.headers["X-Snapshot-Fetched-At"] = str(int(snapshot["fetched_at"]))
+    response.headers["X-Snapshot-Age"] = f"{time.time() - snapshot['fetched_at']:.1f}"
+    return snapshot["data"]
+
 # New enhanced endpoints using BitsCrunch V2 API
 @app.get("/market-insights")
-async def get_market_insights():
+async def get_market_insights(response: Response):
     """Get overall NFT market analytics and trends"""
     try:
-        return {
-            "analytics": bits_api.get_market_analytics(),
-            "holders": bits_api.get_holder_insights(),
-            "traders": bits_api.get_trader_insights(),
-            "scores": bits_api.get_market_scores()
-        }
+        return await _serve_snapshot(response, "market-insights", _load_market_insights)
     except Exception as e:
         return {"error": f"Failed to fetch market insights: {str(e)}"}
 
 @app.get("/trending-collections")
-async def get_trending_collections(blockchain: str = "ethereum", time_range: str = "24h"):
+async def get_trending_collections(response: Response, blockchain: str = "ethereum", time_range: str = "24h"):
     """Get trending NFT collections"""
     try:
-        return bits_api.get_collection_analytics(
-            blockchain=blockchain,
-            time_range=time_range,
-            sort_by="volume",
-            limit=20
+        return await _serve_snapshot(
+            response, f"trending:{blockchain}:{time_range}", partial(_load_trending_collections, blockchain, time_range)
         )
     except Exception as e:
         return {"error": f"Failed to fetch trending collections: {str(e)}"}
@@ -249,18 +560,32 @@ async def get_trending_collections(blockchain: str = "ethereum", time_range: str
 async def get_collection_traits(collection_id: str, blockchain: str = "ethereum"):
     """Get traits and rarity data for a collection"""
     try:
-        return bits_api.get_collection_traits(
+        return await bits_api.get_collection_traits(
             contract_address=collection_id,
             blockchain=blockchain
         )
     except Exception as e:
         return {"error": f"Failed to fetch collection traits: {str(e)}"}
 
+@app.get("/collection-owners/{collection_id}")
+async def get_collection_owners(collection_id: str, blockchain: str = "ethereum", max_items: Optional[int] = None):
+    """Stream the complete owner list of a collection as newline-delimited JSON"""
+    async def owners():
+        try:
+            async for owner in bits_api.iter_items(
+                bits_api.get_collection_owners, contract_address=collection_id, blockchain=blockchain, max_items=max_items
+            ):
+                yield json.dumps(owner, default=str) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"Failed to fetch collection owners: {str(e)}"}) + "\n"
+    
+    return StreamingResponse(owners(), media_type="application/x-ndjson")
+
 @app.get("/whale-activity/{collection_id}")
 async def get_whale_activity(collection_id: str, blockchain: str = "ethereum"):
     """Get whale activity for a specific collection"""
     try:
-        return bits_api.get_collection_whales(
+        return await bits_api.get_collection_whales(
             contract_address=collection_id,
             blockchain=blockchain,
             time_range="24h"
@@ -269,13 +594,12 @@ async def get_whale_activity(collection_id: str, blockchain: str = "ethereum"):
         return {"error": f"Failed to fetch whale activity: {str(e)}"}
 
 @app.get("/marketplace-analytics")
-async def get_marketplace_analytics(blockchain: str = "ethereum"):
+async def get_marketplace_analytics(response: Response, blockchain: str = "ethereum"):
     """Get marketplace analytics and performance"""
     try:
-        return {
-            "marketplace_stats": bits_api.get_marketplace_analytics(blockchain=blockchain),
-            "marketplace_metadata": bits_api.get_marketplace_metadata()
-        }
+        return await _serve_snapshot(
+            response, f"marketplace-analytics:{blockchain}", partial(_load_marketplace_analytics, blockchain)
+        )
     except Exception as e:
         return {"error": f"Failed to fetch marketplace analytics: {str(e)}"}
 
@@ -283,18 +607,16 @@ async def get_marketplace_analytics(blockchain: str = "ethereum"):
 async def get_wallet_profile(wallet_address: str):
     """Get comprehensive wallet profile including holdings and classifications"""
     try:
-        return bits_api.get_wallet_profile(wallet=wallet_address)
+        return await bits_api.get_wallet_profile(wallet=wallet_address)
     except Exception as e:
         return {"error": f"Failed to fetch wallet profile: {str(e)}"}
 
 @app.get("/collection-categories")
-async def get_collection_categories(blockchain: str = "ethereum"):
+async def get_collection_categories(response: Response, blockchain: str = "ethereum"):
     """Get collections organized by categories"""
     try:
-        return bits_api.get_collection_categories(
-            blockchain=blockchain,
-            sort_by="volume",
-            limit=50
+        return await _serve_snapshot(
+            response, f"collection-categories:{blockchain}", partial(_load_collection_categories, blockchain)
         )
     except Exception as e:
         return {"error": f"Failed to fetch collection categories: {str(e)}"}
@@ -308,18 +630,16 @@ async def advanced_collection_analysis(request: dict):
     if not contract_address:
         return {"error": "Missing contract_address"}
     
-    try:
-        return {
-            "analytics": bits_api.get_collection_analytics(contract_address=[contract_address], blockchain=blockchain),
-            "holders": bits_api.get_collection_holders(contract_address=[contract_address], blockchain=blockchain),  
-            "traders": bits_api.get_collection_traders(contract_address=[contract_address], blockchain=blockchain),
-            "scores": bits_api.get_collection_scores(contract_address=[contract_address], blockchain=blockchain),
-            "whales": bits_api.get_collection_whales(contract_address=[contract_address], blockchain=blockchain),
-            "washtrade": bits_api.get_collection_washtrade(contract_address=[contract_address], blockchain=blockchain),
-            "profile": bits_api.get_collection_profile(contract_address=[contract_address], blockchain=blockchain)
-        }
-    except Exception as e:
-        return {"error": f"Failed to fetch advanced collection analysis: {str(e)}"}
+    contract = [contract_address]
+    return await gather_partial({
+        "analytics": bits_api.get_collection_analytics(contract_address=contract, blockchain=blockchain),
+        "holders": bits_api.get_collection_holders(contract_address=contract, blockchain=blockchain),
+        "traders": bits_api.get_collection_traders(contract_address=contract, blockchain=blockchain),
+        "scores": bits_api.get_collection_scores(contract_address=contract, blockchain=blockchain),
+        "whales": bits_api.get_collection_whales(contract_address=contract, blockchain=blockchain),
+        "washtrade": bits_api.get_collection_washtrade(contract_address=contract, blockchain=blockchain),
+        "profile": bits_api.get_collection_profile(contract_address=contract, blockchain=blockchain)
+    }, concurrency=FANOUT_CONCURRENCY, timeout=FANOUT_TIMEOUT)
 
 @app.post("/advanced-wallet-analysis") 
 async def advanced_wallet_analysis(request: dict):
@@ -330,16 +650,14 @@ async def advanced_wallet_analysis(request: dict):
     if not wallet_address:
         return {"error": "Missing wallet_address"}
     
-    try:
-        return {
-            "analytics": bits_api.get_wallet_analytics(wallet=[wallet_address], blockchain=blockchain),
-            "scores": bits_api.get_wallet_scores(wallet=[wallet_address], blockchain=blockchain),
-            "traders": bits_api.get_wallet_traders(wallet=[wallet_address], blockchain=blockchain),
-            "washtrade": bits_api.get_wallet_washtrade(wallet=[wallet_address], blockchain=blockchain),
-            "profile": bits_api.get_wallet_profile(wallet=[wallet_address])
-        }
-    except Exception as e:
-        return {"error": f"Failed to fetch advanced wallet analysis: {str(e)}"}
+    wallet = [wallet_address]
+    return await gather_partial({
+        "analytics": bits_api.get_wallet_analytics(wallet=wallet, blockchain=blockchain),
+        "scores": bits_api.get_wallet_scores(wallet=wallet, blockchain=blockchain),
+        "traders": bits_api.get_wallet_traders(wallet=wallet, blockchain=blockchain),
+        "washtrade": bits_api.get_wallet_washtrade(wallet=wallet, blockchain=blockchain),
+        "profile": bits_api.get_wallet_profile(wallet=wallet)
+    }, concurrency=FANOUT_CONCURRENCY, timeout=FANOUT_TIMEOUT)
 
 
 
@@ -355,15 +673,19 @@ class SmartQueryRequest(BaseModel):
     user_id: Optional[str] = None
     user_wallets: List[str] = []  # Frontend sends wallets directly
     user_collections: List[str] = []  # Frontend sends collections directly
+    stream: bool = False  # Stream the answer as Server-Sent Events
 
 # Enhanced query endpoint that uses user profile data
-@app.post("/smart-query")
-async def smart_query(request: SmartQueryRequest):
-    """
-    Smart query that can fetch user's wallet data automatically
+async def _decide_smart_query_action(request: SmartQueryRequest, user_wallets, user_collections):
+    """Pick the action that answers the query.
+
+    High-confidence intents are routed locally; everything else goes to the
+    LLM. Returns ``(decision, early_response)``; ``early_response`` is set when
+    the user has to supply more data before anything can be fetched.
     """
-    user_wallets = request.user_wallets
-    user_collections = request.user_collections
+    decision = intent_router.route(request.query, user_wallets, user_collections)
+    if decision:
+        return decision, None
     
     # IMPROVED: More specific and directive AI prompt with granular actions
     analysis_prompt = f"""
@@ -410,571 +732,793 @@ async def smart_query(request: SmartQueryRequest):
     }}
     """
     
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {GRADIENTAI_KEY}"
-    }
-    
-    decision_payload = {
-        "messages": [{"role": "user", "content": analysis_prompt}],
-        "stream": False,
-        "include_functions_info": False,
-        "include_retrieval_info": False,
-        "include_guardrails_info": False
-    }
-    
-    try:
-        decision_response = requests.post(GRADIENTAI_URL, headers=headers, json=decision_payload)
-        decision_data = decision_response.json()
-        decision_content = decision_data["choices"][0]["message"]["content"]
-        
-        import json
-        import re
-        # More robust JSON extraction
-        json_match = re.search(r'\{[\s\S]*\}', decision_content, re.DOTALL)
-        if json_match:
-            decision = json.loads(json_match.group())
+    decision_data = await gradient.chat(analysis_prompt)
+    decision_content = decision_data["choices"][0]["message"]["content"]
+
+    # More robust JSON extraction
+    json_match = re.search(r'\{[\s\S]*\}', decision_content, re.DOTALL)
+    if json_match:
+        decision = json.loads(json_match.group())
+    else:
+        # Fallback: assume wallet overview if we have wallets
+        if user_wallets:
+            decision = {
+                "action": "wallet_overview",
+                "target_wallet": user_wallets[0],
+                "reasoning": "Fallback to wallet overview",
+                "needs_user_input": False,
+                "response_focus": "wallet performance"
+            }
         else:
-            # Fallback: assume wallet overview if we have wallets
-            if user_wallets:
-                decision = {
-                    "action": "wallet_overview",
-                    "target_wallet": user_wallets[0],
-                    "reasoning": "Fallback to wallet overview",
-                    "needs_user_input": False,
-                    "response_focus": "wallet performance"
-                }
-            else:
-                return {
-                    "needs_input": True,
-                    "message": "I need your wallet address or collection information to help you.",
-                    "reasoning": "No user data available"
-                }
-        
-        # IMPROVED: Only return needs_input if absolutely necessary
-        if decision.get("needs_user_input", False) and not user_wallets and not user_collections:
-            return {
+            return None, {
                 "needs_input": True,
-                "message": "I need your wallet address or collection information to help you better.",
-                "reasoning": decision.get("reasoning", "")
+                "message": "I need your wallet address or collection information to help you.",
+                "reasoning": "No user data available"
             }
-        
-        # Fetch data based on action
-        data = None
-        action = decision.get("action")
-        
-        if action == "general_conversation":
-            # No data fetching needed for general conversation
-            data = {
-                "user_context": {
-                    "wallet_count": len(user_wallets),
-                    "collection_count": len(user_collections),
-                    "has_portfolio": len(user_wallets) > 0 or len(user_collections) > 0
-                }
+
+    # IMPROVED: Only return needs_input if absolutely necessary
+    if decision.get("needs_user_input", False) and not user_wallets and not user_collections:
+        return None, {
+            "needs_input": True,
+            "message": "I need your wallet address or collection information to help you better.",
+            "reasoning": decision.get("reasoning", "")
+        }
+    
+    return decision, None
+
+
+async def _fetch_smart_query_data(request: SmartQueryRequest, decision, user_wallets, user_collections):
+    """Fetch the BitsCrunch data needed for the chosen action."""
+    # Fetch data based on action
+    data = None
+    action = decision.get("action")
+
+    if action == "general_conversation":
+        # No data fetching needed for general conversation
+        data = {
+            "user_context": {
+                "wallet_count": len(user_wallets),
+                "collection_count": len(user_collections),
+                "has_portfolio": len(user_wallets) > 0 or len(user_collections) > 0
             }
-        
-        elif action == "wallet_overview":
-            if user_wallets:
-                # Get data for the first wallet or specified wallet
-                target_wallet = decision.get("target_wallet") or user_wallets[0]
-                try:
-                    wallet_data = bits_api.get_wallet_health(target_wallet)
-                    data = {
-                        "wallet_count": len(user_wallets),
-                        "current_wallet": target_wallet,
-                        "wallet_data": wallet_data,
-                        "has_data": bool(wallet_data and len(str(wallet_data).strip()) > 2)  # Check if more than just []
-                    }
-                except Exception as e:
-                    data = {
-                        "wallet_count": len(user_wallets),
-                        "current_wallet": target_wallet,
-                        "wallet_data": None,
-                        "has_data": False,
-                        "error": str(e)
-                    }
-        
-        elif action == "wallet_comparison":
-            if len(user_wallets) >= 2:
-                # Compare up to 3 wallets for performance
-                data = {"comparison": [], "total_compared": min(len(user_wallets), 3), "successful_fetches": 0}
-                for i, wallet in enumerate(user_wallets[:3]):
-                    try:
-                        wallet_data = bits_api.get_wallet_health(wallet)
-                        has_data = wallet_data and len(str(wallet_data).strip()) > 2
-                        data["comparison"].append({
-                            "wallet_name": f"Wallet {i+1}",
-                            "address": wallet[:6] + "..." + wallet[-4:],
-                            "data": wallet_data,
-                            "full_address": wallet,
-                            "has_data": has_data
-                        })
-                        if has_data:
-                            data["successful_fetches"] += 1
-                    except Exception as e:
-                        data["comparison"].append({
-                            "wallet_name": f"Wallet {i+1}",
-                            "address": wallet[:6] + "..." + wallet[-4:],
-                            "data": None,
-                            "full_address": wallet,
-                            "has_data": False,
-                            "error": str(e)
-                        })
-            elif len(user_wallets) == 1:
-                # If only one wallet, show its performance over time
-                try:
-                    wallet_data = bits_api.get_wallet_health(user_wallets[0])
-                    has_data = wallet_data and len(str(wallet_data).strip()) > 2
-                    data = {
-                        "wallet_data": wallet_data,
-                        "comparison_note": "Only one wallet available - showing detailed analysis",
-                        "has_data": has_data
-                    }
-                except Exception as e:
-                    data = {
-                        "wallet_data": None,
-                        "comparison_note": "Only one wallet available - showing detailed analysis",
-                        "has_data": False,
-                        "error": str(e)
-                    }
-        
-        elif action == "collection_performance":
-            if user_collections:
-                # Get performance data for watchlisted collections
-                data = {"collections": [], "total_collections": len(user_collections)}
-                for collection in user_collections[:5]:  # Limit to 5 for performance
-                    try:
-                        collection_data = bits_api.get_collection_stats(collection)
-                        data["collections"].append({
-                            "collection_id": collection,
-                            "stats": collection_data
-                        })
-                    except Exception as e:
-                        continue
-            else:
-                # Fallback: get trending collections (you might want to implement this in BitsCrunch API)
-                data = {"message": "No watchlist collections found", "suggestion": "Add collections to your watchlist"}
-        
-        elif action == "market_trending":
-            # Get trending collections and market performance
+        }
+
+    elif action == "wallet_overview":
+        if user_wallets:
+            # Get data for the first wallet or specified wallet
+            target_wallet = decision.get("target_wallet") or user_wallets[0]
             try:
+                wallet_data = await bits_api.get_wallet_health(target_wallet)
                 data = {
-                    "trending_collections": bits_api.get_trending_collections(),
-                    "market_analytics": bits_api.get_market_insights(),
-                    "top_performers": bits_api.get_top_performing_collections()
+                    "wallet_count": len(user_wallets),
+                    "current_wallet": target_wallet,
+                    "wallet_data": wallet_data,
+                    "has_data": bool(wallet_data and len(str(wallet_data).strip()) > 2)  # Check if more than just []
                 }
             except Exception as e:
-                data = {"error": f"Failed to fetch trending data: {str(e)}"}
-        
-        elif action == "market_insights":
-            print("🔍 Processing market insights request...")
-            
-            # Extract blockchain and time_range from query
-            blockchain = "ethereum"
-            time_range = "24h"
-            
-            if "polygon" in request.query.lower():
-                blockchain = "polygon"
-            elif "bsc" in request.query.lower() or "binance" in request.query.lower():
-                blockchain = "bsc"
-            
-            if "7d" in request.query.lower() or "week" in request.query.lower():
-                time_range = "7d"
-            elif "30d" in request.query.lower() or "month" in request.query.lower():
-                time_range = "30d"
-            
-            print(f"📊 Getting market insights for {blockchain} over {time_range}")
-            
-            # Get comprehensive market insights using our new method
-            try:
-                data = bits_api.get_market_insights(blockchain=blockchain, time_range=time_range)
-                print(f"🔍 Market insights response: {data}")
-                
-                # Add debugging info to data
-                data["debug_info"] = {
-                    "blockchain": blockchain,
-                    "time_range": time_range,
-                    "query": request.query,
-                    "has_marketplace_data": data.get("has_marketplace_data", False)
+                data = {
+                    "wallet_count": len(user_wallets),
+                    "current_wallet": target_wallet,
+                    "wallet_data": None,
+                    "has_data": False,
+                    "error": str(e)
                 }
-                
-            except Exception as e:
-                print(f"❌ Error in market insights: {str(e)}")
-                data = {"error": f"Failed to fetch market insights: {str(e)}"}
-        
-        elif action == "collection_traits":
-            # Get traits and rarity data
-            if user_collections:
-                data = {"traits_analysis": []}
-                for collection in user_collections[:3]:
-                    try:
-                        traits_data = bits_api.get_collection_traits(collection)
-                        data["traits_analysis"].append({
-                            "collection_id": collection,
-                            "traits": traits_data
-                        })
-                    except Exception as e:
-                        continue
-            else:
-                data = {"message": "No collections available for traits analysis"}
-        
-        elif action == "whale_analysis":
-            # Get whale activity data
-            try:
-                data = {"whale_activity": []}
-                if user_collections:
-                    for collection in user_collections[:3]:
-                        try:
-                            whale_data = bits_api.get_collection_whales(collection)
-                            data["whale_activity"].append({
-                                "collection_id": collection,
-                                "whale_metrics": whale_data
-                            })
-                        except Exception as e:
-                            continue
-                else:
-                    # General market whale activity
-                    data["general_whale_activity"] = bits_api.get_market_whales()
-            except Exception as e:
-                data = {"error": f"Failed to fetch whale data: {str(e)}"}
-        
-        elif action == "risk_analysis":
-            # Comprehensive risk analysis
-            data = {"risk_summary": {"wallets": [], "collections": []}}
-            
-            # Analyze wallet risks
-            if user_wallets:
-                for i, wallet in enumerate(user_wallets[:3]):
-                    try:
-                        # Get risk scores for wallet
-                        risk_data = bits_api.get_risk_scores(wallet)
-                        wallet_health = bits_api.get_wallet_health(wallet)
-                        data["risk_summary"]["wallets"].append({
-                            "wallet": f"Wallet {i+1}",
-                            "address": wallet[:6] + "..." + wallet[-4:],
-                            "risk_score": risk_data,
-                            "health_indicators": wallet_health
-                        })
-                    except Exception as e:
-                        continue
-            
-            # Analyze collection risks
-            if user_collections:
-                for collection in user_collections[:3]:
-                    try:
-                        risk_data = bits_api.get_risk_scores(collection)
-                        collection_stats = bits_api.get_collection_stats(collection)
-                        data["risk_summary"]["collections"].append({
-                            "collection_id": collection,
-                            "risk_score": risk_data,
-                            "market_data": collection_stats
-                        })
-                    except Exception as e:
-                        continue
-        
-        elif action == "portfolio_analysis":
-            if user_wallets:
-                # Aggregate data from multiple wallets
-                data = {"portfolio_summary": [], "total_wallets": len(user_wallets)}
-                for i, wallet in enumerate(user_wallets[:3]):  # Limit to 3 for performance
-                    try:
-                        wallet_data = bits_api.get_wallet_health(wallet)
-                        data["portfolio_summary"].append({
-                            "wallet": f"Wallet {i+1}",
-                            "address": wallet[:6] + "..." + wallet[-4:],  # Shortened for display
-                            "data": wallet_data
-                        })
-                    except Exception as e:
-                        continue
-        
-        elif action == "collection_stats":
-            target_collection = decision.get("target_collection")
-            if target_collection:
-                data = bits_api.get_collection_stats(target_collection)
-            elif user_collections:
-                # Use first collection if no specific one mentioned
-                data = bits_api.get_collection_stats(user_collections[0])
-        
-        elif action == "nft_valuation":
-            if decision.get("target_collection") and decision.get("target_token"):
-                data = bits_api.get_nft_valuation(decision["target_token"], decision["target_collection"])
-        
-        # If no data was fetched or data is empty, provide a helpful fallback
-        if not data and user_wallets:
+
+    elif action == "wallet_comparison":
+        summary = await portfolios.current_summary(user_wallets[:SMART_QUERY_MAX_WALLETS]) if len(user_wallets) >= 2 else None
+        if summary is not None:
+            # Answer from the precomputed per-wallet data
+            data = {
+                "comparison": [
+                    {"wallet_name": f"Wallet {i+1}", "address": row["wallet"][:6] + "..." + row["wallet"][-4:], **row}
+                    for i, row in enumerate(summary["wallets"])
+                ],
+                "total_compared": summary["wallet_count"],
+                "total_portfolio_value": summary["total_portfolio_value"],
+                "washtrade_exposure": summary["washtrade_exposure"]
+            }
+        elif len(user_wallets) >= 2:
+            # Compare wallets for performance, fetched concurrently
+            wallets = user_wallets[:SMART_QUERY_MAX_WALLETS]
+            _run_in_background(portfolios.ensure_wallets(wallets))
+            data = {"comparison": [], "total_compared": len(wallets), "successful_fetches": 0}
+            results = await bounded_gather(
+                (bits_api.get_wallet_health(wallet) for wallet in wallets), SMART_QUERY_CONCURRENCY, timeout=remaining()
+            )
+            for i, (wallet, wallet_data) in enumerate(zip(wallets, results)):
+                if isinstance(wallet_data, Exception):
+                    data["comparison"].append({
+                        "wallet_name": f"Wallet {i+1}",
+                        "address": wallet[:6] + "..." + wallet[-4:],
+                        "data": None,
+                        "full_address": wallet,
+                        "has_data": False,
+                        "error": str(wallet_data)
+                    })
+                    continue
+                has_data = wallet_data and len(str(wallet_data).strip()) > 2
+                data["comparison"].append({
+                    "wallet_name": f"Wallet {i+1}",
+                    "address": wallet[:6] + "..." + wallet[-4:],
+                    "data": wallet_data,
+                    "full_address": wallet,
+                    "has_data": has_data
+                })
+                if has_data:
+                    data["successful_fetches"] += 1
+        elif len(user_wallets) == 1:
+            # If only one wallet, show its performance over time
             try:
-                wallet_data = bits_api.get_wallet_health(user_wallets[0])
+                wallet_data = await bits_api.get_wallet_health(user_wallets[0])
                 has_data = wallet_data and len(str(wallet_data).strip()) > 2
                 data = {
                     "wallet_data": wallet_data,
-                    "has_data": has_data,
-                    "wallet_address": user_wallets[0][:6] + "..." + user_wallets[0][-4:]
+                    "comparison_note": "Only one wallet available - showing detailed analysis",
+                    "has_data": has_data
                 }
-                action = "wallet_overview"
             except Exception as e:
                 data = {
                     "wallet_data": None,
+                    "comparison_note": "Only one wallet available - showing detailed analysis",
                     "has_data": False,
-                    "error": str(e),
-                    "wallet_address": user_wallets[0][:6] + "..." + user_wallets[0][-4:]
+                    "error": str(e)
                 }
-                action = "wallet_overview"
-        
-        # Generate contextual response based on action type
-        context_info = f"User has {len(user_wallets)} wallet(s) and {len(user_collections)} watched collection(s)."
-        
-        # Customize prompt based on action
-        if action == "general_conversation":
-            final_prompt = f"""
-            User said: "{request.query}"
-            Context: I am Aegis, an NFT Portfolio Assistant. {context_info}
-            
-            Respond to their greeting or general question in a friendly, helpful way:
-            - Acknowledge their message warmly
-            - Briefly introduce what I can help with (NFT analysis, portfolio tracking, risk assessment)
-            - If they have wallets/collections, mention I can analyze their portfolio
-            - If they don't have any data yet, suggest they add wallet addresses or collections
-            - Keep it conversational and under 100 words
-            - Don't end with "Stay safe in the NFT market!" for casual greetings
-            
-            Be natural and helpful, like a friendly financial advisor specializing in NFTs.
-            """
-        
-        elif action == "wallet_comparison":
-            final_prompt = f"""
-            User asked: "{request.query}"
-            Context: {context_info}
-            Action: Wallet Comparison Analysis
-            Data: {data}
-            
-            Compare the wallets based on the data provided. Highlight:
-            - Performance differences between wallets
-            - Which wallet is performing better and why
-            - Key metrics to focus on
-            - Recommendations for optimization
-            Keep under 200 words. End with "Stay safe in the NFT market!"
-            """
-        
-        elif action == "collection_performance":
-            final_prompt = f"""
-            User asked: "{request.query}"
-            Context: {context_info}
-            Action: Collection Performance Analysis
-            Data: {data}
-            
-            Analyze the performance of their watchlisted collections:
-            - Which collections are trending up/down
-            - Volume and price movements
-            - Market sentiment indicators
-            - Recommendations for collection management
-            Keep under 200 words. End with "Stay safe in the NFT market!"
-            """
-        
-        elif action == "market_trending":
-            final_prompt = f"""
-            User asked: "{request.query}"
-            Context: {context_info}
-            Action: Market Trending Analysis
-            Data: {data}
-            
-            Provide insights on trending collections and market performance:
-            - Top performing collections right now
-            - Market volume and activity trends
-            - Emerging opportunities
-            - What's hot in the NFT space
-            Keep under 200 words. End with "Stay safe in the NFT market!"
-            """
-        
-        elif action == "market_insights":
-            # Check if we have marketplace data and customize the prompt accordingly
-            has_marketplace_data = data.get("has_marketplace_data", False) if data else False
-            marketplace_data = data.get("marketplace_data", {}) if data else {}
-            
-            if has_marketplace_data and marketplace_data:
-                top_marketplace = marketplace_data.get("top_marketplace", {})
-                all_marketplaces = marketplace_data.get("all_marketplaces", [])
-                
-                # Create a detailed marketplace summary
-                marketplace_summary = f"Top Marketplace: {top_marketplace.get('name', 'Unknown')} with ${top_marketplace.get('volume', 0):,.2f} volume"
-                if all_marketplaces:
-                    marketplace_summary += f"\nAll Marketplaces: " + ", ".join([
-                        f"{mp.get('name', 'Unknown')} (${mp.get('volume', 0):,.2f})" 
-                        for mp in all_marketplaces[:3]
-                    ])
-                
-                final_prompt = f"""
-                User asked: "{request.query}"
-                Context: {context_info}
-                Action: NFT Market Insights with Real Marketplace Data
-                
-                CURRENT MARKETPLACE DATA:
-                {marketplace_summary}
-                Total Market Volume: ${marketplace_data.get('total_market_volume', 0):,.2f}
-                Total Market Sales: {marketplace_data.get('total_market_sales', 0):,}
-                Active Marketplaces: {marketplace_data.get('marketplace_count', 0)}
-                
-                Additional Market Data: {data}
-                
-                Based on the REAL marketplace data provided above, answer the user's specific question.
-                If they asked about "which marketplace has the best volume" or similar, reference the actual data.
-                Provide specific numbers and insights from the current market data.
-                Keep under 200 words. End with "Stay safe in the NFT market!"
-                """
+
+    elif action == "collection_performance":
+        if user_collections:
+            # Get performance data for watchlisted collections
+            data = {"collections": [], "total_collections": len(user_collections)}
+            collections = user_collections[:SMART_QUERY_MAX_COLLECTIONS]
+            results = await bounded_gather(
+                (bits_api.get_collection_stats(collection) for collection in collections), SMART_QUERY_CONCURRENCY, timeout=remaining()
+            )
+            for collection, collection_data in zip(collections, results):
+                if isinstance(collection_data, Exception):
+                    continue
+                data["collections"].append({
+                    "collection_id": collection,
+                    "stats": collection_data
+                })
+        else:
+            # Fallback: get trending collections (you might want to implement this in BitsCrunch API)
+            data = {"message": "No watchlist collections found", "suggestion": "Add collections to your watchlist"}
+
+    elif action == "market_trending":
+        # Get trending collections and market performance
+        try:
+            trending, market_analytics, top_performers = await asyncio.gather(
+                bits_api.get_trending_collections(),
+                bits_api.get_market_insights(),
+                bits_api.get_top_performing_collections()
+            )
+            data = {
+                "trending_collections": trending,
+                "market_analytics": market_analytics,
+                "top_performers": top_performers
+            }
+        except Exception as e:
+            data = {"error": f"Failed to fetch trending data: {str(e)}"}
+
+    elif action == "market_insights":
+        logger.debug("Processing market insights request", extra={"sampled": True})
+
+        # Extract blockchain and time_range from query
+        blockchain = "ethereum"
+        time_range = "24h"
+
+        if "polygon" in request.query.lower():
+            blockchain = "polygon"
+        elif "bsc" in request.query.lower() or "binance" in request.query.lower():
+            blockchain = "bsc"
+
+        if "7d" in request.query.lower() or "week" in request.query.lower():
+            time_range = "7d"
+        elif "30d" in request.query.lower() or "month" in request.query.lower():
+            time_range = "30d"
+
+        logger.debug("Getting market insights for %s over %s", blockchain, time_range, extra={"sampled": True})
+
+        # Get comprehensive market insights using our new method
+        try:
+            data = await bits_api.get_market_insights(blockchain=blockchain, time_range=time_range)
+            logger.debug("Market insights has_marketplace_data=%s", data.get("has_marketplace_data"), extra={"sampled": True})
+
+            # Add debugging info to data
+            data["debug_info"] = {
+                "blockchain": blockchain,
+                "time_range": time_range,
+                "query": request.query,
+                "has_marketplace_data": data.get("has_marketplace_data", False)
+            }
+
+        except Exception as e:
+            logger.error("Error in market insights: %s", e)
+            data = {"error": f"Failed to fetch market insights: {str(e)}"}
+
+    elif action == "collection_traits":
+        # Get traits and rarity data
+        if user_collections:
+            data = {"traits_analysis": []}
+            collections = user_collections[:SMART_QUERY_MAX_COLLECTIONS]
+            results = await bounded_gather(
+                (bits_api.get_collection_traits(collection) for collection in collections), SMART_QUERY_CONCURRENCY, timeout=remaining()
+            )
+            for collection, traits_data in zip(collections, results):
+                if isinstance(traits_data, Exception):
+                    continue
+                data["traits_analysis"].append({
+                    "collection_id": collection,
+                    "traits": traits_data
+                })
+        else:
+            data = {"message": "No collections available for traits analysis"}
+
+    elif action == "whale_analysis":
+        # Get whale activity data
+        try:
+            data = {"whale_activity": []}
+            if user_collections:
+                collections = user_collections[:SMART_QUERY_MAX_COLLECTIONS]
+                results = await bounded_gather(
+                    (bits_api.get_collection_whales(collection) for collection in collections), SMART_QUERY_CONCURRENCY, timeout=remaining()
+                )
+                for collection, whale_data in zip(collections, results):
+                    if isinstance(whale_data, Exception):
+                        continue
+                    data["whale_activity"].append({
+                        "collection_id": collection,
+                        "whale_metrics": whale_data
+                    })
             else:
-                final_prompt = f"""
-                User asked: "{request.query}"
-                Context: {context_info}
-                Action: NFT Market Insights
-                Data: {data}
-                
-                Provide comprehensive market analysis based on available data:
-                - Overall market health and trends
-                - Trading volume and holder activity
-                - Risk indicators and wash trading metrics
-                - Market outlook and recommendations
-                
-                Note: If specific marketplace data was requested but not available, mention this limitation.
-                Keep under 200 words. End with "Stay safe in the NFT market!"
-                """
-        
-        elif action == "collection_traits":
+                # General market whale activity
+                data["general_whale_activity"] = await bits_api.get_market_whales()
+        except Exception as e:
+            data = {"error": f"Failed to fetch whale data: {str(e)}"}
+
+    elif action == "risk_analysis":
+        # Comprehensive risk analysis
+        data = {"risk_summary": {"wallets": [], "collections": []}}
+
+        # Risk scores plus health/market data per item, all items fetched concurrently
+        async def wallet_risk(wallet):
+            return await asyncio.gather(bits_api.get_risk_scores(wallet), bits_api.get_wallet_health(wallet))
+
+        async def collection_risk(collection):
+            return await asyncio.gather(bits_api.get_risk_scores(collection), bits_api.get_collection_stats(collection))
+
+        wallets = user_wallets[:SMART_QUERY_MAX_WALLETS]
+        collections = user_collections[:SMART_QUERY_MAX_COLLECTIONS]
+        results = await bounded_gather(
+            [wallet_risk(wallet) for wallet in wallets] + [collection_risk(collection) for collection in collections],
+            SMART_QUERY_CONCURRENCY, timeout=remaining()
+        )
+        wallet_results, collection_results = results[:len(wallets)], results[len(wallets):]
+
+        # Analyze wallet risks
+        for i, (wallet, result) in enumerate(zip(wallets, wallet_results)):
+            if isinstance(result, Exception):
+                continue
+            risk_data, wallet_health = result
+            data["risk_summary"]["wallets"].append({
+                "wallet": f"Wallet {i+1}",
+                "address": wallet[:6] + "..." + wallet[-4:],
+                "risk_score": risk_data,
+                "health_indicators": wallet_health
+            })
+
+        # Analyze collection risks
+        for collection, result in zip(collections, collection_results):
+            if isinstance(result, Exception):
+                continue
+            risk_data, collection_stats = result
+            data["risk_summary"]["collections"].append({
+                "collection_id": collection,
+                "risk_score": risk_data,
+                "market_data": collection_stats
+            })
+
+    elif action == "portfolio_analysis":
+        summary = await portfolios.current_summary(user_wallets[:SMART_QUERY_MAX_WALLETS]) if user_wallets else None
+        if summary is not None:
+            # Value, deltas, washtrade exposure and concentration were precomputed
+            data = {"portfolio": summary, "total_wallets": len(user_wallets)}
+        elif user_wallets:
+            # Aggregate data from multiple wallets; precompute them for next time
+            data = {"portfolio_summary": [], "total_wallets": len(user_wallets)}
+            wallets = user_wallets[:SMART_QUERY_MAX_WALLETS]
+            _run_in_background(portfolios.ensure_wallets(wallets))
+            results = await bounded_gather(
+                (bits_api.get_wallet_health(wallet) for wallet in wallets), SMART_QUERY_CONCURRENCY, timeout=remaining()
+            )
+            for i, (wallet, wallet_data) in enumerate(zip(wallets, results)):
+                if isinstance(wallet_data, Exception):
+                    continue
+                data["portfolio_summary"].append({
+                    "wallet": f"Wallet {i+1}",
+                    "address": wallet[:6] + "..." + wallet[-4:],  # Shortened for display
+                    "data": wallet_data
+                })
+
+    elif action == "collection_stats":
+        target_collection = decision.get("target_collection")
+        if target_collection:
+            data = await bits_api.get_collection_stats(target_collection)
+        elif user_collections:
+            # Use first collection if no specific one mentioned
+            data = await bits_api.get_collection_stats(user_collections[0])
+
+    elif action == "nft_valuation":
+        if decision.get("target_collection") and decision.get("target_token"):
+            data = await bits_api.get_nft_valuation(decision["target_token"], decision["target_collection"])
+
+    # If no data was fetched or data is empty, provide a helpful fallback
+    if not data and user_wallets:
+        try:
+            wallet_data = await bits_api.get_wallet_health(user_wallets[0])
+            has_data = wallet_data and len(str(wallet_data).strip()) > 2
+            data = {
+                "wallet_data": wallet_data,
+                "has_data": has_data,
+                "wallet_address": user_wallets[0][:6] + "..." + user_wallets[0][-4:]
+            }
+            action = "wallet_overview"
+        except Exception as e:
+            data = {
+                "wallet_data": None,
+                "has_data": False,
+                "error": str(e),
+                "wallet_address": user_wallets[0][:6] + "..." + user_wallets[0][-4:]
+            }
+            action = "wallet_overview"
+
+    history = await _history_context(action, decision, user_wallets, user_collections)
+    if history:
+        data = {**data, "history": history} if isinstance(data, dict) else {"data": data, "history": history}
+
+    return action, data
+
+
+def _build_smart_query_prompt(request: SmartQueryRequest, action, decision, data, user_wallets, user_collections):
+    """Build the final LLM prompt for the chosen action and fetched data."""
+    # Generate contextual response based on action type
+    context_info = f"User has {len(user_wallets)} wallet(s) and {len(user_collections)} watched collection(s)."
+    # Only the fields relevant to this action, rounded and tabulated
+    compact_data = compact_prompt_data(action, data)
+
+    # Customize prompt based on action
+    if action == "general_conversation":
+        final_prompt = f"""
+        User said: "{request.query}"
+        Context: I am Aegis, an NFT Portfolio Assistant. {context_info}
+
+        Respond to their greeting or general question in a friendly, helpful way:
+        - Acknowledge their message warmly
+        - Briefly introduce what I can help with (NFT analysis, portfolio tracking, risk assessment)
+        - If they have wallets/collections, mention I can analyze their portfolio
+        - If they don't have any data yet, suggest they add wallet addresses or collections
+        - Keep it conversational and under 100 words
+        - Don't end with "Stay safe in the NFT market!" for casual greetings
+
+        Be natural and helpful, like a friendly financial advisor specializing in NFTs.
+        """
+
+    elif action == "wallet_comparison":
+        final_prompt = f"""
+        User asked: "{request.query}"
+        Context: {context_info}
+        Action: Wallet Comparison Analysis
+        Data: {compact_data}
+
+        Compare the wallets based on the data provided. Highlight:
+        - Performance differences between wallets
+        - Which wallet is performing better and why
+        - Key metrics to focus on
+        - Recommendations for optimization
+        Keep under 200 words. End with "Stay safe in the NFT market!"
+        """
+
+    elif action == "collection_performance":
+        final_prompt = f"""
+        User asked: "{request.query}"
+        Context: {context_info}
+        Action: Collection Performance Analysis
+        Data: {compact_data}
+
+        Analyze the performance of their watchlisted collections:
+        - Which collections are trending up/down
+        - Volume and price movements
+        - Market sentiment indicators
+        - Recommendations for collection management
+        Keep under 200 words. End with "Stay safe in the NFT market!"
+        """
+
+    elif action == "market_trending":
+        final_prompt = f"""
+        User asked: "{request.query}"
+        Context: {context_info}
+        Action: Market Trending Analysis
+        Data: {compact_data}
+
+        Provide insights on trending collections and market performance:
+        - Top performing collections right now
+        - Market volume and activity trends
+        - Emerging opportunities
+        - What's hot in the NFT space
+        Keep under 200 words. End with "Stay safe in the NFT market!"
+        """
+
+    elif action == "market_insights":
+        # Check if we have marketplace data and customize the prompt accordingly
+        has_marketplace_data = data.get("has_marketplace_data", False) if data else False
+        marketplace_data = data.get("marketplace_data", {}) if data else {}
+
+        if has_marketplace_data and marketplace_data:
+            top_marketplace = marketplace_data.get("top_marketplace", {})
+            all_marketplaces = marketplace_data.get("all_marketplaces", [])
+
+            # Create a detailed marketplace summary
+            marketplace_summary = f"Top Marketplace: {top_marketplace.get('name', 'Unknown')} with ${top_marketplace.get('volume', 0):,.2f} volume"
+            if all_marketplaces:
+                marketplace_summary += f"\nAll Marketplaces: " + ", ".join([
+                    f"{mp.get('name', 'Unknown')} (${mp.get('volume', 0):,.2f})" 
+                    for mp in all_marketplaces[:3]
+                ])
+
             final_prompt = f"""
             User asked: "{request.query}"
             Context: {context_info}
-            Action: Collection Traits Analysis
-            Data: {data}
-            
-            Analyze collection traits and rarity:
-            - Most valuable and rare traits
-            - Trait distribution and rarity percentages
-            - Investment opportunities based on traits
-            - Recommendations for trait-based decisions
+            Action: NFT Market Insights with Real Marketplace Data
+
+            CURRENT MARKETPLACE DATA:
+            {marketplace_summary}
+            Total Market Volume: ${marketplace_data.get('total_market_volume', 0):,.2f}
+            Total Market Sales: {marketplace_data.get('total_market_sales', 0):,}
+            Active Marketplaces: {marketplace_data.get('marketplace_count', 0)}
+
+            Additional Market Data: {compact_data}
+
+            Based on the REAL marketplace data provided above, answer the user's specific question.
+            If they asked about "which marketplace has the best volume" or similar, reference the actual data.
+            Provide specific numbers and insights from the current market data.
             Keep under 200 words. End with "Stay safe in the NFT market!"
             """
-        
-        elif action == "whale_analysis":
+        else:
             final_prompt = f"""
             User asked: "{request.query}"
             Context: {context_info}
-            Action: Whale Activity Analysis
-            Data: {data}
-            
-            Analyze whale activity and large holder behavior:
-            - Major whale movements and transactions
-            - Impact on collection prices and volume
-            - Whale accumulation or distribution patterns
-            - What whale activity means for retail investors
+            Action: NFT Market Insights
+            Data: {compact_data}
+
+            Provide comprehensive market analysis based on available data:
+            - Overall market health and trends
+            - Trading volume and holder activity
+            - Risk indicators and wash trading metrics
+            - Market outlook and recommendations
+
+            Note: If specific marketplace data was requested but not available, mention this limitation.
             Keep under 200 words. End with "Stay safe in the NFT market!"
             """
+
+    elif action == "collection_traits":
+        final_prompt = f"""
+        User asked: "{request.query}"
+        Context: {context_info}
+        Action: Collection Traits Analysis
+        Data: {compact_data}
+
+        Analyze collection traits and rarity:
+        - Most valuable and rare traits
+        - Trait distribution and rarity percentages
+        - Investment opportunities based on traits
+        - Recommendations for trait-based decisions
+        Keep under 200 words. End with "Stay safe in the NFT market!"
+        """
+
+    elif action == "whale_analysis":
+        final_prompt = f"""
+        User asked: "{request.query}"
+        Context: {context_info}
+        Action: Whale Activity Analysis
+        Data: {compact_data}
+
+        Analyze whale activity and large holder behavior:
+        - Major whale movements and transactions
+        - Impact on collection prices and volume
+        - Whale accumulation or distribution patterns
+        - What whale activity means for retail investors
+        Keep under 200 words. End with "Stay safe in the NFT market!"
+        """
+
+    elif action == "risk_analysis":
+        final_prompt = f"""
+        User asked: "{request.query}"
+        Context: {context_info}
+        Action: Risk Assessment
+        Data: {compact_data}
+
+        Provide a comprehensive risk analysis focusing on:
+        - Overall portfolio risk level
+        - High-risk vs low-risk holdings
+        - Diversification recommendations
+        - Warning signs to watch for
+        - Actionable steps to reduce risk
+        Keep under 200 words. End with "Stay safe in the NFT market!"
+        """
+
+    else:
+        # Default prompt for other actions
+        final_prompt = f"""
+        User asked: "{request.query}"
+        Context: {context_info}
+        Action taken: {action}
+        Focus area: {decision.get('response_focus', 'general overview')}
+        Data: {compact_data}
+
+        IMPORTANT: Check if the data is empty, null, or just contains "[]" or similar empty values.
+
+        If the data is empty or shows no NFT activity:
+        - Explain that the wallet appears to have no NFT activity or data
+        - Suggest this could mean: no NFTs owned, new wallet, or privacy settings
+        - Offer to help with other wallets if they have multiple
+        - Provide general advice about getting started with NFTs
+        - Keep encouraging and helpful tone
+
+        If the data has content:
+        - Provide a helpful, conversational response about their {action.replace('_', ' ')}
+        - Be specific about the data shown
+        - Highlight key insights and numbers
+        - Give actionable advice if relevant
+
+        Keep under 200 words. End with "Stay safe in the NFT market!"
+
+        If the data shows multiple wallets, mention that this is from their portfolio.
+        """
+    
+    return final_prompt
+
+
+async def _smart_query_fallback(user_wallets, error):
+    """Best-effort answer when the AI pipeline fails."""
+    # Improved fallback response if AI fails
+    if user_wallets:
+        try:
+            # If the wallet circuit is open this answers from cache or fails fast without calling upstream
+            fallback_data = await bits_api.get_wallet_health(user_wallets[0])
+
+            # Check if wallet has meaningful data
+            if fallback_data and len(str(fallback_data).strip()) > 2 and str(fallback_data) != "[]":
+                return {
+                    "response": f"I found information about your wallet ({user_wallets[0][:6]}...{user_wallets[0][-4:]}). Here's a quick overview: {str(fallback_data)[:200]}... Stay safe in the NFT market!",
+                    "action_taken": "fallback_wallet_check",
+                    "reasoning": f"AI processing failed, showing wallet data: {str(error)}"
+                }
+            else:
+                return {
+                    "response": f"I checked your wallet ({user_wallets[0][:6]}...{user_wallets[0][-4:]}), but it appears to have no NFT activity or the data is currently unavailable. This could be a new wallet, or you might not have any NFTs yet. Feel free to ask about other wallets if you have multiple ones! Stay safe in the NFT market!",
+                    "action_taken": "fallback_empty_wallet",
+                    "reasoning": f"AI processing failed, wallet appears empty: {str(error)}"
+                }
+        except Exception as wallet_error:
+            return {
+                "response": f"I'm having trouble accessing your wallet data right now. This could be due to network issues or the wallet address format. Please make sure your wallet address is correct and try again in a moment. Stay safe in the NFT market!",
+                "action_taken": "fallback_error",
+                "reasoning": f"Both AI and wallet check failed: {str(error)}, {str(wallet_error)}"
+            }
+
+    # If no wallets available
+    return {
+        "response": "I'd love to help analyze your NFT portfolio! To get started, please add your wallet address to your profile, then ask me questions like 'how are my wallets doing?' or 'show me my portfolio performance.'",
+        "action_taken": "fallback_no_wallets",
+        "reasoning": f"AI failed and no wallets available: {str(error)}"
+    }
+
+
+def _answer_cache_key(request: SmartQueryRequest, action, decision, data, user_wallets, user_collections):
+    # debug_info echoes the raw query, which would defeat query normalisation
+    if isinstance(data, dict):
+        data = {key: value for key, value in data.items() if key != "debug_info"}
+    # Everything else the prompt is built from: the user's context and the decision's focus
+    context = f"{len(user_wallets)}:{len(user_collections)}:{decision.get('response_focus', '')}"
+    return f"{action}:{context}:{normalize_query(request.query)}:{fingerprint(data)}"
+
+def _sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+async def _stream_smart_query(request: SmartQueryRequest, user_wallets, user_collections):
+    """Yield the smart query answer as Server-Sent Events.
+
+    A ``decision`` event goes out as soon as the action is chosen, followed by
+    one ``token`` event per generated chunk and a final ``done`` event.
+    """
+    try:
+        decision, early_response = await _run_stage(
+            "action selection", _decide_smart_query_action(request, user_wallets, user_collections), SMART_QUERY_ANSWER_RESERVE
+        )
+        if early_response:
+            yield _sse_event("needs_input", early_response)
+            return
         
-        elif action == "risk_analysis":
-            final_prompt = f"""
-            User asked: "{request.query}"
-            Context: {context_info}
-            Action: Risk Assessment
-            Data: {data}
-            
-            Provide a comprehensive risk analysis focusing on:
-            - Overall portfolio risk level
-            - High-risk vs low-risk holdings
-            - Diversification recommendations
-            - Warning signs to watch for
-            - Actionable steps to reduce risk
-            Keep under 200 words. End with "Stay safe in the NFT market!"
-            """
+        yield _sse_event("decision", {
+            "action_taken": decision.get("action"),
+            "reasoning": decision.get("reasoning"),
+            "data_source": decision.get("target_wallet") or decision.get("target_collection")
+        })
         
+        with deadline_scope(remaining(SMART_QUERY_ANSWER_RESERVE)):
+            action, data = await _fetch_smart_query_data(request, decision, user_wallets, user_collections)
+        cache_key = _answer_cache_key(request, action, decision, data, user_wallets, user_collections)
+        llm_response = answer_cache.get(cache_key)
+        if llm_response is not None:
+            yield _sse_event("token", {"content": llm_response})
         else:
-            # Default prompt for other actions
-            final_prompt = f"""
-            User asked: "{request.query}"
-            Context: {context_info}
-            Action taken: {action}
-            Focus area: {decision.get('response_focus', 'general overview')}
-            Data: {data}
-            
-            IMPORTANT: Check if the data is empty, null, or just contains "[]" or similar empty values.
-            
-            If the data is empty or shows no NFT activity:
-            - Explain that the wallet appears to have no NFT activity or data
-            - Suggest this could mean: no NFTs owned, new wallet, or privacy settings
-            - Offer to help with other wallets if they have multiple
-            - Provide general advice about getting started with NFTs
-            - Keep encouraging and helpful tone
-            
-            If the data has content:
-            - Provide a helpful, conversational response about their {action.replace('_', ' ')}
-            - Be specific about the data shown
-            - Highlight key insights and numbers
-            - Give actionable advice if relevant
-            
-            Keep under 200 words. End with "Stay safe in the NFT market!"
-            
-            If the data shows multiple wallets, mention that this is from their portfolio.
-            """
+            final_prompt = _build_smart_query_prompt(request, action, decision, data, user_wallets, user_collections)
+            chunks = []
+            async for chunk in gradient.stream_chat(final_prompt):
+                chunks.append(chunk)
+                yield _sse_event("token", {"content": chunk})
+            llm_response = "".join(chunks)
+            answer_cache.set(cache_key, llm_response, ANSWER_CACHE_TTL)
         
-        final_payload = {
-            "messages": [{"role": "user", "content": final_prompt}],
-            "stream": False,
-            "include_functions_info": False,
-            "include_retrieval_info": False,
-            "include_guardrails_info": False
-        }
+        yield _sse_event("done", {
+            "response": llm_response,
+            "action_taken": action,
+            "data_source": decision.get("target_wallet") or decision.get("target_collection"),
+            "reasoning": decision.get("reasoning"),
+            "stale_sources": sorted(stale_sources.get() or [])
+        })
+    
+    except Exception as e:
+        yield _sse_event("done", await _smart_query_fallback(user_wallets, e))
+
+async def _run_stage(stage, awaitable, reserve=0.0):
+    """Await one smart_query stage with what is left of the request's time budget."""
+    try:
+        return await asyncio.wait_for(awaitable, remaining(reserve))
+    except asyncio.TimeoutError:
+        raise asyncio.TimeoutError(f"Request deadline exceeded during {stage}") from None
+
+async def _cancel_on_disconnect(http_request: Request, coro):
+    """Await ``coro``, cancelling it as soon as the client disconnects.
+
+    Returns ``None`` when the client went away first.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("Client disconnected, cancelling %s", http_request.url.path)
+                return None
+    finally:
+        task.cancel()
+
+async def _answer_smart_query(request: SmartQueryRequest, user_wallets, user_collections):
+    """Decide, fetch and answer, each stage bounded by the time left in the request."""
+    try:
+        decision, early_response = await _run_stage(
+            "action selection", _decide_smart_query_action(request, user_wallets, user_collections), SMART_QUERY_ANSWER_RESERVE
+        )
+        if early_response:
+            return early_response
         
-        final_response = requests.post(GRADIENTAI_URL, headers=headers, json=final_payload)
-        final_data = final_response.json()
-        llm_response = final_data["choices"][0]["message"]["content"]
+        # Upstream calls still running when the stage budget ends are cancelled and the rest is used
+        with deadline_scope(remaining(SMART_QUERY_ANSWER_RESERVE)):
+            action, data = await _fetch_smart_query_data(request, decision, user_wallets, user_collections)
+        cache_key = _answer_cache_key(request, action, decision, data, user_wallets, user_collections)
+        llm_response = answer_cache.get(cache_key)
+        if llm_response is None:
+            final_prompt = _build_smart_query_prompt(request, action, decision, data, user_wallets, user_collections)
+            final_data = await _run_stage("answer generation", gradient.chat(final_prompt))
+            llm_response = final_data["choices"][0]["message"]["content"]
+            answer_cache.set(cache_key, llm_response, ANSWER_CACHE_TTL)
         
         return {
             "response": llm_response,
             "action_taken": action,
             "data_source": decision.get("target_wallet") or decision.get("target_collection"),
-            "reasoning": decision.get("reasoning")
+            "reasoning": decision.get("reasoning"),
+            "stale_sources": sorted(stale_sources.get() or [])
         }
         
     except Exception as e:
-        # Improved fallback response if AI fails
-        if user_wallets:
-            try:
-                fallback_data = bits_api.get_wallet_health(user_wallets[0])
-                
-                # Check if wallet has meaningful data
-                if fallback_data and len(str(fallback_data).strip()) > 2 and str(fallback_data) != "[]":
-                    return {
-                        "response": f"I found information about your wallet ({user_wallets[0][:6]}...{user_wallets[0][-4:]}). Here's a quick overview: {str(fallback_data)[:200]}... Stay safe in the NFT market!",
-                        "action_taken": "fallback_wallet_check",
-                        "reasoning": f"AI processing failed, showing wallet data: {str(e)}"
-                    }
-                else:
-                    return {
-                        "response": f"I checked your wallet ({user_wallets[0][:6]}...{user_wallets[0][-4:]}), but it appears to have no NFT activity or the data is currently unavailable. This could be a new wallet, or you might not have any NFTs yet. Feel free to ask about other wallets if you have multiple ones! Stay safe in the NFT market!",
-                        "action_taken": "fallback_empty_wallet",
-                        "reasoning": f"AI processing failed, wallet appears empty: {str(e)}"
-                    }
-            except Exception as wallet_error:
-                return {
-                    "response": f"I'm having trouble accessing your wallet data right now. This could be due to network issues or the wallet address format. Please make sure your wallet address is correct and try again in a moment. Stay safe in the NFT market!",
-                    "action_taken": "fallback_error",
-                    "reasoning": f"Both AI and wallet check failed: {str(e)}, {str(wallet_error)}"
-                }
-        
-        # If no wallets available
-        return {
-            "response": "I'd love to help analyze your NFT portfolio! To get started, please add your wallet address to your profile, then ask me questions like 'how are my wallets doing?' or 'show me my portfolio performance.'",
-            "action_taken": "fallback_no_wallets",
-            "reasoning": f"AI failed and no wallets available: {str(e)}"
-        }
+        return await _smart_query_fallback(user_wallets, e)
+
+@app.post("/smart-query")
+async def smart_query(request: SmartQueryRequest, http_request: Request):
+    """
+    Smart query that can fetch user's wallet data automatically.
+    Set ``stream`` to receive the answer as Server-Sent Events.
+    The whole answer must be ready within ``SMART_QUERY_DEADLINE`` seconds.
+    """
+    request_priority.set(PRIORITY_INTERACTIVE)
+    # Set for the rest of the request, so it also covers the streamed response
+    request_deadline.set(time.monotonic() + SMART_QUERY_DEADLINE)
+    user_wallets = request.user_wallets
+    user_collections = request.user_collections
+    if request.user_id and not (user_wallets or user_collections):
+        # Only the user id was sent: use the saved portfolio
+        try:
+            profile = await profile_store.get(request.user_id)
+        except Exception as e:
+            logger.warning("Failed to load profile %s: %s", request.user_id, e)
+            profile = None
+        if profile:
+            user_wallets = profile["wallet_addresses"]
+            user_collections = profile["watchlist_collections"]
+
+    if request.stream:
+        # StreamingResponse stops the generator itself when the client disconnects
+        return StreamingResponse(
+            _stream_smart_query(request, user_wallets, user_collections),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    answer = await _cancel_on_disconnect(http_request, _answer_smart_query(request, user_wallets, user_collections))
+    if answer is None:
+        # 499 Client Closed Request; nobody reads this, but it shows up in metrics and logs
+        return Response(status_code=499)
+    return answer
+
+def _run_in_background(coro):
+    """Run ``coro`` in the background rate-limit lane without awaiting it or its request's deadline."""
+    async def run():
+        with priority_scope(PRIORITY_BACKGROUND), deadline_scope(None):
+            await coro
+
+    task = asyncio.ensure_future(run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+def _prewarm_wallets(wallets):
+    """Fetch a user's wallet data in the background so their first question hits the cache."""
+    if wallets:
+        _run_in_background(bounded_gather(
+            (bits_api.get_wallet_health(wallet) for wallet in wallets[:SMART_QUERY_MAX_WALLETS]), SMART_QUERY_CONCURRENCY
+        ))
 
-# Appwrite integration endpoints (you'll implement these)
 @app.post("/user/profile")
 async def save_user_profile(profile: UserProfile):
-    """Save user profile to Appwrite"""
-    # TODO: Implement Appwrite integration
+    """Save a user's wallets, watchlist and preferences"""
+    try:
+        await profile_store.save(profile.model_dump())
+    except Exception as e:
+        return {"error": f"Failed to save profile: {str(e)}"}
+    # Warms the wallets through the batch endpoints; only wallets that were not precomputed yet are fetched
+    _run_in_background(portfolios.update_user(profile.user_id, profile.wallet_addresses[:SMART_QUERY_MAX_WALLETS]))
     return {"message": "Profile saved successfully"}
 
 @app.get("/user/profile/{user_id}")
 async def get_user_profile(user_id: str):
-    """Get user profile from Appwrite"""
-    # TODO: Implement Appwrite integration
-    return {"user_id": user_id, "wallet_addresses": [], "watchlist_collections": []}
+    """Get a user's saved profile; unknown users get an empty one"""
+    try:
+        profile = await profile_store.get(user_id)
+    except Exception as e:
+        return {"error": f"Failed to load profile: {str(e)}"}
+    if profile is None:
+        return empty_profile(user_id)
+    _prewarm_wallets(profile["wallet_addresses"])
+    return profile
+
+@app.get("/user/portfolio/{user_id}")
+async def get_user_portfolio(user_id: str):
+    """Precomputed portfolio summary for a saved user"""
+    summary = await portfolios.get(user_id)
+    if summary is None:
+        try:
+            profile = await profile_store.get(user_id)
+        except Exception as e:
+            return {"error": f"Failed to load profile: {str(e)}"}
+        if not profile or not profile["wallet_addresses"]:
+            return {"error": "No saved wallets for this user"}
+        try:
+            await portfolios.update_user(user_id, profile["wallet_addresses"][:SMART_QUERY_MAX_WALLETS])
+        except Exception as e:
+            return {"error": f"Failed to compute portfolio: {str(e)}"}
+        summary = await portfolios.get(user_id)
+    return summary or {"error": "Portfolio data is not available yet"}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,125 @@
+import threading
+from bisect import bisect_left
+
+# Latency buckets in seconds, from cache hits to slow LLM generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            series = self._series.setdefault(key, {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0})
+            series["counts"][bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series["counts"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series['count']}")
+        return lines
+
+
+class Registry:
+    """Holds metrics plus callbacks that report gauges at scrape time."""
+
+    def __init__(self):
+        self._metrics = []
+        self._gauge_callbacks = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_gauges(self, callback):
+        """``callback()`` returns ``[(name, help, {labels}, value), ...]``.
+
+        Values read at scrape time; names ending in ``_total`` are monotonic
+        totals and are exposed as counters, everything else as gauges.
+        """
+        self._gauge_callbacks.append(callback)
+
+    def render(self):
+        """Render everything in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        # Each metric family has to be one contiguous block, whatever order callbacks report in
+        families = {}
+        for callback in self._gauge_callbacks:
+            for name, help_text, labels, value in callback():
+                family = families.setdefault(name, (help_text, []))
+                family[1].append(f"{name}{_format_labels(labels.keys(), labels.values())} {value}")
+        for name, (help_text, samples) in families.items():
+            kind = "counter" if name.endswith("_total") else "gauge"
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"])
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    "aegis_http_request_duration_seconds", "Time spent serving HTTP requests", ("method", "route", "status")
+)
+upstream_request_duration = registry.histogram(
+    "aegis_upstream_request_duration_seconds", "BitsCrunch API call latency", ("endpoint", "status")
+)
+upstream_response_bytes = registry.counter(
+    "aegis_upstream_response_bytes_total", "Bytes received from the BitsCrunch API", ("endpoint",)
+)
+llm_request_duration = registry.histogram(
+    "aegis_llm_request_duration_seconds", "Gradient chat-completion latency", ("mode", "status")
+)
+llm_tokens = registry.counter(
+    "aegis_llm_tokens_total", "Tokens reported by the Gradient endpoint", ("type",)
+)
@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+
+from concurrency import bounded_gather
+from request_context import PRIORITY_BACKGROUND, request_priority
+
+PORTFOLIO_REFRESH_INTERVAL = int(os.getenv("PORTFOLIO_REFRESH_INTERVAL", 300))
+# Wallet data older than this is not used in a summary
+PORTFOLIO_MAX_AGE = int(os.getenv("PORTFOLIO_MAX_AGE", 900))
+TOP_COLLECTIONS = 5
+HOLDINGS_LIMIT = 100
+
+logger = logging.getLogger(__name__)
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class PortfolioPrecomputer:
+    """Precompute portfolio summaries for every saved user profile.
+
+    Per-wallet data (value, washtrade activity, NFTs held per collection) is
+    fetched in batches and kept per wallet, so wallets shared between users
+    are fetched once and a wallet added to a profile only fetches that
+    wallet. Summaries are aggregated from those parts, which is cheap enough
+    to do on the request path with :meth:`summarize`. Once started, all
+    users are refreshed every ``interval`` seconds in the background lane.
+
+    With a ``shared`` :class:`~cache_backend.CacheBackend`, wallet data and
+    user summaries are published there, so workers that do not run the
+    refresh job use them too (:meth:`current_summary`, :meth:`get`).
+    """
+
+    def __init__(self, api, profiles, interval=PORTFOLIO_REFRESH_INTERVAL, max_age=PORTFOLIO_MAX_AGE, shared=None):
+        self.api = api
+        self.profiles = profiles
+        self.shared = shared
+        self.interval = interval
+        self.max_age = max_age
+        self._wallets = {}
+        self._summaries = {}
+        self._task = None
+        self.runs = 0
+        self.last_run = None
+        self.last_error = None
+
+    async def _fetch_wallets(self, wallets):
+        # Upstream gets the wallets as given; data is stored under the lower-cased address
+        originals = {}
+        for wallet in wallets:
+            originals.setdefault(wallet.lower(), wallet)
+        keys = sorted(originals)
+        addresses = [originals[key] for key in keys]
+        scores, washtrade = await asyncio.gather(
+            self.api.get_wallet_health_batch(addresses),
+            self.api.fetch_batch(self.api.get_wallet_washtrade, "wallet", "wallet_address", addresses, time_range="all")
+        )
+        holdings = await bounded_gather(
+            (self.api.get_wallet_nft_balance(address, limit=HOLDINGS_LIMIT) for address in addresses), concurrency=4
+        )
+        now = time.time()
+        updated = []
+        for wallet, address, held in zip(keys, addresses, holdings):
+            score_rows = scores.get(address)
+            if not isinstance(score_rows, list):
+                # Keep the previous data for a wallet whose fetch failed
+                continue
+            previous = self._wallets.get(wallet)
+            wash_rows = washtrade.get(address) if isinstance(washtrade.get(address), list) else []
+            if isinstance(held, list):
+                collections = Counter()
+                for row in held:
+                    collection = row.get("collection") or row.get("contract_address")
+                    if collection:
+                        collections[collection] += int(_number(row.get("quantity")) or 1)
+            else:
+                collections = previous["collections"] if previous else Counter()
+            self._wallets[wallet] = {
+                "portfolio_value": sum(_number(row.get("portfolio_value")) for row in score_rows),
+                "previous_value": previous["portfolio_value"] if previous else None,
+                "washtrade_volume": sum(_number(row.get("washtrade_volume")) for row in wash_rows),
+                "washtrade_assets": sum(_number(row.get("washtrade_assets")) for row in wash_rows),
+                "collections": collections,
+                "fetched_at": now
+            }
+            updated.append(wallet)
+        for wallet in updated:
+            await self._shared("set", f"portfolio-wallet:{wallet}", self._wallets[wallet], self.max_age)
+
+    async def _shared(self, method, *args):
+        if self.shared is None:
+            return None
+        try:
+            return await getattr(self.shared, method)(*args)
+        except Exception as e:
+            logger.warning("Shared cache backend %s failed: %s", method, e)
+            return None
+
+    def _outdated(self, wallets, max_age):
+        now = time.time()
+        return [
+            wallet for wallet in wallets
+            if now - self._wallets.get(wallet.lower(), {}).get("fetched_at", 0) > max_age
+        ]
+
+    async def _load_shared(self, wallets):
+        """Copy wallet data other workers published into this one."""
+        if self.shared is None:
+            return
+        hits = await asyncio.gather(*(self._shared("get", f"portfolio-wallet:{wallet.lower()}") for wallet in wallets))
+        for wallet, hit in zip(wallets, hits):
+            local = self._wallets.get(wallet.lower())
+            if hit is not None and (local is None or hit[0]["fetched_at"] > local["fetched_at"]):
+                self._wallets[wallet.lower()] = {**hit[0], "collections": Counter(hit[0]["collections"])}
+
+    async def ensure_wallets(self, wallets, max_age=None):
+        """Fetch the wallets that have no data yet or data older than ``max_age``."""
+        max_age = self.max_age if max_age is None else max_age
+        outdated = self._outdated(wallets, max_age)
+        if outdated:
+            await self._load_shared(outdated)
+            outdated = self._outdated(outdated, max_age)
+        if outdated:
+            await self._fetch_wallets(outdated)
+
+    async def current_summary(self, wallets):
+        """:meth:`summarize`, after picking up wallet data other workers precomputed."""
+        await self._load_shared(self._outdated(wallets, self.max_age))
+        return self.summarize(wallets)
+
+    def summarize(self, wallets):
+        """Aggregate precomputed wallet data, or ``None`` unless every wallet has fresh data."""
+        now = time.time()
+        parts = []
+        for wallet in wallets:
+            part = self._wallets.get(wallet.lower())
+            if part is None or now - part["fetched_at"] > self.max_age:
+                return None
+            parts.append((wallet, part))
+        if not parts:
+            return None
+
+        total = sum(part["portfolio_value"] for _, part in parts)
+        collections = Counter()
+        for _, part in parts:
+            collections.update(part["collections"])
+        held = sum(collections.values())
+        return {
+            "total_portfolio_value": total,
+            "wallet_count": len(parts),
+            "wallets": [
+                {
+                    "wallet": wallet,
+                    "portfolio_value": part["portfolio_value"],
+                    "portfolio_value_share": round(part["portfolio_value"] / total, 4) if total else None,
+                    "portfolio_value_delta": (
+                        part["portfolio_value"] - part["previous_value"] if part["previous_value"] is not None else None
+                    ),
+                    "washtrade_volume": part["washtrade_volume"],
+                    "washtrade_assets": part["washtrade_assets"]
+                }
+                for wallet, part in parts
+            ],
+            "washtrade_exposure": {
+                "washtrade_volume": sum(part["washtrade_volume"] for _, part in parts),
+                "washtrade_assets": sum(part["washtrade_assets"] for _, part in parts),
+                "wallets_with_washtrade": sum(1 for _, part in parts if part["washtrade_volume"] > 0)
+            },
+            "concentration": {
+                "collection_count": len(collections),
+                "nft_count": held,
+                "top_collections": [
+                    {"collection": collection, "nft_count": count, "collection_share": round(count / held, 4)}
+                    for collection, count in collections.most_common(TOP_COLLECTIONS)
+                ],
+                # Herfindahl index of NFT counts: 1.0 means everything is in one collection
+                "collection_hhi": round(sum((count / held) ** 2 for count in collections.values()), 4) if held else None
+            },
+            "computed_at": min(part["fetched_at"] for _, part in parts)
+        }
+
+    async def get(self, user_id):
+        """The last stored summary for ``user_id``, from this worker or the shared backend, or ``None``."""
+        summary = self._summaries.get(user_id)
+        if summary is None:
+            hit = await self._shared("get", f"portfolio-user:{user_id}")
+            summary = hit[0] if hit is not None else None
+        return summary
+
+    async def _publish_summary(self, user_id, summary):
+        if summary is not None:
+            await self._shared("set", f"portfolio-user:{user_id}", summary, self.max_age)
+
+    async def update_user(self, user_id, wallets):
+        """Recompute one user's summary after their wallets changed; only new wallets are fetched."""
+        await self.ensure_wallets(wallets)
+        self._summaries[user_id] = self.summarize(wallets)
+        await self._publish_summary(user_id, self._summaries[user_id])
+
+    async def refresh_all(self):
+        """Refetch every saved user's wallets and store a fresh summary per user."""
+        users = {}
+        for user_id in await self.profiles.user_ids():
+            profile = await self.profiles.get(user_id)
+            if profile and profile["wallet_addresses"]:
+                users[user_id] = profile["wallet_addresses"]
+
+        await self.ensure_wallets({wallet for wallets in users.values() for wallet in wallets}, max_age=self.interval / 2)
+        self._summaries = {user_id: self.summarize(wallets) for user_id, wallets in users.items()}
+        for user_id, summary in list(self._summaries.items()):
+            await self._publish_summary(user_id, summary)
+
+        # Forget wallets no saved profile uses once they are too old to be served
+        in_use = {wallet.lower() for wallets in users.values() for wallet in wallets}
+        now = time.time()
+        for wallet in [w for w, part in self._wallets.items() if w not in in_use and now - part["fetched_at"] > self.max_age]:
+            del self._wallets[wallet]
+
+    async def _run(self):
+        request_priority.set(PRIORITY_BACKGROUND)
+        while True:
+            try:
+                await self.refresh_all()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning("Portfolio precomputation failed: %s", e)
+            self.runs += 1
+            self.last_run = time.time()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self):
+        return {
+            "users": len(self._summaries),
+            "wallets": len(self._wallets),
+            "runs": self.runs,
+            "last_run_age_seconds": round(time.time() - self.last_run, 1) if self.last_run else None,
+            "last_error": self.last_error
+        }
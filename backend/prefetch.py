@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import os
+import time
+
+from request_context import PRIORITY_BACKGROUND, cache_bypass, request_priority
+
+# A snapshot that could not be refreshed for this many intervals is no longer served
+SNAPSHOT_MAX_AGE_INTERVALS = int(os.getenv("SNAPSHOT_MAX_AGE_INTERVALS", 5))
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotScheduler:
+    """Keep warm snapshots of shared datasets, refreshed in the background.
+
+    Each registered job has an async ``loader`` and a refresh interval. Once
+    started, every job reloads on its own loop in the background rate-limit
+    lane; request handlers read the latest snapshot with :meth:`get` instead
+    of calling upstream. Loaders bypass the response cache, so a snapshot's
+    ``fetched_at`` is when upstream produced it. A failed refresh keeps the
+    previous snapshot until it is ``max_age`` seconds old.
+
+    With a ``shared`` :class:`~cache_backend.CacheBackend`, snapshots are
+    published there too, so workers that do not run the jobs serve the
+    snapshots of the one that does.
+    """
+
+    def __init__(self, interval=60, shared=None):
+        self.interval = interval
+        self.shared = shared
+        self._jobs = {}
+        self._snapshots = {}
+        self._errors = {}
+        self._tasks = []
+
+    def register(self, name, loader, interval=None, max_age=None):
+        interval = interval or self.interval
+        self._jobs[name] = (loader, interval, max_age or interval * SNAPSHOT_MAX_AGE_INTERVALS)
+
+    async def get(self, name):
+        """Return ``{"data": ..., "fetched_at": epoch_seconds}``, or ``None`` if missing, too old or not registered."""
+        if name not in self._jobs:
+            return None
+        _, interval, max_age = self._jobs[name]
+        snapshot = self._snapshots.get(name)
+        if self.shared is not None and (snapshot is None or time.time() - snapshot["fetched_at"] > interval):
+            # The refresh jobs may run in another worker; pick up its latest snapshot
+            hit = await self._shared("get", f"snapshot:{name}")
+            if hit is not None and (snapshot is None or hit[0]["fetched_at"] > snapshot["fetched_at"]):
+                snapshot = self._snapshots[name] = hit[0]
+        if snapshot is None or time.time() - snapshot["fetched_at"] > max_age:
+            return None
+        return snapshot
+
+    async def _shared(self, method, *args):
+        try:
+            return await getattr(self.shared, method)(*args)
+        except Exception as e:
+            logger.warning("Shared cache backend %s failed: %s", method, e)
+            return None
+
+    async def refresh(self, name):
+        loader = self._jobs[name][0]
+        try:
+            data = await loader()
+        except Exception as e:
+            self._errors[name] = str(e)
+            return False
+        snapshot = self._snapshots[name] = {"data": data, "fetched_at": time.time()}
+        self._errors.pop(name, None)
+        if self.shared is not None:
+            await self._shared("set", f"snapshot:{name}", snapshot, self._jobs[name][2])
+        return True
+
+    async def _run(self, name):
+        request_priority.set(PRIORITY_BACKGROUND)
+        cache_bypass.set(True)
+        interval = self._jobs[name][1]
+        while True:
+            await self.refresh(name)
+            await asyncio.sleep(interval)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.ensure_future(self._run(name)) for name in self._jobs]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self):
+        now = time.time()
+        return {
+            name: {
+                "age_seconds": round(now - self._snapshots[name]["fetched_at"], 1) if name in self._snapshots else None,
+                "interval_seconds": interval,
+                "max_age_seconds": max_age,
+                "last_error": self._errors.get(name)
+            }
+            for name, (_, interval, max_age) in self._jobs.items()
+        }
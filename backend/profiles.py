@@ -0,0 +1,162 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+from cache import TTLCache
+
+PROFILE_DB_PATH = os.getenv("PROFILE_DB_PATH", "profiles.sqlite3")
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", 600))
+PROFILE_CACHE_MAXSIZE = int(os.getenv("PROFILE_CACHE_MAXSIZE", 10000))
+
+_MISSING = object()
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id TEXT PRIMARY KEY,
+    wallet_addresses TEXT NOT NULL,
+    watchlist_collections TEXT NOT NULL,
+    preferences TEXT NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+def empty_profile(user_id):
+    return {"user_id": user_id, "wallet_addresses": [], "watchlist_collections": [], "preferences": {}}
+
+
+class ProfileStore(ABC):
+    """Interface for user-profile backends.
+
+    Profiles are plain dicts shaped like the ``UserProfile`` model. Methods
+    are synchronous; :class:`CachedProfileStore` runs them off the event loop.
+    """
+
+    @abstractmethod
+    def get(self, user_id):
+        """Return the profile for ``user_id`` or ``None``."""
+
+    @abstractmethod
+    def save(self, profile):
+        """Insert or replace ``profile``, keyed by its ``user_id``."""
+
+    @abstractmethod
+    def delete(self, user_id):
+        """Remove the profile for ``user_id``, if there is one."""
+
+    @abstractmethod
+    def user_ids(self):
+        """All stored user ids."""
+
+
+class SQLiteProfileStore(ProfileStore):
+    """Profiles in a local SQLite file; pass ``":memory:"`` for a throwaway store."""
+
+    def __init__(self, path=PROFILE_DB_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(_SCHEMA)
+
+    def get(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT wallet_addresses, watchlist_collections, preferences FROM profiles WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        wallets, collections, preferences = (json.loads(column) for column in row)
+        return {"user_id": user_id, "wallet_addresses": wallets, "watchlist_collections": collections, "preferences": preferences}
+
+    def save(self, profile):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?)",
+                (
+                    profile["user_id"],
+                    json.dumps(profile.get("wallet_addresses") or []),
+                    json.dumps(profile.get("watchlist_collections") or []),
+                    json.dumps(profile.get("preferences") or {}),
+                    time.time()
+                )
+            )
+
+    def delete(self, user_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM profiles WHERE user_id = ?", (user_id,))
+
+    def user_ids(self):
+        with self._lock:
+            return [user_id for (user_id,) in self._conn.execute("SELECT user_id FROM profiles")]
+
+
+class CachedProfileStore:
+    """Async read-through cache in front of a :class:`ProfileStore`.
+
+    Reads are answered from memory when possible and otherwise loaded from
+    the backend in a worker thread. Writes go straight to the backend and
+    invalidate the cached entry, so the next read sees the saved profile.
+    Unknown users are cached too, as ``None``.
+
+    With a ``shared`` :class:`~cache_backend.CacheBackend`, every write also
+    stores a new version for the user there. Each worker checks that version
+    before using its cached entry, so a save in one worker invalidates the
+    profile in all of them.
+    """
+
+    def __init__(self, backend, ttl=PROFILE_CACHE_TTL, maxsize=PROFILE_CACHE_MAXSIZE, shared=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.shared = shared
+        self.cache = TTLCache(maxsize=maxsize)
+
+    async def _version(self, user_id):
+        if self.shared is None:
+            return None
+        try:
+            hit = await self.shared.get(f"profile-version:{user_id}")
+        except Exception as e:
+            logger.warning("Shared cache backend get failed: %s", e)
+            return None
+        return hit[0] if hit is not None else None
+
+    async def _invalidate(self, user_id):
+        self.cache.delete(user_id)
+        if self.shared is not None:
+            try:
+                # Outlives every cached entry, so no worker can miss the change
+                await self.shared.set(f"profile-version:{user_id}", uuid.uuid4().hex, self.ttl)
+            except Exception as e:
+                logger.warning("Shared cache backend set failed: %s", e)
+
+    async def get(self, user_id):
+        version = await self._version(user_id)
+        cached = self.cache.get(user_id, _MISSING)
+        if cached is not _MISSING and cached[0] == version:
+            return cached[1]
+        profile = await asyncio.to_thread(self.backend.get, user_id)
+        self.cache.set(user_id, (version, profile), self.ttl)
+        return profile
+
+    async def save(self, profile):
+        await asyncio.to_thread(self.backend.save, profile)
+        await self._invalidate(profile["user_id"])
+
+    async def delete(self, user_id):
+        await asyncio.to_thread(self.backend.delete, user_id)
+        await self._invalidate(user_id)
+
+    async def user_ids(self):
+        return await asyncio.to_thread(self.backend.user_ids)
+
+    def stats(self):
+        return self.cache.stats()
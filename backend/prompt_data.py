@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+
+# Rough token budget for the data block of the final smart_query prompt
+PROMPT_DATA_TOKEN_BUDGET = int(os.getenv("PROMPT_DATA_TOKEN_BUDGET", 1500))
+CHARS_PER_TOKEN = 4
+
+# Row fields worth showing the LLM, matched as substrings of the field name
+_COMMON_FIELDS = ("name", "collection", "address", "wallet", "blockchain", "volume", "sales", "change", "washtrade")
+ACTION_FIELDS = {
+    "wallet_overview": _COMMON_FIELDS + ("portfolio_value", "score", "nft_count", "collection_count", "pnl", "profit"),
+    "wallet_comparison": _COMMON_FIELDS + ("portfolio_value", "score", "nft_count", "pnl", "profit"),
+    "portfolio_analysis": _COMMON_FIELDS + ("portfolio_value", "score", "nft_count", "collection_count", "pnl", "profit"),
+    "risk_analysis": _COMMON_FIELDS + ("score", "risk", "suspect", "index", "portfolio_value"),
+    "collection_stats": _COMMON_FIELDS + ("floor", "price", "holders", "traders", "marketcap", "transactions"),
+    "collection_performance": _COMMON_FIELDS + ("floor", "price", "holders", "traders", "marketcap"),
+    "market_trending": _COMMON_FIELDS + ("floor", "price", "holders", "traders", "marketcap", "transactions"),
+    "market_insights": _COMMON_FIELDS + ("holders", "traders", "transactions", "marketcap", "count", "top_marketplace", "total"),
+    "collection_traits": ("collection", "trait", "value", "rarity", "count", "floor", "price", "volume", "sales"),
+    "whale_analysis": _COMMON_FIELDS + ("whale", "holders", "nft_count", "buy", "sell", "mint"),
+    "nft_valuation": ("collection", "token", "price", "estimate", "bound", "accuracy")
+}
+# Keys dropped at any level regardless of action: per-day trend arrays, media, links and debug echoes
+_EXCLUDED_FIELDS = {"block_dates", "image", "url", "banner", "description", "thumbnail", "debug_info"}
+_EXCLUDED_SUFFIXES = ("_trend", "_image", "_url", "_banner", "_description", "_thumbnail")
+MAX_ROWS = 10
+
+
+class PromptStats:
+    """Running totals of prompt data size before and after reduction."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.raw_chars = 0
+        self.compact_chars = 0
+
+    def record(self, raw_chars, compact_chars):
+        with self._lock:
+            self.prompts += 1
+            self.raw_chars += raw_chars
+            self.compact_chars += compact_chars
+
+    def stats(self):
+        return {
+            "prompts": self.prompts,
+            "raw_tokens_estimate": self.raw_chars // CHARS_PER_TOKEN,
+            "compact_tokens_estimate": self.compact_chars // CHARS_PER_TOKEN,
+            "reduction": round(1 - self.compact_chars / self.raw_chars, 4) if self.raw_chars else 0.0
+        }
+
+
+prompt_stats = PromptStats()
+
+
+def _round(value):
+    if isinstance(value, bool) or not isinstance(value, float):
+        return value
+    if abs(value) >= 100:
+        return round(value, 1)
+    if abs(value) >= 1:
+        return round(value, 2)
+    return float(f"{value:.3g}")
+
+
+def _excluded(key):
+    key = key.lower()
+    return key in _EXCLUDED_FIELDS or key.endswith(_EXCLUDED_SUFFIXES)
+
+
+def _keep_field(key, value, fields):
+    if _excluded(key):
+        return False
+    # Nested payloads (e.g. a wrapper row's "stats") are reduced, never projected away
+    if isinstance(value, (dict, list)) or fields is None:
+        return True
+    return any(field in key.lower() for field in fields)
+
+
+def _is_row_list(value):
+    return isinstance(value, list) and bool(value) and all(isinstance(row, dict) for row in value)
+
+
+def _reduce(value, fields, max_rows):
+    if _is_row_list(value):
+        rows = [_reduce_row(row, fields, max_rows) for row in value[:max_rows]]
+        columns = []
+        for row in rows:
+            columns.extend(key for key in row if key not in columns)
+        table = {"columns": columns, "rows": [[row.get(column) for column in columns] for row in rows]}
+        if len(value) > max_rows:
+            table["omitted_rows"] = len(value) - max_rows
+        return table
+    if isinstance(value, dict):
+        # Container keys (e.g. "trending_collections") are only checked against the exclusions
+        return {key: _reduce(item, fields, max_rows) for key, item in value.items() if not _excluded(key)}
+    if isinstance(value, list):
+        return [_reduce(item, fields, max_rows) for item in value[:max_rows]]
+    return _round(value)
+
+
+def _reduce_row(row, fields, max_rows):
+    reduced = {}
+    for key, value in row.items():
+        if value is None or not _keep_field(key, value, fields):
+            continue
+        if isinstance(value, (dict, list)):
+            value = _reduce(value, fields, max_rows)
+        reduced[key] = _round(value)
+    return reduced
+
+
+def compact_prompt_data(action, data, token_budget=PROMPT_DATA_TOKEN_BUDGET):
+    """Serialise fetched data for the final prompt, within a token budget.
+
+    Row lists are projected onto the scalar fields relevant to ``action``
+    (nested dicts and lists are kept and reduced the same way), numbers
+    are rounded, and tables are emitted as ``{"columns": [...], "rows": [...]}``.
+    Rows are halved until the JSON fits ``token_budget`` (at roughly four
+    characters per token); as a last resort the text is truncated.
+    """
+    fields = ACTION_FIELDS.get(action)
+    max_chars = token_budget * CHARS_PER_TOKEN
+    max_rows = MAX_ROWS
+    while True:
+        compact = json.dumps(_reduce(data, fields, max_rows), separators=(",", ":"), default=str)
+        if len(compact) <= max_chars or max_rows == 1:
+            break
+        max_rows = max(1, max_rows // 2)
+    if len(compact) > max_chars:
+        compact = compact[:max_chars] + "...(truncated)"
+
+    prompt_stats.record(len(str(data)), len(compact))
+    return compact
@@ -0,0 +1,133 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+from request_context import PRIORITY_BACKGROUND, PRIORITY_DEFAULT, PRIORITY_INTERACTIVE
+
+LANE_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_DEFAULT: "default",
+    PRIORITY_BACKGROUND: "background"
+}
+
+
+class TokenBucket:
+    """Async token bucket with priority lanes.
+
+    Tokens refill at ``rate`` per second up to ``capacity``. Callers that find
+    the bucket empty queue up and are served lowest priority number first,
+    then first come first served. ``pause`` empties the bucket for a while,
+    which is how an upstream 429 slows every caller down at once.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._dispatcher = None
+        self._lane_stats = {}
+
+    def _refill(self):
+        now = time.monotonic()
+        if now < self._paused_until:
+            self._tokens = 0
+        else:
+            since = max(self._updated, self._paused_until)
+            self._tokens = min(self.capacity, self._tokens + (now - since) * self.rate)
+        self._updated = now
+
+    def _lane(self, priority):
+        return self._lane_stats.setdefault(priority, {"acquired": 0, "queued": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0})
+
+    def _record(self, priority, waited):
+        stats = self._lane(priority)
+        stats["acquired"] += 1
+        stats["wait_seconds"] += waited
+        stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+
+    async def acquire(self, priority=PRIORITY_DEFAULT):
+        """Wait for a token and return how long the caller was queued."""
+        self._refill()
+        if not self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            self._record(priority, 0.0)
+            return 0.0
+
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._lane(priority)["queued"] += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        await future
+        waited = time.monotonic() - started
+        self._record(priority, waited)
+        return waited
+
+    async def _dispatch(self):
+        while self._waiters:
+            self._refill()
+            while self._waiters and self._tokens >= 1:
+                _, _, future = heapq.heappop(self._waiters)
+                if future.done():
+                    continue
+                self._tokens -= 1
+                future.set_result(None)
+            if self._waiters:
+                delay = max(self._paused_until - time.monotonic(), (1 - self._tokens) / self.rate, 0.001)
+                await asyncio.sleep(delay)
+
+    def pause(self, seconds):
+        """Hand out no tokens for ``seconds`` (e.g. after a 429 with Retry-After)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    def stats(self):
+        lanes = {}
+        for priority, stats in self._lane_stats.items():
+            acquired = stats["acquired"]
+            lanes[LANE_NAMES.get(priority, str(priority))] = {
+                "acquired": acquired,
+                "queued": stats["queued"],
+                "avg_wait_seconds": round(stats["wait_seconds"] / acquired, 4) if acquired else 0.0,
+                "max_wait_seconds": round(stats["max_wait_seconds"], 4)
+            }
+        return {
+            "rate_per_second": self.rate,
+            "capacity": self.capacity,
+            "waiting": len(self._waiters),
+            "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 3),
+            "lanes": lanes
+        }
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a ``Retry-After`` header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0, retry_after=None):
+    """Delay before retry number ``attempt`` (0-based).
+
+    Uses full-jitter exponential backoff, or ``Retry-After`` plus a little
+    jitter when the upstream told us how long to wait.
+    """
+    if retry_after is not None:
+        return min(cap, retry_after) + random.uniform(0, base)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
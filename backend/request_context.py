@@ -0,0 +1,73 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Rate-limiter lanes; lower numbers are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_BACKGROUND = 2
+
+request_priority = ContextVar("request_priority", default=PRIORITY_DEFAULT)
+# Correlates log lines with the HTTP request that produced them
+request_id = ContextVar("request_id", default="-")
+# Per-request set of upstream sources that were served stale; installed by middleware
+stale_sources = ContextVar("stale_sources", default=None)
+# Set by background refresh jobs that need a fresh upstream answer rather than a cached one
+cache_bypass = ContextVar("cache_bypass", default=False)
+# time.monotonic() by which the current request must be answered; None means no deadline
+request_deadline = ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def priority_scope(priority):
+    """Run upstream calls made inside the block in the given priority lane."""
+    token = request_priority.set(priority)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+@contextmanager
+def deadline_scope(seconds):
+    """Give work inside the block at most ``seconds``, or lift the deadline with ``None``.
+
+    A scope can only tighten an outer deadline, so a stage never outlives
+    the request that started it. Background work started from a request
+    uses ``deadline_scope(None)`` so it is not cut short with the request.
+    """
+    deadline = None
+    if seconds is not None:
+        deadline = time.monotonic() + seconds
+        outer = request_deadline.get()
+        if outer is not None:
+            deadline = min(deadline, outer)
+    token = request_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        request_deadline.reset(token)
+
+
+def remaining(reserve=0.0):
+    """Seconds left before the request deadline, minus ``reserve``; ``None`` without a deadline."""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic() - reserve)
+
+
+def mark_stale(source):
+    """Record that ``source`` was answered from stale data in this request."""
+    sources = stale_sources.get()
+    if sources is not None:
+        sources.add(source)
+
+
+class RequestIdFilter(logging.Filter):
+    """Attach the current request id to every log record as ``request_id``."""
+
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# Keep the SQLite files of modules imported by the tests out of the source tree
+_scratch = tempfile.mkdtemp(prefix="aegis-tests-")
+os.environ.setdefault("HISTORY_DB_PATH", os.path.join(_scratch, "history.sqlite3"))
+os.environ.setdefault("PROFILE_DB_PATH", os.path.join(_scratch, "profiles.sqlite3"))
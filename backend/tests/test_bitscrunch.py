@@ -0,0 +1,156 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import bitscrunch
+from bitscrunch import AsyncBitsCrunchAPI, endpoint_family
+from circuit_breaker import CLOSED, OPEN, CircuitBreaker
+from rate_limit import TokenBucket
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(bitscrunch, "backoff_delay", lambda attempt, retry_after=None: 0)
+
+
+def _api(handler):
+    api = AsyncBitsCrunchAPI("test-key", rate_limiter=TokenBucket(1000, 1000))
+    api.client = httpx.AsyncClient(base_url=api.base_url, transport=httpx.MockTransport(handler))
+    return api
+
+
+def _responses(*responses):
+    """Handler answering with ``responses`` in turn and recording each request."""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return responses[min(len(requests), len(responses)) - 1]
+
+    handler.requests = requests
+    return handler
+
+
+def _responses_from(respond):
+    """Handler answering through ``respond(request)`` and recording each request."""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return respond(request)
+
+    handler.requests = requests
+    return handler
+
+
+def test_fetch_retries_server_errors_then_succeeds():
+    handler = _responses(httpx.Response(502), httpx.Response(200, json={"data": [{"wallet_address": "0x1"}]}))
+    api = _api(handler)
+    assert asyncio.run(api.get_wallet_scores(wallet="0x1")) == [{"wallet_address": "0x1"}]
+    assert len(handler.requests) == 2
+    assert api.breaker_for("nft/wallet/scores").stats()["calls_in_window"] == 2
+
+
+def test_fetch_does_not_retry_client_errors():
+    handler = _responses(httpx.Response(404))
+    api = _api(handler)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(api.get_wallet_scores(wallet="0x1"))
+    assert error.value.status_code == 404
+    assert len(handler.requests) == 1
+    assert api.breaker_for("nft/wallet/scores").stats()["failure_rate"] == 0.0
+
+
+def test_throttling_does_not_count_against_the_circuit():
+    handler = _responses(httpx.Response(429, headers={"Retry-After": "0"}), httpx.Response(200, json={"data": []}))
+    api = _api(handler)
+    assert asyncio.run(api.get_wallet_scores(wallet="0x1")) == []
+    stats = api.breaker_for("nft/wallet/scores").stats()
+    assert stats["calls_in_window"] == 1 and stats["failure_rate"] == 0.0
+
+
+def test_open_circuit_fails_fast_without_calling_upstream():
+    handler = _responses(httpx.Response(500))
+    api = _api(handler)
+    breaker = api.breakers[endpoint_family("nft/wallet/scores")] = CircuitBreaker("scores", min_calls=2, open_seconds=60)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(api.get_wallet_scores(wallet="0x1"))
+    assert error.value.status_code == 503
+    assert "Retry-After" in error.value.headers
+    assert breaker.state == OPEN
+    assert len(handler.requests) == 2
+
+    with pytest.raises(HTTPException):
+        asyncio.run(api.get_wallet_scores(wallet="0x2"))
+    assert len(handler.requests) == 2
+
+
+def test_connection_errors_are_failures():
+    def handler(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    api = _api(handler)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(api.get_wallet_scores(wallet="0x1"))
+    assert error.value.status_code == 500
+    breaker = api.breaker_for("nft/wallet/scores")
+    assert breaker.state == CLOSED
+    assert breaker.stats()["failure_rate"] == 1.0
+
+
+def _pages(rows):
+    """A ``get_*``-style method over ``rows`` that records the pages asked for."""
+    calls = []
+
+    async def method(offset=0, limit=30):
+        calls.append((offset, limit))
+        return rows[offset:offset + limit]
+
+    method.calls = calls
+    return method
+
+
+def test_iter_pages_stops_at_the_first_short_page():
+    method = _pages(list(range(25)))
+    api = AsyncBitsCrunchAPI("test-key")
+
+    async def run():
+        return [page async for page in api.iter_pages(method, page_size=10)]
+
+    assert asyncio.run(run()) == [list(range(10)), list(range(10, 20)), list(range(20, 25))]
+    assert method.calls[:3] == [(0, 10), (10, 10), (20, 10)]
+
+
+def test_iter_items_respects_max_items_and_known_total():
+    method = _pages(list(range(100)))
+    api = AsyncBitsCrunchAPI("test-key")
+
+    async def run():
+        return [item async for item in api.iter_items(method, page_size=10, max_items=25, total=100)]
+
+    assert asyncio.run(run()) == list(range(25))
+    assert sorted(method.calls) == [(0, 10), (10, 10), (20, 5)]
+
+
+def test_fetch_batch_sends_ids_as_given_and_matches_case_insensitively():
+    def handler(request):
+        wallets = request.url.params.get_list("wallet")
+        if "0xBAD" in wallets:
+            return httpx.Response(400)
+        return httpx.Response(200, json={"data": [{"wallet_address": wallet.lower()} for wallet in wallets]})
+
+    handler = _responses_from(handler)
+    api = _api(handler)
+    result = asyncio.run(api.fetch_batch(
+        api.get_wallet_scores, "wallet", "wallet_address", ["0xAbC", "0xabc", "So1ana", "0xBAD", ""], batch_size=1
+    ))
+
+    sent = [request.url.params.get_list("wallet") for request in handler.requests]
+    assert sorted(sent) == [["0xAbC"], ["0xBAD"], ["So1ana"]]
+    assert result["0xAbC"] == result["0xabc"] == [{"wallet_address": "0xabc"}]
+    assert result["So1ana"] == [{"wallet_address": "so1ana"}]
+    assert "error" in result["0xBAD"]
+    assert "" not in result
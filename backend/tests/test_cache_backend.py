@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import pytest
+
+from cache_backend import InMemoryCacheBackend, RedisCacheBackend, build_cache_backend
+
+
+def _memory():
+    return InMemoryCacheBackend()
+
+
+def _redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisCacheBackend(client=fakeredis.aioredis.FakeRedis(), prefix="test:")
+
+
+@pytest.fixture(params=[_memory, _redis], ids=["memory", "redis"])
+def make_backend(request):
+    return request.param
+
+
+def test_set_get_and_expiry(make_backend):
+    async def run():
+        backend = make_backend()
+        assert await backend.get("k") is None
+        await backend.set("k", {"rows": [1, 2]}, 0.2)
+        value, seconds_left = await backend.get("k")
+        assert value == {"rows": [1, 2]}
+        assert 0 < seconds_left <= 0.2
+        await asyncio.sleep(0.25)
+        assert await backend.get("k") is None
+        await backend.close()
+
+    asyncio.run(run())
+
+
+def test_lock_is_exclusive_until_released_or_expired(make_backend):
+    async def run():
+        backend = make_backend()
+        assert await backend.acquire_lock("k", 0.2) is True
+        assert await backend.acquire_lock("k", 0.2) is False
+        await backend.release_lock("k")
+        assert await backend.acquire_lock("k", 0.2) is True
+        await asyncio.sleep(0.25)
+        assert await backend.acquire_lock("k", 0.2) is True
+        await backend.close()
+
+    asyncio.run(run())
+
+
+def test_wait_for_sees_value_set_by_lock_holder(make_backend):
+    async def run():
+        backend = make_backend()
+
+        async def holder():
+            await asyncio.sleep(0.1)
+            await backend.set("k", "done", 10)
+
+        task = asyncio.ensure_future(holder())
+        value, _ = await backend.wait_for("k", timeout=2)
+        assert value == "done"
+        await task
+        assert await backend.wait_for("missing", timeout=0.1) is None
+        await backend.close()
+
+    asyncio.run(run())
+
+
+def test_throttle_limits_calls_per_second(make_backend):
+    async def run():
+        backend = make_backend()
+        # Start at the beginning of a window so all calls land in at most two
+        await asyncio.sleep(1 - time.time() % 1)
+        started = time.monotonic()
+        for _ in range(4):
+            await backend.throttle("upstream", 3)
+        assert time.monotonic() - started >= 0.5
+        await backend.close()
+
+    asyncio.run(run())
+
+
+def test_pause_blocks_throttle(make_backend):
+    async def run():
+        backend = make_backend()
+        await backend.pause("upstream", 0.3)
+        started = time.monotonic()
+        await backend.throttle("upstream", 100)
+        assert time.monotonic() - started >= 0.25
+        await backend.close()
+
+    asyncio.run(run())
+
+
+def test_build_cache_backend():
+    assert build_cache_backend("") is None
+    assert isinstance(build_cache_backend("memory"), InMemoryCacheBackend)
+    with pytest.raises(ValueError):
+        build_cache_backend("memcached://localhost")
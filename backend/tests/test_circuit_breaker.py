@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+def _breaker(**options):
+    settings = {"window": 60, "min_calls": 4, "failure_rate": 0.5, "open_seconds": 0.1}
+    settings.update(options)
+    return CircuitBreaker("test", **settings)
+
+
+def test_opens_at_failure_rate_once_enough_calls():
+    breaker = _breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    assert breaker.stats()["rejected"] == 2
+
+
+def test_old_outcomes_leave_the_window():
+    breaker = _breaker(window=0.05)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    assert breaker.stats()["calls_in_window"] == 1
+
+
+def test_half_open_probe_closes_or_reopens():
+    breaker = _breaker()
+    breaker._open()
+    time.sleep(0.11)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    time.sleep(0.11)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_release_frees_the_probe_slot():
+    breaker = _breaker(open_seconds=10)
+    breaker._open()
+    breaker._opened_at -= 10
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+
+
+def test_lost_probe_is_replaced_after_open_seconds():
+    breaker = _breaker()
+    breaker._open()
+    time.sleep(0.11)
+    assert breaker.allow()
+    time.sleep(0.11)
+    assert breaker.allow()
@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+
+from concurrency import SingleFlight, bounded_gather, gather_partial
+from request_context import deadline_scope, remaining
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    async def run():
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "value"
+
+        results = await asyncio.gather(*(flight.do("key", fetch) for _ in range(5)))
+        assert results == ["value"] * 5
+        assert len(calls) == 1
+        assert flight.stats() == {"in_flight": 0, "started": 1, "coalesced": 4}
+
+    asyncio.run(run())
+
+
+def test_single_flight_shares_exceptions():
+    async def run():
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream down")
+
+        results = await asyncio.gather(flight.do("key", fetch), flight.do("key", fetch), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+    asyncio.run(run())
+
+
+def test_single_flight_caller_cancellation_does_not_cancel_others():
+    async def run():
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            return "value"
+
+        first = asyncio.ensure_future(flight.do("key", fetch))
+        second = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "value"
+
+    asyncio.run(run())
+
+
+def test_gather_partial_reports_errors_per_key():
+    async def run():
+        async def fail():
+            raise ValueError("boom")
+
+        async def slow():
+            await asyncio.sleep(1)
+
+        async def ok():
+            return "ok"
+
+        results = await gather_partial({"fail": fail(), "slow": slow(), "ok": ok()}, timeout=0.05)
+        assert results["ok"] == "ok"
+        assert results["fail"] == {"error": "boom"}
+        assert "Timed out" in results["slow"]["error"]
+
+    asyncio.run(run())
+
+
+def test_single_flight_task_ignores_the_starting_callers_deadline():
+    async def run():
+        flight = SingleFlight()
+        seen = []
+
+        async def fetch():
+            seen.append(remaining())
+            await asyncio.sleep(0.1)
+            return "value"
+
+        async def hurried():
+            with deadline_scope(0.02):
+                return await flight.do("key", fetch)
+
+        hurried_result, patient_result = await asyncio.gather(hurried(), flight.do("key", fetch), return_exceptions=True)
+        assert isinstance(hurried_result, asyncio.TimeoutError)
+        assert patient_result == "value"
+        assert seen == [None]
+
+    asyncio.run(run())
+
+
+def test_bounded_gather_keeps_finished_results_on_timeout():
+    async def run():
+        async def value(result, delay):
+            await asyncio.sleep(delay)
+            return result
+
+        results = await bounded_gather([value(1, 0), value(2, 1), value(3, 0)], concurrency=2, timeout=0.1)
+        assert results[0] == 1 and results[2] == 3
+        assert isinstance(results[1], asyncio.TimeoutError)
+
+    asyncio.run(run())
+
+
+def test_gather_partial_reports_cancelled_children():
+    async def run():
+        async def ok():
+            return "ok"
+
+        async def cancelled():
+            raise asyncio.CancelledError()
+
+        results = await gather_partial({"ok": ok(), "cancelled": cancelled()})
+        assert results == {"ok": "ok", "cancelled": {"error": "Cancelled"}}
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("helper", ["bounded_gather", "gather_partial"])
+def test_gather_helpers_cancel_children_when_cancelled(helper):
+    async def run():
+        cancelled = []
+
+        async def child():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        if helper == "bounded_gather":
+            task = asyncio.ensure_future(bounded_gather([child(), child()]))
+        else:
+            task = asyncio.ensure_future(gather_partial({"a": child(), "b": child()}))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert len(cancelled) == 2
+
+    asyncio.run(run())
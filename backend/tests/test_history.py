@@ -0,0 +1,69 @@
+import sqlite3
+import time
+
+from history import HistoryStore, entity_key, extract_points
+
+ADDRESS = "0xBC4CA0eda7647A8ab7C2061c2E118A18a936f13D"
+COLLECTION = entity_key("collection", ADDRESS)
+
+
+def test_extract_points_namespaces_metrics_by_endpoint_and_time_range():
+    rows = [{
+        "contract_address": ADDRESS,
+        "volume": 10,
+        "name": "BAYC",
+        "block_dates": ["2024-01-01T00:00:00", "2024-01-02T00:00:00"],
+        "volume_trend": [1, 2]
+    }]
+    points = extract_points("nft/collection/analytics", {"time_range": "7d"}, rows, fetched_at=1000)
+    assert (COLLECTION, "analytics.volume_7d", 1000, 10.0) in points
+    assert sorted(value for _, metric, _, value in points if metric == "analytics.volume_trend_7d") == [1.0, 2.0]
+    assert not any(metric.startswith("analytics.name") for _, metric, _, _ in points)
+
+
+def test_extract_points_skips_endpoints_with_several_rows_per_entity():
+    rows = [{"contract_address": ADDRESS, "trait_count": 5}, {"contract_address": ADDRESS, "trait_count": 9}]
+    assert extract_points("nft/collection/traits", {}, rows, fetched_at=1000) == []
+
+
+def test_recorded_responses_can_be_queried_and_summarised(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    store.start()
+    now = time.time()
+    for offset, value in ((-7200, 100), (-3600, 150)):
+        store._queue.put(("nft/collection/scores", {}, [{"contract_address": ADDRESS, "marketcap": value}], now + offset))
+    store.stop()
+
+    assert store.metrics(COLLECTION) == ["scores.marketcap"]
+    assert store.query(COLLECTION, "scores.marketcap")[1] == [100.0, 150.0]
+    summary = store.summary(COLLECTION, since=now - 86400)["scores.marketcap"]
+    assert (summary["first"], summary["last"], summary["change"], summary["points"]) == (100.0, 150.0, 0.5, 2)
+    assert store.stats()["written"] == 2
+
+
+def test_maintenance_compacts_old_points_and_drops_expired_ones(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"), retention_days=30, compact_after_days=7)
+    hour = (int(time.time()) - 10 * 86400) // 3600 * 3600
+    expired = int(time.time()) - 31 * 86400
+    conn = sqlite3.connect(store.path)
+    with conn:
+        conn.executemany("INSERT INTO snapshots VALUES (?, ?, ?, ?)", [
+            (COLLECTION, "scores.marketcap", hour + 60, 10.0),
+            (COLLECTION, "scores.marketcap", hour + 120, 20.0),
+            (COLLECTION, "scores.marketcap", expired, 1.0),
+        ])
+    store._maintain(conn)
+    conn.close()
+
+    assert store.query(COLLECTION, "scores.marketcap") == ([hour], [15.0])
+
+
+def test_reopening_an_old_schema_drops_unversioned_points(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    HistoryStore(path)
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("INSERT INTO snapshots VALUES (?, ?, ?, ?)", (COLLECTION, "marketcap", 1, 1.0))
+        conn.execute("PRAGMA user_version = 0")
+    conn.close()
+    assert HistoryStore(path).metrics(COLLECTION) == []
@@ -0,0 +1,39 @@
+from intent_router import IntentRouter
+
+WALLETS = ["0x1111111111111111111111111111111111111111", "0x2222222222222222222222222222222222222222"]
+
+
+def test_single_wallet_action_targets_first_wallet():
+    decision = IntentRouter().route("how is my wallet health?", WALLETS)
+    assert decision["action"] == "wallet_overview"
+    assert decision["target_wallet"] == WALLETS[0]
+
+
+def test_multi_wallet_actions_leave_target_empty():
+    router = IntentRouter()
+    assert router.route("which wallet performed better?", WALLETS)["target_wallet"] is None
+    assert router.route("how's my portfolio doing", WALLETS)["target_wallet"] is None
+
+
+def test_unmatched_query_is_deferred():
+    router = IntentRouter()
+    assert router.route("value my punk 7804", WALLETS) is None
+    assert router.stats()["deferred_to_llm"] == 1
+
+
+def test_greetings_take_trailing_filler():
+    router = IntentRouter()
+    for query in ("hey there", "hi there!", "hello, what can you do?"):
+        assert router.route(query)["action"] == "general_conversation"
+    assert router.route("hi, what's trending?")["action"] == "market_trending"
+
+
+def test_match_covered_by_a_more_specific_rule_is_not_ambiguous():
+    router = IntentRouter()
+    assert router.route("compare my wallets", WALLETS)["action"] == "wallet_comparison"
+    assert router.route("what's trending in the nft market")["action"] == "market_trending"
+    assert router.route("is my portfolio risky", WALLETS)["action"] == "risk_analysis"
+
+
+def test_unrelated_intents_are_ambiguous():
+    assert IntentRouter().route("my wallets and whales", WALLETS) is None
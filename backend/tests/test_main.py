@@ -0,0 +1,21 @@
+import sqlite3
+
+from fastapi.testclient import TestClient
+
+import main
+
+client = TestClient(main.app)
+
+
+def test_portfolio_reports_profile_store_errors(monkeypatch):
+    async def locked(user_id):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(main.profile_store, "get", locked)
+    response = client.get("/user/portfolio/alice")
+    assert response.status_code == 200
+    assert response.json() == {"error": "Failed to load profile: database is locked"}
+
+
+def test_portfolio_without_saved_wallets():
+    assert client.get("/user/portfolio/nobody").json() == {"error": "No saved wallets for this user"}
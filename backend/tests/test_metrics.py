@@ -0,0 +1,20 @@
+from metrics import Registry
+
+
+def test_gauge_families_are_contiguous_and_totals_are_counters():
+    registry = Registry()
+    registry.register_gauges(lambda: [
+        ("aegis_cache_hits_total", "Cache hits", {"cache": "a"}, 1),
+        ("aegis_cache_size", "Cache entries", {"cache": "a"}, 5),
+        ("aegis_cache_hits_total", "Cache hits", {"cache": "b"}, 2),
+    ])
+    lines = registry.render().splitlines()
+    assert lines == [
+        "# HELP aegis_cache_hits_total Cache hits",
+        "# TYPE aegis_cache_hits_total counter",
+        'aegis_cache_hits_total{cache="a"} 1',
+        'aegis_cache_hits_total{cache="b"} 2',
+        "# HELP aegis_cache_size Cache entries",
+        "# TYPE aegis_cache_size gauge",
+        'aegis_cache_size{cache="a"} 5',
+    ]
@@ -0,0 +1,108 @@
+import asyncio
+
+from cache_backend import InMemoryCacheBackend
+from portfolio import PortfolioPrecomputer
+from profiles import CachedProfileStore, SQLiteProfileStore
+
+
+class FakeWalletApi:
+    """Answers the batch and holdings calls PortfolioPrecomputer makes, recording the wallets asked for."""
+
+    def __init__(self, values, holdings, washtrade=None, failing=()):
+        self.values = values
+        self.holdings = holdings
+        self.washtrade = washtrade or {}
+        self.failing = set(failing)
+        self.fetched = []
+
+    async def get_wallet_health_batch(self, wallets):
+        self.fetched.extend(wallets)
+        return {
+            wallet: {"error": "upstream down"} if wallet in self.failing
+            else [{"wallet_address": wallet, "portfolio_value": self.values[wallet]}]
+            for wallet in wallets
+        }
+
+    async def fetch_batch(self, method, entity_param, entity_field, wallets, **kwargs):
+        return {wallet: [{"washtrade_volume": self.washtrade.get(wallet, 0)}] for wallet in wallets}
+
+    async def get_wallet_washtrade(self, **kwargs):
+        raise AssertionError("called through fetch_batch")
+
+    async def get_wallet_nft_balance(self, wallet, limit=None):
+        return [{"collection": collection, "quantity": count} for collection, count in self.holdings.get(wallet, {}).items()]
+
+
+def _profiles():
+    return CachedProfileStore(SQLiteProfileStore(":memory:"))
+
+
+def test_update_user_summarises_and_only_fetches_new_wallets():
+    async def run():
+        api = FakeWalletApi(
+            values={"0xa": 300.0, "0xb": 100.0},
+            holdings={"0xa": {"azuki": 3}, "0xb": {"azuki": 1, "bayc": 4}},
+            washtrade={"0xb": 25.0}
+        )
+        portfolios = PortfolioPrecomputer(api, _profiles())
+
+        await portfolios.update_user("alice", ["0xa"])
+        await portfolios.update_user("alice", ["0xa", "0xb"])
+        assert api.fetched == ["0xa", "0xb"]
+
+        summary = await portfolios.get("alice")
+        assert summary["total_portfolio_value"] == 400.0
+        assert [wallet["portfolio_value_share"] for wallet in summary["wallets"]] == [0.75, 0.25]
+        assert summary["washtrade_exposure"] == {"washtrade_volume": 25.0, "washtrade_assets": 0, "wallets_with_washtrade": 1}
+        concentration = summary["concentration"]
+        assert (concentration["collection_count"], concentration["nft_count"]) == (2, 8)
+        assert concentration["collection_hhi"] == 0.5
+
+    asyncio.run(run())
+
+
+def test_refresh_all_fetches_shared_wallets_once_and_tracks_deltas():
+    async def run():
+        profiles = _profiles()
+        await profiles.save({"user_id": "alice", "wallet_addresses": ["0xA"], "watchlist_collections": [], "preferences": {}})
+        await profiles.save({"user_id": "bob", "wallet_addresses": ["0xa", "0xc"], "watchlist_collections": [], "preferences": {}})
+        api = FakeWalletApi(values={"0xA": 10.0, "0xa": 10.0, "0xc": 5.0}, holdings={})
+        portfolios = PortfolioPrecomputer(api, profiles, interval=0)
+
+        await portfolios.refresh_all()
+        assert sorted(wallet.lower() for wallet in api.fetched) == ["0xa", "0xc"]
+        assert (await portfolios.get("bob"))["total_portfolio_value"] == 15.0
+
+        api.values = {"0xA": 12.0, "0xa": 12.0, "0xc": 5.0}
+        await portfolios.refresh_all()
+        assert (await portfolios.get("alice"))["wallets"][0]["portfolio_value_delta"] == 2.0
+
+    asyncio.run(run())
+
+
+def test_failed_wallet_keeps_previous_data_and_missing_data_gives_no_summary():
+    async def run():
+        api = FakeWalletApi(values={"0xa": 10.0, "0xb": 1.0}, holdings={}, failing={"0xb"})
+        portfolios = PortfolioPrecomputer(api, _profiles(), max_age=60)
+        await portfolios.update_user("alice", ["0xa", "0xb"])
+        assert await portfolios.get("alice") is None
+
+        await portfolios.ensure_wallets(["0xa"], max_age=0)
+        assert portfolios.summarize(["0xa"])["total_portfolio_value"] == 10.0
+
+    asyncio.run(run())
+
+
+def test_other_workers_read_published_wallets_and_summaries():
+    async def run():
+        shared = InMemoryCacheBackend()
+        api = FakeWalletApi(values={"0xa": 10.0}, holdings={"0xa": {"azuki": 1}})
+        leader = PortfolioPrecomputer(api, _profiles(), shared=shared)
+        follower = PortfolioPrecomputer(FakeWalletApi(values={}, holdings={}), _profiles(), shared=shared)
+
+        await leader.update_user("alice", ["0xa"])
+        assert (await follower.get("alice"))["total_portfolio_value"] == 10.0
+        summary = await follower.current_summary(["0xa"])
+        assert summary["concentration"]["top_collections"][0]["collection"] == "azuki"
+
+    asyncio.run(run())
@@ -0,0 +1,48 @@
+import asyncio
+
+from cache_backend import InMemoryCacheBackend
+from prefetch import SnapshotScheduler
+from request_context import cache_bypass
+
+
+def test_other_workers_serve_the_refreshing_workers_snapshot():
+    async def run():
+        shared = InMemoryCacheBackend()
+        leader = SnapshotScheduler(interval=60, shared=shared)
+        follower = SnapshotScheduler(interval=60, shared=shared)
+
+        async def loader():
+            return {"bypassed_cache": cache_bypass.get()}
+
+        for scheduler in (leader, follower):
+            scheduler.register("market", loader)
+        assert await follower.get("market") is None
+
+        leader.start()
+        await asyncio.sleep(0.05)
+        await leader.stop()
+        snapshot = await follower.get("market")
+        assert snapshot["data"] == {"bypassed_cache": True}
+
+    asyncio.run(run())
+
+
+def test_snapshot_expires_when_refreshes_keep_failing():
+    async def run():
+        scheduler = SnapshotScheduler(interval=60)
+        scheduler.register("market", lambda: asyncio.sleep(0, result=[1]), max_age=120)
+        assert await scheduler.refresh("market")
+        assert (await scheduler.get("market"))["data"] == [1]
+        scheduler._snapshots["market"]["fetched_at"] -= 121
+        assert await scheduler.get("market") is None
+
+    asyncio.run(run())
+
+
+def test_unregistered_snapshot_is_missing():
+    async def run():
+        scheduler = SnapshotScheduler(interval=60, shared=InMemoryCacheBackend())
+        scheduler.register("trending:ethereum:24h", lambda: asyncio.sleep(0, result=[1]))
+        assert await scheduler.get("trending:ethereum:30d") is None
+
+    asyncio.run(run())
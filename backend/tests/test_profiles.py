@@ -0,0 +1,36 @@
+import asyncio
+
+from cache_backend import InMemoryCacheBackend
+from profiles import CachedProfileStore, SQLiteProfileStore
+
+
+def _profile(user_id, wallets):
+    return {"user_id": user_id, "wallet_addresses": wallets, "watchlist_collections": [], "preferences": {}}
+
+
+def test_save_invalidates_other_workers_through_shared_backend():
+    async def run():
+        database = SQLiteProfileStore(":memory:")
+        shared = InMemoryCacheBackend()
+        worker_a = CachedProfileStore(database, shared=shared)
+        worker_b = CachedProfileStore(database, shared=shared)
+
+        assert await worker_b.get("alice") is None
+        await worker_a.save(_profile("alice", ["0xabc"]))
+        assert (await worker_b.get("alice"))["wallet_addresses"] == ["0xabc"]
+
+        await worker_a.save(_profile("alice", ["0xdef"]))
+        assert (await worker_b.get("alice"))["wallet_addresses"] == ["0xdef"]
+
+    asyncio.run(run())
+
+
+def test_reads_are_cached_without_shared_backend():
+    async def run():
+        store = CachedProfileStore(SQLiteProfileStore(":memory:"))
+        await store.save(_profile("bob", ["0x1"]))
+        await store.get("bob")
+        await store.get("bob")
+        assert store.stats()["hits"] == 1
+
+    asyncio.run(run())
@@ -0,0 +1,39 @@
+import json
+
+from prompt_data import compact_prompt_data
+
+
+def _compact(action, data, **options):
+    return json.loads(compact_prompt_data(action, data, **options))
+
+
+def test_rows_are_projected_onto_action_fields():
+    rows = [{"collection": "azuki", "volume": 1234.5678, "banner_image_url": "https://x", "volume_trend": [1, 2]}]
+    assert _compact("market_trending", rows) == {"columns": ["collection", "volume"], "rows": [["azuki", 1234.6]]}
+
+
+def test_wrapper_rows_keep_their_nested_payloads():
+    data = {"collections": [{"collection_id": "0xabc", "stats": [{"floor_price": 1.5, "image_url": "https://x"}]}]}
+    table = _compact("collection_performance", data)["collections"]
+    assert table["columns"] == ["collection_id", "stats"]
+    assert table["rows"] == [["0xabc", {"columns": ["floor_price"], "rows": [[1.5]]}]]
+
+
+def test_risk_rows_keep_health_indicators_and_market_data():
+    data = {"risk_summary": {"wallets": [{"wallet": "Wallet 1", "health_indicators": [{"wallet_score": 80}]}],
+                             "collections": [{"collection_id": "0xabc", "market_data": {"holders": 12}}]}}
+    summary = _compact("risk_analysis", data)["risk_summary"]
+    assert summary["wallets"]["rows"] == [["Wallet 1", {"columns": ["wallet_score"], "rows": [[80]]}]]
+    assert summary["collections"]["rows"] == [["0xabc", {"holders": 12}]]
+
+
+def test_container_keys_survive_but_debug_info_is_dropped():
+    data = {"trending_collections": [{"collection": "azuki"}], "debug_info": {"query": "what's trending?"}}
+    assert _compact("market_trending", data) == {"trending_collections": {"columns": ["collection"], "rows": [["azuki"]]}}
+
+
+def test_rows_are_halved_to_fit_the_budget():
+    rows = [{"collection": f"collection-{i}", "volume": i} for i in range(10)]
+    table = _compact("market_trending", rows, token_budget=40)
+    assert len(table["rows"]) < 10
+    assert table["omitted_rows"] == 10 - len(table["rows"])
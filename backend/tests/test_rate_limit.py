@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+from rate_limit import TokenBucket, backoff_delay, parse_retry_after
+from request_context import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+
+def test_burst_then_refill_rate():
+    async def run():
+        bucket = TokenBucket(rate=20, capacity=5)
+        started = time.monotonic()
+        for _ in range(5):
+            assert await bucket.acquire() == 0.0
+        assert time.monotonic() - started < 0.05
+        for _ in range(4):
+            await bucket.acquire()
+        # Four more tokens at 20 per second
+        assert time.monotonic() - started >= 0.15
+
+    asyncio.run(run())
+
+
+def test_interactive_lane_is_served_before_background():
+    async def run():
+        bucket = TokenBucket(rate=20, capacity=1)
+        await bucket.acquire()
+        order = []
+
+        async def take(priority, label):
+            await bucket.acquire(priority)
+            order.append(label)
+
+        background = [asyncio.ensure_future(take(PRIORITY_BACKGROUND, f"bg{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(take(PRIORITY_INTERACTIVE, "interactive"))
+        await asyncio.gather(*background, interactive)
+        assert order[0] == "interactive"
+        assert bucket.stats()["lanes"]["background"]["acquired"] == 3
+
+    asyncio.run(run())
+
+
+def test_pause_empties_bucket():
+    async def run():
+        bucket = TokenBucket(rate=100, capacity=10)
+        bucket.pause(0.2)
+        started = time.monotonic()
+        await bucket.acquire()
+        assert time.monotonic() - started >= 0.2
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_does_not_take_a_token():
+    async def run():
+        bucket = TokenBucket(rate=10, capacity=1)
+        await bucket.acquire()
+        waiter = asyncio.ensure_future(bucket.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        started = time.monotonic()
+        await bucket.acquire()
+        assert time.monotonic() - started < 0.15
+
+    asyncio.run(run())
+
+
+def test_retry_helpers():
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert 0 <= backoff_delay(3, base=0.5) <= 4.0
+    assert 5.0 <= backoff_delay(0, retry_after=5) <= 5.5
@@ -0,0 +1,56 @@
+import math
+
+from timeseries import SeriesFrame, SeriesStore, downsample, lttb, minmax
+
+
+def _series(n):
+    xs = list(range(n))
+    ys = [math.sin(x / 10) for x in xs]
+    ys[n // 3] = 50.0
+    return xs, ys
+
+
+def test_lttb_keeps_endpoints_order_and_spikes():
+    xs, ys = _series(1000)
+    out_x, out_y = lttb(xs, ys, 100)
+    assert len(out_x) == len(out_y) == 100
+    assert (out_x[0], out_x[-1]) == (0, 999)
+    assert out_x == sorted(out_x)
+    assert 50.0 in out_y
+
+
+def test_minmax_keeps_each_buckets_extremes():
+    xs, ys = _series(1000)
+    out_x, out_y = minmax(xs, ys, 100)
+    assert len(out_x) <= 100
+    assert out_x == sorted(out_x)
+    assert max(out_y) == 50.0 and min(out_y) == min(ys)
+
+
+def test_short_series_are_returned_unchanged():
+    xs, ys = [1, 2, 3], [3.0, 1.0, 2.0]
+    assert lttb(xs, ys, 10) == (xs, ys)
+    assert minmax(xs, ys, 10) == (xs, ys)
+    assert downsample(xs, ys, points=2) == (xs, ys)
+
+
+def test_frame_from_analytics_sorts_by_date_and_skips_missing_values():
+    rows = [{
+        "block_dates": ["2024-01-02T00:00:00", "2024-01-01T00:00:00"],
+        "volume_trend": [2, None],
+        "sales_trend": [5, 4],
+        "other_trend": [1]
+    }]
+    frame = SeriesFrame.from_analytics(rows)
+    assert sorted(frame.columns) == ["sales", "volume"]
+    assert frame.series("sales")[1] == [4.0, 5.0]
+    assert frame.series("volume") == ([frame.timestamps[1]], [2.0])
+
+
+def test_series_store_expires_and_evicts():
+    store = SeriesStore(maxsize=1)
+    store.put("a", SeriesFrame.from_analytics([]))
+    assert store.get("a", max_age=60) is not None
+    assert store.get("a", max_age=-1) is None
+    store.put("b", SeriesFrame.from_analytics([]))
+    assert store.get("a", max_age=60) is None
@@ -0,0 +1,206 @@
+import math
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+# Time ranges the BitsCrunch analytics endpoints accept, shortest first
+TIME_RANGES = ("24h", "7d", "30d", "90d", "all")
+DEFAULT_POINTS = int(os.getenv("CHART_DEFAULT_POINTS", 200))
+MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", 2000))
+CHART_STORE_MAXSIZE = int(os.getenv("CHART_STORE_MAXSIZE", 512))
+
+_TREND_SUFFIX = "_trend"
+
+
+def parse_timestamp(value):
+    """Epoch seconds from a BitsCrunch ``block_dates`` entry, or ``None``."""
+    if isinstance(value, (int, float)):
+        return float(value / 1000 if value > 1e11 else value)
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00").replace(" ", "T"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class SeriesFrame:
+    """Columnar points for one collection and time range.
+
+    One ``array('d')`` of timestamps, sorted ascending, shared by one
+    ``array('d')`` per metric. Missing values are stored as NaN.
+    """
+
+    __slots__ = ("timestamps", "columns", "fetched_at")
+
+    def __init__(self, timestamps, columns, fetched_at=None):
+        self.timestamps = timestamps
+        self.columns = columns
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+
+    @classmethod
+    def from_analytics(cls, rows):
+        """Build a frame from ``nft/collection/analytics`` rows.
+
+        Uses the first row's ``block_dates`` as the time axis and every
+        ``*_trend`` list of the same length as a metric column, named
+        without the suffix (``volume_trend`` -> ``volume``).
+        """
+        row = rows[0] if isinstance(rows, list) and rows else rows if isinstance(rows, dict) else {}
+        dates = row.get("block_dates") or []
+        stamps = [parse_timestamp(date) for date in dates]
+        order = sorted((ts, i) for i, ts in enumerate(stamps) if ts is not None)
+
+        columns = {}
+        for key, values in row.items():
+            if key.endswith(_TREND_SUFFIX) and isinstance(values, list) and len(values) == len(dates):
+                columns[key[:-len(_TREND_SUFFIX)]] = array("d", (_to_float(values[i]) for _, i in order))
+        return cls(array("d", (ts for ts, _ in order)), columns)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in [self.timestamps, *self.columns.values()])
+
+    def series(self, metric):
+        """``(timestamps, values)`` lists for ``metric``, skipping missing values."""
+        column = self.columns.get(metric)
+        if column is None:
+            return [], []
+        points = [(ts, value) for ts, value in zip(self.timestamps, column) if not math.isnan(value)]
+        return [ts for ts, _ in points], [value for _, value in points]
+
+
+class SeriesStore:
+    """LRU-bounded in-memory store of :class:`SeriesFrame` objects."""
+
+    def __init__(self, maxsize=CHART_STORE_MAXSIZE):
+        self.maxsize = maxsize
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, max_age):
+        """The frame for ``key`` if it was fetched less than ``max_age`` seconds ago."""
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is None or time.time() - frame.fetched_at > max_age:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return frame
+
+    def fresh(self, key, max_age):
+        """Whether ``key`` holds a frame younger than ``max_age``, without counting a hit or miss."""
+        with self._lock:
+            frame = self._frames.get(key)
+            return frame is not None and time.time() - frame.fetched_at <= max_age
+
+    def put(self, key, frame):
+        with self._lock:
+            self._frames[key] = frame
+            self._frames.move_to_end(key)
+            while len(self._frames) > self.maxsize:
+                self._frames.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            frames = list(self._frames.values())
+            total = self.hits + self.misses
+            return {
+                "frames": len(frames),
+                "maxsize": self.maxsize,
+                "points": sum(len(frame) for frame in frames),
+                "bytes": sum(frame.nbytes for frame in frames),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0
+            }
+
+
+def lttb(xs, ys, threshold):
+    """Largest-Triangle-Three-Buckets downsampling to ``threshold`` points.
+
+    Keeps the first and last points and, from each bucket in between, the
+    point forming the largest triangle with the previously kept point and
+    the average of the next bucket, which preserves the visual shape.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(xs), list(ys)
+
+    out_x, out_y = [xs[0]], [ys[0]]
+    every = (n - 2) / (threshold - 2)
+    kept = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_start, next_end = end, min(int((bucket + 2) * every) + 1, n)
+        span = max(next_end - next_start, 1)
+        avg_x = sum(xs[next_start:next_end]) / span if next_end > next_start else xs[-1]
+        avg_y = sum(ys[next_start:next_end]) / span if next_end > next_start else ys[-1]
+
+        ax, ay = xs[kept], ys[kept]
+        best, best_area = start, -1.0
+        for i in range(start, min(end, n - 1)):
+            area = abs((ax - avg_x) * (ys[i] - ay) - (ax - xs[i]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = i, area
+        out_x.append(xs[best])
+        out_y.append(ys[best])
+        kept = best
+
+    out_x.append(xs[-1])
+    out_y.append(ys[-1])
+    return out_x, out_y
+
+
+def minmax(xs, ys, threshold):
+    """Keep the minimum and maximum of each of ``threshold // 2`` buckets, in time order.
+
+    Cheaper than :func:`lttb` and never hides a spike, at the cost of a
+    slightly noisier line.
+    """
+    n = len(xs)
+    buckets = threshold // 2
+    if threshold >= n or buckets < 1:
+        return list(xs), list(ys)
+
+    out_x, out_y = [], []
+    size = n / buckets
+    for bucket in range(buckets):
+        start, end = int(bucket * size), int((bucket + 1) * size)
+        if start >= end:
+            continue
+        low = min(range(start, end), key=ys.__getitem__)
+        high = max(range(start, end), key=ys.__getitem__)
+        for i in sorted({low, high}):
+            out_x.append(xs[i])
+            out_y.append(ys[i])
+    return out_x, out_y
+
+
+DOWNSAMPLERS = {"lttb": lttb, "minmax": minmax}
+
+
+def downsample(xs, ys, points=DEFAULT_POINTS, method="lttb"):
+    """Reduce a series to at most ``points`` points with the named method."""
+    points = max(3, min(int(points), MAX_POINTS))
+    return DOWNSAMPLERS.get(method, lttb)(xs, ys, points)
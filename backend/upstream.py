@@ -0,0 +1,58 @@
+import os
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from request_context import remaining
+
+# Connection pool and timeout settings shared by every upstream client
+POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", 100))
+KEEPALIVE_POOL_SIZE = int(os.getenv("UPSTREAM_KEEPALIVE_POOL_SIZE", 20))
+KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", 30))
+CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", 20))
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def make_async_client(base_url="", headers=None, read_timeout=READ_TIMEOUT, pool_size=POOL_SIZE):
+    """Create a pooled keep-alive ``httpx.AsyncClient``.
+
+    HTTP/2 is negotiated when the ``h2`` package is installed; otherwise the
+    client falls back to HTTP/1.1 keep-alive.
+    """
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        http2=HTTP2_AVAILABLE,
+        timeout=httpx.Timeout(read_timeout, connect=CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=min(KEEPALIVE_POOL_SIZE, pool_size),
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        )
+    )
+
+
+def request_timeout(read_timeout=READ_TIMEOUT):
+    """Per-call ``httpx`` timeout that ends no later than the current request's deadline."""
+    budget = remaining()
+    if budget is None:
+        return httpx.USE_CLIENT_DEFAULT
+    return httpx.Timeout(min(read_timeout, budget), connect=min(CONNECT_TIMEOUT, budget))
+
+
+def make_session(headers=None, pool_size=POOL_SIZE):
+    """Create a pooled keep-alive ``requests.Session`` for synchronous callers."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
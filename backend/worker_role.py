@@ -0,0 +1,35 @@
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, where we only run a single process
+    fcntl = None
+
+BACKGROUND_JOBS_LOCK = os.getenv(
+    "BACKGROUND_JOBS_LOCK", os.path.join(tempfile.gettempdir(), "aegis-background-jobs.lock")
+)
+
+_lock_file = None
+
+
+def runs_background_jobs(path=BACKGROUND_JOBS_LOCK):
+    """Whether this process should run the background refresh jobs.
+
+    Under gunicorn every worker imports the app, and running the prefetcher
+    and portfolio job in each of them would multiply upstream load. The
+    first worker to take an exclusive lock on ``path`` runs them; the lock
+    is released when that process exits, so its replacement picks them up.
+    Always true when file locking is unavailable.
+    """
+    global _lock_file
+    if _lock_file is not None or fcntl is None:
+        return True
+    lock_file = open(path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _lock_file = lock_file
+    return True